@@ -11,21 +11,21 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from datetime import timedelta
 import os
 from dotenv import load_dotenv
 import dj_database_url
-import cloudinary
-import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
 
 load_dotenv()
 
-cloudinary.config( 
-    cloud_name = os.getenv('CLOUD_NAME'), 
-    api_key = os.getenv('CLOUDINARY_API_KEY'), 
-    api_secret = os.getenv('CLOUD_API_SECRET'), # Click 'View API Keys' above to copy your API secret
-    secure=True
-)
+# Read by the cloudinary package itself when it is first imported (during app
+# loading), so settings no longer pull in the SDK and its HTTP stack
+CLOUDINARY = {
+    'cloud_name': os.getenv('CLOUD_NAME'),
+    'api_key': os.getenv('CLOUDINARY_API_KEY'),
+    'api_secret': os.getenv('CLOUD_API_SECRET'), # Click 'View API Keys' above to copy your API secret
+    'secure': True,
+}
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -63,14 +63,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'events.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'events.staticfiles.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'events.replicas.ReplicaRoutingMiddleware',
+    'events.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'events.querystats.QueryStatsMiddleware',
 ]
 
 ROOT_URLCONF = 'event_platform.urls'
@@ -91,15 +95,75 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'event_platform.wsgi.application'
+ASGI_APPLICATION = 'event_platform.asgi.application'
+
+# Serve the catalog pages (event list/detail) and GET on the event and
+# ticket list APIs from async views. event_platform.asgi turns this on;
+# leave it off under sync gunicorn (ASGI is opt-in, see ReadMe).
+ASYNC_CATALOG_VIEWS = os.getenv('ASYNC_CATALOG_VIEWS', '0') == '1'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Persistent connections, checked before reuse
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+
 DATABASES = {
-    'default': dj_database_url.config(default=os.getenv('DJ_DATABASE_URL'))
+    'default': dj_database_url.config(
+        default=os.getenv('DJ_DATABASE_URL'), conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True,
+    )
 }
 
+# Read replicas: REPLICA_DATABASE_URLS is a comma-separated list of URLs, added
+# as replica1, replica2, ... and used by events.replicas.ReplicaRouter for the
+# views in REPLICA_READ_VIEWS
+REPLICA_DATABASES = []
+for n, url in enumerate(filter(None, os.getenv('REPLICA_DATABASE_URLS', '').split(',')), start=1):
+    DATABASES[f'replica{n}'] = dj_database_url.parse(
+        url.strip(), conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True,
+    )
+    DATABASES[f'replica{n}']['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(f'replica{n}')
+
+DATABASE_ROUTERS = ['events.replicas.ReplicaRouter']
+REPLICA_READ_VIEWS = {
+    'Home', 'event-list', 'event-detail', 'ticket-list', 'ticket-detail', 'venue-list', 'venue-detail',
+    'api-availability', 'organizer-dashboard',
+}
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_INTERVAL = 10
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+# Writers are also pinned by user and credential in this cache. Unless it is
+# shared (REDIS_URL), requests sending an Authorization header always read
+# from the primary
+REPLICA_PIN_CACHE_ALIAS = 'default'
+REPLICA_PIN_SHARED = os.getenv('REPLICA_PIN_SHARED', '1' if os.getenv('REDIS_URL') else '0') == '1'
+
+# Cache (shared across workers when REDIS_URL is set; per-process otherwise)
+# https://docs.djangoproject.com/en/5.2/ref/settings/#caches
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Rendered event fragments and cached Event objects (events/fragments.py),
+# versioned per event and invalidated by signals. Invalidation only reaches
+# workers sharing the cache, so it is off unless REDIS_URL is set
+FRAGMENT_CACHE_ENABLED = os.getenv('FRAGMENT_CACHE_ENABLED', '1' if os.getenv('REDIS_URL') else '0') == '1'
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_SECONDS = int(os.getenv('FRAGMENT_CACHE_SECONDS', '300'))
+EVENT_SIDEBAR_SIZE = 50
 
 
 # Password validation
@@ -138,6 +202,29 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Media (receipts, locally stored event images)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', str(BASE_DIR))
+
+# Event image ingestion: uploads are staged in EVENT_IMAGE_STAGING_STORAGE and
+# turned into variants by `python manage.py process_event_images`, which
+# publishes them to EVENT_IMAGE_STORAGE (Cloudinary when CLOUD_NAME is set).
+# The default staging storage is a directory the web and worker processes must
+# share (EVENT_IMAGE_STAGING_ROOT, e.g. a mounted volume). Claims older than
+# EVENT_IMAGE_CLAIM_TIMEOUT are taken over by another worker
+EVENT_IMAGE_STORAGE = os.getenv(
+    'EVENT_IMAGE_STORAGE',
+    'events.storage.CloudinaryImageStorage' if os.getenv('CLOUD_NAME') else 'events.storage.LocalImageStorage'
+)
+EVENT_IMAGE_STAGING_STORAGE = os.getenv('EVENT_IMAGE_STAGING_STORAGE', 'events.storage.StagingStorage')
+EVENT_IMAGE_STAGING_ROOT = os.getenv('EVENT_IMAGE_STAGING_ROOT', os.path.join(MEDIA_ROOT, 'event_image_staging'))
+EVENT_IMAGE_CLAIM_TIMEOUT = timedelta(minutes=int(os.getenv('EVENT_IMAGE_CLAIM_TIMEOUT_MINUTES', 10)))
+EVENT_IMAGE_VARIANTS = {
+    'thumbnail': (320, 180),
+    'card': (800, 450),
+}
+EVENT_IMAGE_QUALITY = 85
+
 
 
 # Default primary key field type
@@ -150,10 +237,132 @@ LOGIN_REDIRECT_URL='/'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'events.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
-AUTH_USER_MODEL = 'events.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'events.User'
+
+# API tokens expire after AUTH_TOKEN_TTL; token -> user lookups are cached for
+# AUTH_TOKEN_CACHE_TIMEOUT seconds and dropped on logout, password change,
+# deactivation or a change of role
+AUTH_TOKEN_TTL = timedelta(days=int(os.getenv('AUTH_TOKEN_TTL_DAYS', 7)))
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+
+# Sharded inventory counters for hot ticket tiers (enable per ticket in the admin)
+TICKET_SHARD_COUNT = int(os.getenv('TICKET_SHARD_COUNT', 8))
+# Rebalance when a shard drops below 1/N of its fair share
+TICKET_SHARD_REBALANCE_RATIO = 4
+
+# Live availability (SSE). Pages only stream under ASGI with a shared broker
+# (events.pubsub.CacheBroker plus a shared cache); otherwise they poll.
+PUBSUB_BROKER = os.getenv('PUBSUB_BROKER', 'events.pubsub.LocalBroker')
+PUBSUB_CACHE_ALIAS = 'default'
+PUBSUB_POLL_INTERVAL = 0.5
+PUBSUB_MESSAGE_TTL = 3600
+# How long a viewed channel stays marked after its poller stops refreshing it
+PUBSUB_SUBSCRIBER_TTL = 30
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = int(os.getenv('SSE_MAX_STREAM_SECONDS', 300))
+SSE_RETRY_MS = 3000
+
+# Bookings per page in each profile history section (upcoming / past)
+BOOKING_HISTORY_PAGE_SIZE = 10
+
+# Batched availability lookups (/api/availability/)
+AVAILABILITY_MAX_IDS = 500
+AVAILABILITY_CACHE_SECONDS = 5
+
+# Token-bucket rate limits: `burst` requests at once, refilled at `rate` per
+# `per` seconds, per signed-in user (or per IP for anonymous requests).
+# Anonymous clients are told apart by X-Forwarded-For: RATE_LIMIT_PROXY_HOPS is
+# the number of proxies in front of the app (1 for the Heroku router; 0 to use
+# REMOTE_ADDR when clients connect directly)
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_CACHE_ALIAS = 'default'
+RATE_LIMIT_PROXY_HOPS = int(os.getenv('RATE_LIMIT_PROXY_HOPS', 1))
+RATE_LIMITS = {
+    'booking': {'rate': 10, 'per': 60, 'burst': 5},
+    'auth': {'rate': 5, 'per': 60, 'burst': 10},
+}
+
+# Signed ticket QR codes and door check-in. The database decides each scan;
+# the cache only remembers recent check-ins and revocations as hints.
+TICKET_SIGNING_KEY = os.getenv('TICKET_SIGNING_KEY', '')
+TICKET_REVOCATION_TTL = 60 * 60 * 24 * 90
+CHECKIN_CACHE_ALIAS = 'default'
+CHECKIN_MARKER_TTL = 60 * 60 * 24 * 7
+CHECKIN_SYNC_MAX_SCANS = 1000
+
+# Bookings of events that ended more than ARCHIVE_AFTER_DAYS ago are moved to
+# the archive tables by `python manage.py archive_bookings`
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+ARCHIVE_BATCH_SIZE = 1000
+
+# Per-request query count / DB time (events/querystats.py). Budgets by URL name
+# override @query_budget; e.g. {'event-list': {'queries': 10, 'db_ms': 50}}
+QUERY_STATS_HEADER = os.getenv('QUERY_STATS_HEADER', '1' if DEBUG else '0') == '1'
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', '0') == '1'
+QUERY_BUDGETS = {}
+
+# Payment gateways (events/payments.py). PAYMENT_PROVIDERS maps provider names,
+# as used in the webhook URL /api/api/payments/webhook/<name>/, to classes;
+# checkout methods not listed in PAYMENT_METHOD_PROVIDERS use the default.
+# The simulated gateway confirms each charge PAYMENT_SIMULATOR_DELAY seconds
+# later and declines a PAYMENT_SIMULATOR_FAILURE_RATE share of them.
+PAYMENT_PROVIDERS = {
+    'simulated': 'events.payments.SimulatedGateway',
+}
+PAYMENT_METHOD_PROVIDERS = {}
+PAYMENT_DEFAULT_PROVIDER = os.getenv('PAYMENT_DEFAULT_PROVIDER', 'simulated')
+PAYMENT_WEBHOOK_SECRET = os.getenv('PAYMENT_WEBHOOK_SECRET', '')
+PAYMENT_SIMULATOR_DELAY = float(os.getenv('PAYMENT_SIMULATOR_DELAY', '2'))
+PAYMENT_SIMULATOR_FAILURE_RATE = float(os.getenv('PAYMENT_SIMULATOR_FAILURE_RATE', '0'))
+# Settlement reports are matched RECONCILE_BATCH_SIZE lines at a time by
+# `python manage.py reconcile_payments`. `python manage.py expire_payments`
+# fails charges still pending after PAYMENT_STUCK_AFTER_MINUTES, and cancels
+# waitlist bookings not paid within WAITLIST_PAYMENT_WINDOW_MINUTES of
+# promotion so their seats go back to the waitlist
+RECONCILE_BATCH_SIZE = 1000
+PAYMENT_STUCK_AFTER_MINUTES = int(os.getenv('PAYMENT_STUCK_AFTER_MINUTES', 30))
+WAITLIST_PAYMENT_WINDOW_MINUTES = int(os.getenv('WAITLIST_PAYMENT_WINDOW_MINUTES', 24 * 60))
+
+# Prometheus metrics at /metrics (events/metrics.py). Scrapers must send
+# "Authorization: Bearer <METRICS_TOKEN>" (staff sessions also get in); with
+# no token set only staff can read them. Queue depths are counted at most
+# once per METRICS_QUEUE_DEPTH_TTL seconds
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_CACHE_ALIAS = 'default'
+METRICS_QUEUE_DEPTH_TTL = int(os.getenv('METRICS_QUEUE_DEPTH_TTL', 15))
+
+# Staff can profile one request with ?_profile=1 or an X-Profile header;
+# results are stored as RequestProfile rows in the admin
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '1') == '1'
+PROFILE_QUERY_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_EXPLAIN_THRESHOLD_MS = float(os.getenv('PROFILE_EXPLAIN_THRESHOLD_MS', '20'))
+PROFILE_STATS_LINES = 80
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'events.querystats': {
+            'handlers': ['console'],
+            'level': os.getenv('QUERY_STATS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+# Idempotency-Key replay window (purge with `python manage.py purge_idempotency_keys`).
+# A key still being processed is released after IDEMPOTENCY_CLAIM_LEASE, so
+# one whose request crashed can be retried; a running request renews it
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_CLAIM_LEASE = timedelta(seconds=int(os.getenv('IDEMPOTENCY_CLAIM_LEASE_SECONDS', 60)))
\ No newline at end of file
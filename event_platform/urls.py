@@ -14,11 +14,29 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from django.views.static import serve
+from events.metrics import metrics_view
 from events.views import homepage_view
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('events.urls')), 
     path('', homepage_view, name='home'),
 ]
+
+# Locally stored event images (LocalImageStorage). static() only serves them
+# under DEBUG, so they get their own route; Cloudinary URLs never reach Django.
+if settings.EVENT_IMAGE_STORAGE == 'events.storage.LocalImageStorage':
+    urlpatterns += [
+        re_path(
+            rf"^{settings.MEDIA_URL.strip('/')}/event_images/(?P<path>.+)$", serve,
+            {'document_root': os.path.join(settings.MEDIA_ROOT, 'event_images')},
+        ),
+    ]
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,10 +1,61 @@
 from django.contrib import admin
-from .models import User, Venue, Category, Event, Ticket, Booking, Payment
+from django.utils.html import format_html, format_html_join
+from .models import (
+    User, Venue, Category, Event, Ticket, Booking, Payment, WaitlistEntry, IdempotencyKey, CheckIn,
+    ArchivedBooking, ArchivedPayment, RequestProfile,
+)
+from .inventory import enable_sharding, disable_sharding
 # Register your models here.
 admin.site.register(User)
 admin.site.register(Venue)
 admin.site.register(Category)
 admin.site.register(Event)
-admin.site.register(Ticket)
 admin.site.register(Booking)
-admin.site.register(Payment)
\ No newline at end of file
+admin.site.register(Payment)
+admin.site.register(WaitlistEntry)
+admin.site.register(IdempotencyKey)
+admin.site.register(CheckIn)
+admin.site.register(ArchivedBooking)
+admin.site.register(ArchivedPayment)
+
+
+@admin.register(Ticket)
+class TicketAdmin(admin.ModelAdmin):
+    list_display = ['name', 'event', 'type', 'price', 'quantity', 'sold_quantity', 'shard_count']
+    actions = ['enable_sharded_inventory', 'disable_sharded_inventory']
+
+    @admin.action(description="Enable sharded inventory counters")
+    def enable_sharded_inventory(self, request, queryset):
+        for ticket in queryset:
+            enable_sharding(ticket)
+
+    @admin.action(description="Disable sharded inventory counters")
+    def disable_sharded_inventory(self, request, queryset):
+        for ticket in queryset:
+            disable_sharding(ticket)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'db_ms', 'user']
+    list_filter = ['method', 'status_code']
+    search_fields = ['path', 'view_name']
+    fields = [
+        'created_at', 'user', 'method', 'path', 'view_name', 'status_code',
+        'duration_ms', 'query_count', 'db_ms', 'profile', 'sql',
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="cProfile (cumulative)")
+    def profile(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto">{}</pre>', obj.stats)
+
+    @admin.display(description="SQL (slowest first)")
+    def sql(self, obj):
+        return format_html_join('', '<pre style="white-space: pre-wrap">{:.1f}ms  {}\n{}</pre>', (
+            (query['ms'], query['sql'], query.get('explain', ''))
+            for query in sorted(obj.queries, key=lambda query: -query['ms'])
+        ))
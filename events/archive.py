@@ -0,0 +1,110 @@
+# Hot/cold split for bookings. Once an event has been over for
+# ARCHIVE_AFTER_DAYS its bookings and payments are only read for history and
+# accounting, so they are copied to the archive tables (same ids) and removed
+# from Booking/Payment, a chunk per transaction. Reads that may need old rows
+# (profile history, receipts) go through the helpers below.
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedBooking, ArchivedPayment, Booking, CheckIn, Payment
+
+
+# Bookings whose money is still moving (a pending charge, or a cancelled
+# booking whose payment isn't refunded yet) stay in the hot tables, where
+# settle_payment() and reconciliation can still update them
+UNSETTLED = (
+    Q(payment_status='pending')
+    | Q(payment__status='pending')
+    | Q(status='cancelled', payment__status='successful')
+)
+
+
+def archivable_bookings(days=None, now=None):
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return Booking.objects.filter(event__end_time__lt=cutoff).exclude(UNSETTLED)
+
+
+def _archive_chunk(queryset, batch_size):
+    with transaction.atomic():
+        bookings = list(
+            queryset.select_for_update(skip_locked=True, of=('self',))
+            .select_related('payment')
+            .order_by('pk')[:batch_size]
+        )
+        if not bookings:
+            return 0
+        booking_ids = [booking.pk for booking in bookings]
+        checked_in = dict(CheckIn.objects.filter(booking_id__in=booking_ids).values_list('booking_id', 'scanned_at'))
+
+        ArchivedBooking.objects.bulk_create([
+            ArchivedBooking(
+                id=booking.pk,
+                user_id=booking.user_id,
+                ticket_id=booking.ticket_id,
+                event_id=booking.event_id,
+                quantity=booking.quantity,
+                booked_at=booking.booked_at,
+                payment_status=booking.payment_status,
+                status=booking.status,
+                cancelled_at=booking.cancelled_at,
+                order_ref=booking.order_ref,
+                receipt_file=booking.receipt_file.name or None,
+                checked_in_at=checked_in.get(booking.pk),
+            )
+            for booking in bookings
+        ])
+        ArchivedPayment.objects.bulk_create([
+            ArchivedPayment(
+                id=payment.pk,
+                booking_id=payment.booking_id,
+                amount=payment.amount,
+                method=payment.method,
+                transaction_id=payment.transaction_id,
+                status=payment.status,
+                created_at=payment.created_at,
+            )
+            for payment in (getattr(booking, 'payment', None) for booking in bookings)
+            if payment is not None
+        ])
+
+        Payment.objects.filter(booking_id__in=booking_ids).delete()
+        CheckIn.objects.filter(booking_id__in=booking_ids).delete()
+        Booking.objects.filter(pk__in=booking_ids).delete()
+    return len(bookings)
+
+
+def archive_ended_bookings(days=None, batch_size=None, max_batches=None):
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    queryset = archivable_bookings(days)
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = _archive_chunk(queryset, batch_size)
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+    return archived
+
+
+# -------------------- READS --------------------
+
+# A user's booking by id, from the hot table or the archive
+def find_user_booking(user, booking_id):
+    booking = Booking.objects.filter(pk=booking_id, user=user).select_related('ticket__event').first()
+    if booking is None:
+        booking = ArchivedBooking.objects.filter(pk=booking_id, user=user).select_related('ticket', 'event').first()
+    return booking
+
+
+def find_order_bookings(user, order_ref):
+    bookings = list(
+        Booking.objects.filter(order_ref=order_ref, user=user).select_related('ticket__event', 'payment')
+    )
+    return bookings or list(
+        ArchivedBooking.objects.filter(order_ref=order_ref, user=user).select_related('ticket', 'event', 'payment')
+    )
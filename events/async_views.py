@@ -0,0 +1,179 @@
+# Async (ASGI) versions of the read-heavy catalog pages and of GET on the
+# event and ticket list APIs. Enabled with ASYNC_CATALOG_VIEWS (on by default
+# under event_platform.asgi). Everything a template or serializer touches is
+# loaded up front with select_related/prefetch_related, because lazy ORM
+# access is not allowed inside an async view.
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .fragments import CATALOG, event_cards, get_event, get_versions
+from .inventory import availability_channel, with_availability
+from .models import Event, Ticket
+from .pubsub import get_broker, live_availability_streams
+from .views import (
+    EventViewSet, TicketViewSet, event_info_fragment, event_sidebar_fragment, latest_availability, sse_message,
+    sse_response,
+)
+
+
+async def _first_tickets(event_ids):
+    tickets = {}
+    async for ticket in with_availability(Ticket.objects.filter(event_id__in=event_ids)).order_by('event_id', 'id'):
+        tickets.setdefault(ticket.event_id, ticket)
+    return tickets
+
+
+async def event_list_view(request):
+    request.user = await request.auser()
+    search = request.GET.get('q', '')
+    filter_type = request.GET.get('status')
+    now = timezone.now()
+
+    events = Event.objects.select_related('venue')
+
+    if search:
+        events = events.filter(
+            Q(title__icontains=search) |
+            Q(description__icontains=search) |
+            Q(venue__name__icontains=search)
+        )
+
+    if filter_type == 'upcoming':
+        events = events.filter(start_time__gt=now)
+    elif filter_type == 'ongoing':
+        events = events.filter(start_time__lte=now, end_time__gte=now)
+    elif filter_type == 'ended':
+        events = events.filter(end_time__lt=now)
+
+    events = events.order_by('-start_time')
+    paginator = Paginator(events, 6)
+    paginator.count = await events.acount()
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj.object_list = [event async for event in page_obj.object_list]
+
+    tickets = await _first_tickets([event.id for event in page_obj.object_list])
+    event_data = []
+    for event in page_obj.object_list:
+        ticket = tickets.get(event.id)
+        event_data.append({
+            'event': event,
+            'status': event.get_status(),
+            'ticket': ticket,
+            'total_booked': ticket.tickets_sold if ticket else 0,
+            'remaining': ticket.remaining_quantity if ticket else 0,
+        })
+    await sync_to_async(event_cards)(event_data)
+
+    return render(request, 'events/event_list.html', {
+        'search': search,
+        'filter_type': filter_type,
+        'page_obj': page_obj,
+        'event_data': event_data
+    })
+
+
+async def event_detail_view(request, pk):
+    request.user = await request.auser()
+    search = request.GET.get('search', '')
+    versions = await sync_to_async(get_versions)([f"event:{pk}", CATALOG])
+    event = await sync_to_async(get_event)(pk, versions[f"event:{pk}"])
+
+    ticket = (await _first_tickets([event.id])).get(event.id)
+    status = event.get_status()
+
+    return render(request, 'events/event_detail.html', {
+        'event': event,
+        'status': status,
+        'ticket': ticket,
+        'remaining': ticket.remaining_quantity if ticket else 0,
+        'allow_purchase': status == "Not started",
+        'event_info': await sync_to_async(event_info_fragment)(event, status, versions[f"event:{pk}"]),
+        'sidebar': await sync_to_async(event_sidebar_fragment)(pk, search, versions[CATALOG]),
+        'search': search,
+        'availability_stream': live_availability_streams(),
+    })
+
+
+async def event_availability_stream(request, event_id):
+    if not live_availability_streams():
+        return HttpResponse(status=204)
+    if not await Event.objects.filter(pk=event_id).aexists():
+        raise Http404("Event not found")
+    broker = get_broker()
+    channel = availability_channel(event_id)
+    last_seen = request.headers.get('Last-Event-ID', '')
+
+    async def stream():
+        await sync_to_async(broker.subscribe)(channel)
+        try:
+            version, payload = await sync_to_async(latest_availability)(broker, event_id)
+            yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+            if str(version) != last_seen:
+                yield sse_message(version, payload)
+
+            deadline = time.monotonic() + settings.SSE_MAX_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                message = await broker.await_change(channel, version, settings.SSE_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                else:
+                    version = message[0]
+                    yield sse_message(*message)
+        finally:
+            broker.unsubscribe(channel)
+
+    return sse_response(stream())
+
+
+# -------------------- API --------------------
+# The viewset still authenticates, checks permissions and throttles and
+# negotiates the format (APIView.initial, one trip to a thread); only the
+# list query runs on the async ORM. Writes and browsable-API requests go to
+# the viewset itself.
+
+def _plain_response(response):
+    # Rendered here; the handler would hop to a thread to render a DRF Response
+    response.render()
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    return plain
+
+
+def async_list_api(viewset):
+    sync_view = sync_to_async(viewset.as_view({'get': 'list', 'post': 'create'}))
+
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET' or 'text/html' in request.headers.get('Accept', ''):
+            return await sync_view(request, *args, **kwargs)
+
+        api_view = viewset(action_map={'get': 'list'})
+        api_view.args, api_view.kwargs = args, kwargs
+        drf_request = api_view.initialize_request(request, *args, **kwargs)
+        api_view.request = drf_request
+        api_view.headers = api_view.default_response_headers
+        try:
+            await sync_to_async(api_view.initial)(drf_request, *args, **kwargs)
+            queryset = api_view.filter_queryset(api_view.get_queryset())
+            items = [item async for item in queryset]
+            response = Response(api_view.get_serializer(items, many=True).data)
+        except Exception as exc:
+            response = api_view.handle_exception(exc)
+        return _plain_response(api_view.finalize_response(drf_request, response, *args, **kwargs))
+
+    # Like DRF's own views: exempt from CSRF, and found by the query budget check
+    view.csrf_exempt = True
+    view.cls = viewset
+    return view
+
+
+event_list_api = async_list_api(EventViewSet)
+ticket_list_api = async_list_api(TicketViewSet)
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .metrics import record_cache
+
+
+def _cache():
+    return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+
+def token_cache_key(key):
+    return f"auth:token:{key}"
+
+
+def token_expires_at(token):
+    return token.created + settings.AUTH_TOKEN_TTL
+
+
+def invalidate_token(key):
+    _cache().delete(token_cache_key(key))
+
+
+def invalidate_user_tokens(user):
+    _cache().delete_many([token_cache_key(key) for key in Token.objects.filter(user=user).values_list('key', flat=True)])
+
+
+# Logout / password change: drop the token from the DB and the cache
+def revoke_user_tokens(user):
+    keys = list(Token.objects.filter(user=user).values_list('key', flat=True))
+    Token.objects.filter(key__in=keys).delete()
+    _cache().delete_many([token_cache_key(key) for key in keys])
+
+
+# Replace the user's token with a fresh one (new key, new expiry)
+def rotate_token(user):
+    with transaction.atomic():
+        revoke_user_tokens(user)
+        return Token.objects.create(user=user)
+
+
+def get_or_rotate_token(user):
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and token_expires_at(token) <= timezone.now():
+        token = rotate_token(user)
+    return token
+
+
+# Token authentication with a short-lived cache in front of the Token + User
+# lookup, so most authenticated API calls skip that query entirely.
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache = _cache()
+        cache_key = token_cache_key(key)
+        cached = cache.get(cache_key)
+        record_cache('auth_token', cached is not None)
+
+        if cached is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user, created = token.user, token.created
+            cache.set(cache_key, (user, created), timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        else:
+            user, created = cached
+            token = Token(key=key, user=user, created=created)
+
+        if token_expires_at(token) <= timezone.now():
+            Token.objects.filter(key=key).delete()
+            invalidate_token(key)
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, token)
@@ -0,0 +1,150 @@
+# Door check-in. A scan is decided by the database: the booking must still be
+# active and paid, and CheckIn.booking is unique, so the first insert wins
+# however many workers or devices scan the same ticket. The cache only holds
+# hints (already checked in, revoked) that let repeat scans be turned away
+# without a query; it is never trusted to admit anyone, so a per-process or
+# evicted cache can't let a ticket in twice. Every admitted scan is written
+# before the scanner gets its answer.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Booking, CheckIn
+from .ticket_tokens import InvalidTicket, is_revoked, revoke_ticket, verify_ticket
+
+ADMITTED = 'admitted'
+ALREADY_CHECKED_IN = 'already_checked_in'
+REVOKED = 'revoked'
+WRONG_EVENT = 'wrong_event'
+INVALID = 'invalid'
+
+
+def checked_in_key(booking_id):
+    return f"checked-in:{booking_id}"
+
+
+def _cache():
+    return caches[settings.CHECKIN_CACHE_ALIAS]
+
+
+# Signature, event and cache hints; returns (claim, result) where a result
+# means the scan is already decided
+def _precheck(token, event_id):
+    try:
+        claim = verify_ticket(token)
+    except InvalidTicket as exc:
+        return None, {'status': INVALID, 'detail': str(exc)}
+
+    result = {'booking': claim.booking_id, 'event': claim.event_id, 'quantity': claim.quantity}
+    if claim.event_id != event_id:
+        return claim, dict(result, status=WRONG_EVENT)
+    if is_revoked(claim.booking_id):
+        return claim, dict(result, status=REVOKED)
+    first_scanned_at = _cache().get(checked_in_key(claim.booking_id))
+    if first_scanned_at:
+        return claim, dict(result, status=ALREADY_CHECKED_IN, first_scanned_at=first_scanned_at)
+    return claim, None
+
+
+def _admissible(status, payment_status):
+    return status == 'active' and payment_status == 'paid'
+
+
+def _remember(booking_id, scanned_at):
+    _cache().set(checked_in_key(booking_id), scanned_at.isoformat(), timeout=settings.CHECKIN_MARKER_TTL)
+
+
+def check_in(token, event_id, device='', scanned_at=None, source='online'):
+    claim, decided = _precheck(token, event_id)
+    if decided:
+        return decided
+
+    result = {'booking': claim.booking_id, 'event': claim.event_id, 'quantity': claim.quantity}
+    booking = Booking.objects.filter(pk=claim.booking_id, event_id=event_id).values('status', 'payment_status').first()
+    if booking is None or not _admissible(booking['status'], booking['payment_status']):
+        if booking is not None and booking['status'] == 'cancelled':
+            revoke_ticket(claim.booking_id)
+        return dict(result, status=REVOKED)
+
+    scanned_at = scanned_at or timezone.now()
+    try:
+        with transaction.atomic():
+            CheckIn.objects.create(
+                booking_id=claim.booking_id,
+                event_id=claim.event_id,
+                quantity=claim.quantity,
+                scanned_at=scanned_at,
+                device=device[:64],
+                source=source,
+            )
+    except IntegrityError:
+        first = CheckIn.objects.filter(booking_id=claim.booking_id).values_list('scanned_at', flat=True).first()
+        if first is None:
+            # The booking was deleted between the lookup and the insert
+            return dict(result, status=REVOKED)
+        _remember(claim.booking_id, first)
+        return dict(result, status=ALREADY_CHECKED_IN, first_scanned_at=first.isoformat())
+
+    _remember(claim.booking_id, scanned_at)
+    return dict(result, status=ADMITTED)
+
+
+# Offline scanners upload their queue here; results come back in scan order.
+# The whole upload costs a handful of queries: one booking lookup, one read
+# of earlier check-ins, one bulk insert and one read-back to learn which
+# inserts won against scans written concurrently.
+def sync_scans(scans, event_id, device=''):
+    results = [None] * len(scans)
+    claims = {}
+    for position, scan in enumerate(scans):
+        claim, decided = _precheck(scan['token'], event_id)
+        if decided:
+            results[position] = decided
+        else:
+            claims[position] = claim
+
+    booking_ids = {claim.booking_id for claim in claims.values()}
+    bookings = {
+        pk: _admissible(status, payment_status)
+        for pk, status, payment_status in Booking.objects.filter(pk__in=booking_ids, event_id=event_id)
+        .values_list('pk', 'status', 'payment_status')
+    }
+    earlier = dict(CheckIn.objects.filter(booking_id__in=booking_ids).values_list('booking_id', 'scanned_at'))
+
+    pending = {}
+    for position, claim in claims.items():
+        result = {'booking': claim.booking_id, 'event': claim.event_id, 'quantity': claim.quantity}
+        if not bookings.get(claim.booking_id):
+            results[position] = dict(result, status=REVOKED)
+        elif claim.booking_id in earlier or claim.booking_id in pending:
+            results[position] = dict(result, status=ALREADY_CHECKED_IN)
+        else:
+            scan = scans[position]
+            pending[claim.booking_id] = (position, CheckIn(
+                booking_id=claim.booking_id,
+                event_id=claim.event_id,
+                quantity=claim.quantity,
+                scanned_at=scan.get('scanned_at') or timezone.now(),
+                device=(scan.get('device') or device)[:64],
+                source='offline',
+            ))
+            results[position] = dict(result, status=ADMITTED)
+
+    if pending:
+        CheckIn.objects.bulk_create([check_in for _, check_in in pending.values()], ignore_conflicts=True)
+        written = dict(CheckIn.objects.filter(booking_id__in=list(pending)).values_list('booking_id', 'scanned_at'))
+        for booking_id, (position, check_in) in pending.items():
+            if written.get(booking_id) != check_in.scanned_at:
+                results[position]['status'] = ALREADY_CHECKED_IN
+            earlier[booking_id] = written.get(booking_id, check_in.scanned_at)
+
+    for position, result in enumerate(results):
+        if result['status'] == ALREADY_CHECKED_IN and 'first_scanned_at' not in result:
+            first = earlier.get(result['booking'])
+            if first:
+                result['first_scanned_at'] = first.isoformat()
+                _remember(result['booking'], first)
+        elif result['status'] == ADMITTED:
+            _remember(result['booking'], earlier[result['booking']])
+    return results
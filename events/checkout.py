@@ -0,0 +1,113 @@
+import uuid
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+from django.utils import timezone
+
+from .inventory import AlreadyBooked, InsufficientInventory, ensure_not_booked, reserve, schedule_availability_publish
+from .metrics import record_bookings, record_payments
+from .models import Booking, Payment, Ticket
+from .payments import start_payments
+
+MAX_CART_LINES = 20
+
+
+class CheckoutError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+# Merge duplicate ticket ids and drop empty lines
+def normalize_lines(lines):
+    merged = OrderedDict()
+    for ticket_id, quantity in lines:
+        ticket_id, quantity = int(ticket_id), int(quantity)
+        if quantity < 0:
+            raise CheckoutError([f"Invalid quantity for ticket {ticket_id}."])
+        if quantity:
+            merged[ticket_id] = merged.get(ticket_id, 0) + quantity
+    if not merged:
+        raise CheckoutError(["Your cart is empty."])
+    if len(merged) > MAX_CART_LINES:
+        raise CheckoutError([f"A cart can hold at most {MAX_CART_LINES} ticket types."])
+    return merged
+
+
+# Book several (ticket_id, quantity) lines as one order. Availability for every
+# line is checked against one locked read of the tickets, the counters are
+# bumped with a single UPDATE, and bookings/payments go in with bulk_create.
+# Everything starts pending; the receipt is issued once the provider has
+# confirmed the order's payments (events/payments.py).
+def checkout_cart(user, lines, method='mpesa'):
+    lines = normalize_lines(lines)
+    order_ref = uuid.uuid4()
+    now = timezone.now()
+
+    with transaction.atomic():
+        # The user's lock comes before the ticket locks, as in the other booking paths
+        try:
+            ensure_not_booked(user, set(Ticket.objects.filter(pk__in=list(lines)).values_list('event_id', flat=True)))
+        except AlreadyBooked:
+            raise CheckoutError(["You have already booked one of these events."])
+
+        tickets = (
+            Ticket.objects.select_for_update(of=('self',))
+            .filter(event__deleted_at__isnull=True)
+            .select_related('event')
+            .in_bulk(list(lines))
+        )
+
+        errors = []
+        for ticket_id, quantity in lines.items():
+            ticket = tickets.get(ticket_id)
+            if ticket is None:
+                errors.append(f"Ticket {ticket_id} does not exist.")
+            elif now >= ticket.event.start_time:
+                errors.append(f"Ticket sales for {ticket.event.title} are closed.")
+            elif quantity > ticket.remaining_quantity:
+                errors.append(f"Only {ticket.remaining_quantity} tickets remaining for {ticket.name}.")
+        if errors:
+            raise CheckoutError(errors)
+
+        single_row = {ticket_id: quantity for ticket_id, quantity in lines.items() if not tickets[ticket_id].is_sharded}
+        if single_row:
+            Ticket.objects.filter(pk__in=list(single_row)).update(sold_quantity=Case(
+                *[When(pk=ticket_id, then=F('sold_quantity') + quantity) for ticket_id, quantity in single_row.items()],
+                default=F('sold_quantity'),
+                output_field=PositiveIntegerField(),
+            ))
+            for event_id in {tickets[ticket_id].event_id for ticket_id in single_row}:
+                schedule_availability_publish(event_id)
+        for ticket_id, quantity in lines.items():
+            if tickets[ticket_id].is_sharded:
+                try:
+                    reserve(tickets[ticket_id], quantity)
+                except InsufficientInventory as exc:
+                    raise CheckoutError([f"Only {exc.remaining} tickets remaining for {exc.ticket.name}."])
+
+        bookings = Booking.objects.bulk_create([
+            Booking(
+                user=user,
+                ticket=tickets[ticket_id],
+                event_id=tickets[ticket_id].event_id,
+                quantity=quantity,
+                order_ref=order_ref,
+            )
+            for ticket_id, quantity in lines.items()
+        ])
+        payments = Payment.objects.bulk_create([
+            Payment(
+                booking=booking,
+                amount=booking.ticket.price * booking.quantity,
+                method=method,
+                transaction_id=str(uuid.uuid4()),
+            )
+            for booking in bookings
+        ])
+        start_payments(payments)
+
+    record_bookings('cart', bookings)
+    record_payments(payments)
+    return order_ref, bookings
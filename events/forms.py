@@ -44,9 +44,13 @@ class RegistrationForm(forms.ModelForm):
 from django.core.exceptions import ValidationError
 
 class EventForm(forms.ModelForm):
+    # Not bound to Event.image: the upload is staged locally and pushed to
+    # storage by the image worker instead of during form.save()
+    image = forms.ImageField(required=False)
+
     class Meta:
         model = Event
-        fields = ['title', 'description', 'category', 'venue', 'start_time', 'end_time', 'image']
+        fields = ['title', 'description', 'category', 'venue', 'start_time', 'end_time']
         widgets = {
             'start_time': forms.DateTimeInput(
                 attrs={
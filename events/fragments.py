@@ -0,0 +1,164 @@
+# Cached event objects and rendered HTML fragments for the catalog pages.
+# Every key embeds a version number kept in the cache itself: one per event
+# (bumped by the Event/Ticket/Venue/Category signals in signals.py) and one
+# for the catalog as a whole (bumped by any Event, Venue or Category change;
+# the detail page sidebar lists other events with their venues). Bumping a version orphans the old entries instead of deleting
+# them, so invalidation is a single incr. Ticket availability and booking
+# counts are never cached; views render them live around the fragments, so
+# bookings don't invalidate anything.
+# A bump only reaches the processes sharing the cache, so caching is off
+# (FRAGMENT_CACHE_ENABLED) unless the cache is shared (REDIS_URL). Entries
+# are filled from the primary: right after a bump a lagging replica could
+# still hold the old rows, which would then be cached under the new version.
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .metrics import record_cache
+from .models import Event
+from .replicas import primary_reads, reading_from_replica
+
+CATALOG = 'catalog'
+
+
+def _cache():
+    return caches[settings.FRAGMENT_CACHE_ALIAS]
+
+
+def _enabled():
+    return settings.FRAGMENT_CACHE_ENABLED
+
+
+def _version_key(scope):
+    return f"fragment-version:{scope}"
+
+
+# Versions never expire. A missing one starts from the clock, so an evicted
+# counter can't come back at a number whose entries are still cached.
+def get_versions(scopes):
+    if not _enabled():
+        return dict.fromkeys(scopes, 0)
+    cache = _cache()
+    keys = {scope: _version_key(scope) for scope in scopes}
+    found = cache.get_many(list(keys.values()))
+    versions = {}
+    for scope, key in keys.items():
+        if key in found:
+            versions[scope] = found[key]
+        else:
+            initial = time.time_ns()
+            versions[scope] = initial if cache.add(key, initial, timeout=None) else cache.get(key, initial)
+    return versions
+
+
+def bump_version(scope):
+    if not _enabled():
+        return
+    cache = _cache()
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        cache.set(_version_key(scope), time.time_ns(), timeout=None)
+
+
+def bump_event(event_id, catalog=False):
+    bump_version(f"event:{event_id}")
+    if catalog:
+        bump_version(CATALOG)
+
+
+def bump_events(event_ids):
+    for event_id in event_ids:
+        bump_version(f"event:{event_id}")
+    if event_ids:
+        bump_version(CATALOG)
+
+
+def event_versions(event_ids):
+    versions = get_versions([f"event:{event_id}" for event_id in event_ids])
+    return {event_id: versions[f"event:{event_id}"] for event_id in event_ids}
+
+
+def _fragment_key(name, version, parts):
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f"fragment:{name}:{version}:{digest}"
+
+
+# The event with its venue and category, or Http404
+def get_event(event_id, version):
+    if not _enabled():
+        return _load_event(event_id)
+    cache = _cache()
+    key = f"event:{event_id}:{version}"
+    event = cache.get(key)
+    record_cache('event', event is not None)
+    if event is None:
+        with primary_reads():
+            event = _load_event(event_id)
+        cache.set(key, event, timeout=settings.FRAGMENT_CACHE_SECONDS)
+    return event
+
+
+def _load_event(event_id):
+    event = Event.objects.select_related('venue', 'category').filter(pk=event_id).first()
+    if event is None:
+        raise Http404("No Event matches the given query.")
+    return event
+
+
+# Render `template` with `context()` unless a copy is cached under the same
+# name, version and vary-on parts
+def cached_fragment(name, version, parts, template, context):
+    if not _enabled():
+        return mark_safe(render_to_string(template, context()))
+    cache = _cache()
+    key = _fragment_key(name, version, parts)
+    html = cache.get(key)
+    record_cache('fragment', html is not None)
+    if html is None:
+        with primary_reads():
+            html = render_to_string(template, context())
+        cache.set(key, html, timeout=settings.FRAGMENT_CACHE_SECONDS)
+    return mark_safe(html)
+
+
+# Cards for one page of the event list, fetched with a single get_many
+def event_cards(event_data):
+    if not event_data:
+        return
+    if not _enabled():
+        for item in event_data:
+            item['card'] = mark_safe(render_to_string('events/_event_card.html', item))
+        return
+    cache = _cache()
+    versions = event_versions([item['event'].pk for item in event_data])
+    keys = [
+        _fragment_key('event-card', versions[item['event'].pk], [item['event'].pk, item['status']])
+        for item in event_data
+    ]
+    found = cache.get_many(keys)
+    for item, key in zip(event_data, keys):
+        record_cache('fragment', key in found)
+
+    # The page's events may come from a replica; cards about to be cached are
+    # rendered from the primary's rows instead
+    stale = [item['event'].pk for item, key in zip(event_data, keys) if key not in found]
+    fresh = {}
+    if stale and reading_from_replica():
+        with primary_reads():
+            fresh = Event.objects.select_related('venue').in_bulk(stale)
+
+    missing = {}
+    for item, key in zip(event_data, keys):
+        html = found.get(key)
+        if html is None:
+            event = fresh.get(item['event'].pk, item['event'])
+            html = missing[key] = render_to_string('events/_event_card.html', dict(item, event=event))
+        item['card'] = mark_safe(html)
+    if missing:
+        cache.set_many(missing, timeout=settings.FRAGMENT_CACHE_SECONDS)
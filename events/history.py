@@ -0,0 +1,74 @@
+# Booking history for the profile pages, split into upcoming and past and
+# paginated by keyset (event start time, booking id) instead of OFFSET, so a
+# page costs the same whether a user has ten bookings or ten thousand.
+# Past pages also read the archive (events/archive.py); archived rows keep
+# their booking ids, so one cursor covers both tables.
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedBooking, Booking
+
+SECTIONS = ('upcoming', 'past')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(booking):
+    raw = f"{booking.event.start_time.isoformat()}|{booking.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        start_time, pk = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+        return datetime.fromisoformat(start_time), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor.")
+
+
+def history_queryset(user, section, now=None, model=Booking):
+    now = now or timezone.now()
+    bookings = model.objects.filter(user=user, event__deleted_at__isnull=True).select_related('ticket', 'event')
+    # Upcoming runs soonest first; past runs most recent first
+    if section == 'upcoming':
+        return bookings.filter(event__end_time__gte=now).order_by('event__start_time', 'id')
+    return bookings.filter(event__end_time__lt=now).order_by('-event__start_time', '-id')
+
+
+# Returns (bookings, next_cursor); next_cursor is None on the last page
+def booking_page(user, section, cursor=None, size=None):
+    if section not in SECTIONS:
+        raise ValueError(f"Unknown history section: {section}")
+    size = size or settings.BOOKING_HISTORY_PAGE_SIZE
+    tables = [Booking] if section == 'upcoming' else [Booking, ArchivedBooking]
+    position = decode_cursor(cursor) if cursor else None
+
+    # One extra row tells us whether there is a next page without a COUNT
+    page = []
+    for model in tables:
+        bookings = history_queryset(user, section, model=model)
+        if position:
+            start_time, pk = position
+            if section == 'upcoming':
+                bookings = bookings.filter(
+                    Q(event__start_time__gt=start_time) |
+                    Q(event__start_time=start_time, id__gt=pk)
+                )
+            else:
+                bookings = bookings.filter(
+                    Q(event__start_time__lt=start_time) |
+                    Q(event__start_time=start_time, id__lt=pk)
+                )
+        page.extend(bookings[:size + 1])
+
+    if len(tables) > 1:
+        page.sort(key=lambda booking: (booking.event.start_time, booking.pk), reverse=section == 'past')
+        page = page[:size + 1]
+    next_cursor = encode_cursor(page[size - 1]) if len(page) > size else None
+    return page[:size], next_cursor
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 255
+
+
+def get_request_key(request):
+    return request.headers.get(HEADER) or request.POST.get(FORM_FIELD) or None
+
+
+def fingerprint(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# Insert the key, or return the existing row if another request got there first.
+# The unique constraint does the locking, so concurrent retries can't both run.
+# A claim only holds for IDEMPOTENCY_CLAIM_LEASE until it is completed, so a
+# worker that dies mid-request doesn't block the key for the whole TTL; a
+# running request keeps renewing it (renewing_lease).
+def claim_key(user, scope, key, request_hash):
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, scope=scope, key=key, request_hash=request_hash,
+                expires_at=now + settings.IDEMPOTENCY_CLAIM_LEASE,
+            )
+            return record, True
+    except IntegrityError:
+        record = IdempotencyKey.objects.get(user=user, scope=scope, key=key)
+        if record.expires_at <= now:
+            # Only if it wasn't renewed or completed meanwhile
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+            return claim_key(user, scope, key, request_hash)
+        return record, False
+
+
+# Push the claim's expiry forward every third of the lease while the block
+# runs, from a thread with its own connection
+@contextmanager
+def renewing_lease(record):
+    lease = settings.IDEMPOTENCY_CLAIM_LEASE
+    stop = threading.Event()
+
+    def renew():
+        try:
+            while not stop.wait(lease.total_seconds() / 3):
+                try:
+                    IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).update(
+                        expires_at=timezone.now() + lease,
+                    )
+                except Exception:
+                    logger.exception("Could not renew idempotency key %s", record)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=renew, name='idempotency-lease', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Store the response, unless a retry took the claim over after its lease ran
+# out (the row was replaced). Returns whether this request still owned it.
+def complete_key(record, status_code, body):
+    record.status_code = status_code
+    record.response_body = body
+    record.expires_at = timezone.now() + settings.IDEMPOTENCY_KEY_TTL
+    return bool(IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).update(
+        status_code=status_code, response_body=body, expires_at=record.expires_at,
+    ))
+
+
+def purge_expired_keys(batch_size=1000):
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+
+# DRF viewset mixin: honours the Idempotency-Key header on create()
+class IdempotentCreateMixin:
+    idempotency_scope = None
+
+    # Throttles run before create(); a retry of a completed request is only a
+    # replay, so it shouldn't spend a rate-limit token
+    def check_throttles(self, request):
+        key = request.headers.get(HEADER)
+        if request.method == 'POST' and key and request.user.is_authenticated and IdempotencyKey.objects.filter(
+            user=request.user, scope=self.idempotency_scope, key=key,
+            status_code__isnull=False, expires_at__gt=timezone.now(),
+        ).exists():
+            return
+        super().check_throttles(request)
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."}, status=400)
+
+        request_hash = fingerprint(request.method, request.path, request.body)
+        record, created = claim_key(request.user, self.idempotency_scope, key, request_hash)
+        if not created:
+            return self._replay(record, request_hash)
+
+        try:
+            with renewing_lease(record):
+                response = super().create(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 400:
+            # Errors aren't cached so the client can fix the request and retry
+            record.delete()
+        elif not complete_key(record, response.status_code, json.loads(json.dumps(response.data, default=str))):
+            return Response({'detail': f"A retry took over this {HEADER} while the request was running."}, status=409)
+        return response
+
+    def _replay(self, record, request_hash):
+        if record.request_hash != request_hash:
+            return Response({'detail': f"{HEADER} was already used with a different request."}, status=422)
+        if record.status_code is None:
+            return Response({'detail': "A request with this key is still being processed."}, status=409)
+        return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+# Marks the redirect a form view returns once its booking is made. Refusals
+# (sold out, already booked, invalid input) redirect too, but aren't stored,
+# so a retry with the same key runs again instead of replaying them.
+def completed(response):
+    response.idempotent_completed = True
+    return response
+
+
+# Decorator for HTML form views that finish with a redirect (book → receipt).
+# Retries with the same key are sent to the original redirect target instead
+# of running the view again; only responses passed through completed() are
+# kept, and the key is released otherwise.
+def idempotent_form(scope):
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = get_request_key(request) if request.method == 'POST' else None
+            if not key or not request.user.is_authenticated or len(key) > MAX_KEY_LENGTH:
+                return view_func(request, *args, **kwargs)
+
+            form_data = sorted(
+                (name, value) for name, value in request.POST.items()
+                if name not in ('csrfmiddlewaretoken', FORM_FIELD)
+            )
+            request_hash = fingerprint(request.method, request.path, form_data)
+            record, created = claim_key(request.user, scope, key, request_hash)
+            if not created:
+                if record.request_hash != request_hash:
+                    return HttpResponse("This form was already submitted with different values.", status=422)
+                if record.status_code is None:
+                    return HttpResponse("This form is still being processed.", status=409)
+                return HttpResponseRedirect(record.response_body['location'])
+
+            try:
+                with renewing_lease(record):
+                    response = view_func(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if isinstance(response, HttpResponseRedirect) and getattr(response, 'idempotent_completed', False):
+                if not complete_key(record, response.status_code, {'location': response.url}):
+                    return HttpResponse("This form was submitted again while it was being processed.", status=409)
+            else:
+                record.delete()
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,113 @@
+import io
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .fragments import bump_event
+from .models import Event
+from .storage import get_image_storage, get_staging_storage
+
+logger = logging.getLogger(__name__)
+
+
+# Called from the request: copy the upload to the staging storage, a disk
+# shared with the worker, and mark the event pending. Resizing and every
+# upload to the image host happen in the worker.
+def stage_event_image(event, uploaded_file):
+    ext = os.path.splitext(uploaded_file.name)[1].lower() or '.jpg'
+    staged_name = f"staging/event_{event.pk}_{uuid.uuid4().hex}{ext}"
+    storage = get_staging_storage()
+    storage.save(staged_name, uploaded_file, content_type=uploaded_file.content_type)
+
+    previous = event.image_staged_path
+    event.image_staged_path = staged_name
+    event.image_status = 'pending'
+    event.save(update_fields=['image_staged_path', 'image_status'])
+
+    # A newer upload replaces one the worker hasn't picked up yet
+    if previous and previous != staged_name:
+        _discard_staged(storage, previous)
+    return staged_name
+
+
+def _discard_staged(storage, name):
+    try:
+        storage.delete(name)
+    except Exception:
+        logger.warning("Could not delete staged image %s", name, exc_info=True)
+
+
+def _encode_jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=settings.EVENT_IMAGE_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+# Build the original plus every configured variant, each as JPEG bytes
+def build_variants(source):
+    # Pillow is only needed by the image worker, not by web requests
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        variants = {'original': _encode_jpeg(img)}
+        for name, size in settings.EVENT_IMAGE_VARIANTS.items():
+            variants[name] = _encode_jpeg(ImageOps.fit(img, size, method=Image.LANCZOS))
+    return variants
+
+
+def process_event_image(event):
+    staged_path = event.image_staged_path
+    staging, storage = get_staging_storage(), get_image_storage()
+    try:
+        variants = build_variants(io.BytesIO(staging.read(staged_path)))
+        version = uuid.uuid4().hex[:8]
+        urls = {
+            name: storage.save(f"event_{event.pk}/{name}_{version}.jpg", content)
+            for name, content in variants.items()
+        }
+    except Exception:
+        logger.exception("Image processing failed for event %s", event.pk)
+        Event.objects.filter(pk=event.pk, image_staged_path=staged_path).update(image_status='failed')
+        return False
+
+    # Only publish if no newer upload was staged while we were working
+    updated = Event.objects.filter(pk=event.pk, image_staged_path=staged_path).update(
+        image_status='ready',
+        image_staged_path='',
+        image_url=urls['original'],
+        image_card_url=urls.get('card', ''),
+        image_thumbnail_url=urls.get('thumbnail', ''),
+    )
+    _discard_staged(staging, staged_path)
+    if updated:
+        bump_event(event.pk)
+    return bool(updated)
+
+
+# Worker entry point: claim a batch of pending events and push them to storage.
+# skip_locked lets several workers share the queue on Postgres. A claim older
+# than EVENT_IMAGE_CLAIM_TIMEOUT belonged to a worker that died mid-batch and
+# is taken over; publishing is guarded by the staged name, so a slow worker
+# and its successor can't both apply a result.
+def process_pending_images(batch_size=20):
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            Event.objects.select_for_update(skip_locked=True)
+            .filter(Q(image_status='pending') | Q(
+                image_status='processing', image_claimed_at__lt=now - settings.EVENT_IMAGE_CLAIM_TIMEOUT,
+            ))
+            .order_by('id')[:batch_size]
+        )
+        Event.objects.filter(pk__in=[e.pk for e in events]).update(image_status='processing', image_claimed_at=now)
+    processed = 0
+    for event in events:
+        if process_event_image(event):
+            processed += 1
+    return processed
@@ -0,0 +1,388 @@
+import random
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .metrics import record_bookings, record_payments
+from .models import Booking, Payment, Ticket, TicketShard, User, WaitlistEntry
+from .pubsub import get_broker
+from .ticket_tokens import revoke_ticket
+
+
+class InsufficientInventory(Exception):
+    def __init__(self, ticket, remaining):
+        self.ticket = ticket
+        self.remaining = remaining
+        super().__init__(f"Only {remaining} ticket(s) remaining for {ticket}.")
+
+
+class AlreadyBooked(Exception):
+    pass
+
+
+# One active booking per user per event, whether it came from the form, the
+# API or a cart order. The partial unique constraint only covers bookings
+# outside an order (an order may hold several tiers of one event), so every
+# booking path calls this inside its transaction before reserving. Locking
+# the user's row first makes the check safe against that user's concurrent
+# checkouts without touching anyone else's.
+def ensure_not_booked(user, event_ids):
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+    if Booking.objects.filter(user=user, event_id__in=event_ids, status='active').exists():
+        raise AlreadyBooked()
+
+
+# Atomically take `quantity` from a ticket. The conditional UPDATE is the
+# availability check, so two buyers can never both get the last seat.
+# Another process may have sharded or unsharded the ticket since it was
+# loaded; each path's UPDATE only matches rows of its own mode and switches
+# to the other mode when the database says it changed.
+def reserve(ticket, quantity):
+    if ticket.is_sharded:
+        _reserve_sharded(ticket, quantity)
+    else:
+        _reserve_unsharded(ticket, quantity)
+    schedule_availability_publish(ticket.event_id)
+
+
+def release(ticket, quantity):
+    if ticket.is_sharded:
+        _release_sharded(ticket, quantity)
+    else:
+        _release_unsharded(ticket, quantity)
+    schedule_availability_publish(ticket.event_id)
+
+
+def _reserve_unsharded(ticket, quantity):
+    updated = Ticket.objects.filter(
+        pk=ticket.pk,
+        shard_count=0,
+        sold_quantity__lte=F('quantity') - quantity,
+    ).update(sold_quantity=F('sold_quantity') + quantity)
+    if updated:
+        ticket.sold_quantity += quantity
+        return
+    ticket.refresh_from_db(fields=['quantity', 'sold_quantity', 'shard_count'])
+    if ticket.is_sharded:
+        _reserve_sharded(ticket, quantity)
+        return
+    raise InsufficientInventory(ticket, ticket.remaining_quantity)
+
+
+def _release_unsharded(ticket, quantity):
+    updated = Ticket.objects.filter(pk=ticket.pk, shard_count=0, sold_quantity__gte=quantity).update(
+        sold_quantity=F('sold_quantity') - quantity
+    )
+    if not updated:
+        ticket.refresh_from_db(fields=['sold_quantity', 'shard_count'])
+        if ticket.is_sharded:
+            _release_sharded(ticket, quantity)
+
+
+def _release_sharded(ticket, quantity):
+    index = random.randrange(ticket.shard_count)
+    updated = TicketShard.objects.filter(ticket=ticket, index=index).update(available=F('available') + quantity)
+    if not updated:
+        # Unsharded (or resharded) meanwhile
+        ticket.refresh_from_db(fields=['sold_quantity', 'shard_count'])
+        if not ticket.is_sharded:
+            _release_unsharded(ticket, quantity)
+        elif index >= ticket.shard_count:
+            _release_sharded(ticket, quantity)
+
+
+# -------------------- LIVE AVAILABILITY --------------------
+# Each committed inventory change publishes the event's remaining quantities
+# once; SSE viewers (views.event_availability_stream) receive it from the broker.
+
+def availability_channel(event_id):
+    return f"availability:{event_id}"
+
+
+def availability_snapshot(event_id):
+    tickets = with_availability(Ticket.objects.filter(event_id=event_id)).values_list('id', 'available_quantity')
+    return {
+        'event': event_id,
+        'tickets': {str(ticket_id): max(available, 0) for ticket_id, available in tickets},
+    }
+
+
+# Remaining quantity for many tickets and/or events in one grouped query
+def availability_lookup(ticket_ids=(), event_ids=()):
+    rows = with_availability(
+        Ticket.objects.filter(Q(id__in=ticket_ids) | Q(event_id__in=event_ids))
+    ).values_list('id', 'event_id', 'available_quantity')
+
+    tickets = {str(ticket_id): None for ticket_id in ticket_ids}
+    events = {str(event_id): None for event_id in event_ids}
+    wanted_events = set(event_ids)
+    for ticket_id, event_id, available in rows:
+        available = max(available, 0)
+        if ticket_id in ticket_ids:
+            tickets[str(ticket_id)] = {'event': event_id, 'remaining': available, 'sold_out': available == 0}
+        if event_id in wanted_events:
+            entry = events[str(event_id)] or {'remaining': 0, 'tickets': {}}
+            entry['remaining'] += available
+            entry['tickets'][str(ticket_id)] = available
+            events[str(event_id)] = entry
+    for entry in events.values():
+        if entry is not None:
+            entry['sold_out'] = entry['remaining'] == 0
+
+    result = {}
+    if ticket_ids:
+        result['tickets'] = tickets
+    if event_ids:
+        result['events'] = events
+    return result
+
+
+def publish_availability(event_id):
+    return get_broker().publish(availability_channel(event_id), availability_snapshot(event_id))
+
+
+# Queue a publish for when the current transaction commits. Every booking
+# and cancellation calls this, so events are collected per connection and
+# published once each, and only if someone is streaming them: a new viewer
+# subscribes before reading its first snapshot, so a skipped publish can't
+# leave it behind.
+def schedule_availability_publish(event_id):
+    connection = transaction.get_connection()
+    if not hasattr(connection, 'pending_availability'):
+        connection.pending_availability = set()
+    connection.pending_availability.add(event_id)
+    transaction.on_commit(lambda: flush_availability(connection))
+
+
+def flush_availability(connection):
+    # The first callback after a commit takes the whole set; the rest find it empty
+    event_ids, connection.pending_availability = connection.pending_availability, set()
+    if not event_ids:
+        return
+    channels = {availability_channel(event_id): event_id for event_id in event_ids}
+    for channel in get_broker().subscribed(channels):
+        publish_availability(channels[channel])
+
+
+# Annotate `available_quantity` on a Ticket queryset so remaining quantity is
+# read in the same query for both single-row and sharded tickets
+def with_availability(queryset):
+    shard_total = (
+        TicketShard.objects.filter(ticket=OuterRef('pk'))
+        .values('ticket')
+        .annotate(total=Sum('available'))
+        .values('total')
+    )
+    return queryset.annotate(available_quantity=Case(
+        When(shard_count__gt=0, then=Coalesce(Subquery(shard_total), Value(0))),
+        default=F('quantity') - F('sold_quantity'),
+        output_field=IntegerField(),
+    ))
+
+
+# -------------------- SHARDED COUNTERS --------------------
+# For very hot tiers the single Ticket row becomes a lock hotspot. In sharded
+# mode the remaining quantity is split across N TicketShard rows: a booking
+# decrements one random shard, so concurrent buyers mostly lock different rows.
+
+def enable_sharding(ticket, shard_count=None):
+    shard_count = shard_count or settings.TICKET_SHARD_COUNT
+    with transaction.atomic():
+        ticket = Ticket.objects.select_for_update().get(pk=ticket.pk)
+        if ticket.is_sharded:
+            return ticket
+        TicketShard.objects.bulk_create([
+            TicketShard(ticket=ticket, index=index, available=available)
+            for index, available in enumerate(_split(ticket.quantity - ticket.sold_quantity, shard_count))
+        ])
+        ticket.shard_count = shard_count
+        ticket.save(update_fields=['shard_count'])
+    return ticket
+
+
+def disable_sharding(ticket):
+    with transaction.atomic():
+        ticket = Ticket.objects.select_for_update().get(pk=ticket.pk)
+        if not ticket.is_sharded:
+            return ticket
+        remaining = ticket.remaining_quantity
+        ticket.shards.all().delete()
+        ticket.sold_quantity = ticket.quantity - remaining
+        ticket.shard_count = 0
+        ticket.save(update_fields=['sold_quantity', 'shard_count'])
+    return ticket
+
+
+def _split(total, parts):
+    base, extra = divmod(total, parts)
+    return [base + (1 if index < extra else 0) for index in range(parts)]
+
+
+def _reserve_sharded(ticket, quantity):
+    # Start at a random shard and walk the ring until one can cover the request
+    start = random.randrange(ticket.shard_count)
+    for offset in range(ticket.shard_count):
+        index = (start + offset) % ticket.shard_count
+        updated = TicketShard.objects.filter(
+            ticket=ticket, index=index, available__gte=quantity,
+        ).update(available=F('available') - quantity)
+        if updated:
+            if offset:
+                # We hit at least one shard that ran low: even them out once
+                # the booking has committed. Locking every shard here, inside
+                # the booking transaction, would deadlock with buyers holding
+                # other shards and queue everyone behind one lock.
+                transaction.on_commit(lambda: rebalance_shards(ticket))
+            return
+
+    # No single shard holds enough: take from several under one lock
+    with transaction.atomic():
+        shards = list(TicketShard.objects.select_for_update().filter(ticket=ticket).order_by('index'))
+        if not shards:
+            ticket.refresh_from_db(fields=['quantity', 'sold_quantity', 'shard_count'])
+            if not ticket.is_sharded:
+                # Unsharded since this ticket was loaded
+                _reserve_unsharded(ticket, quantity)
+                return
+        total = sum(shard.available for shard in shards)
+        if total < quantity:
+            raise InsufficientInventory(ticket, total)
+        for shard, available in zip(shards, _split(total - quantity, len(shards))):
+            shard.available = available
+        TicketShard.objects.bulk_update(shards, ['available'])
+
+
+# Spread what is left evenly across the shards again, in its own short
+# transaction. Shards locked by an in-flight booking are skipped rather than
+# waited for; if any is busy the rebalance is left to the next low shard.
+def rebalance_shards(ticket):
+    with transaction.atomic():
+        shards = list(
+            TicketShard.objects.select_for_update(skip_locked=True).filter(ticket=ticket).order_by('index')
+        )
+        if not shards or len(shards) < ticket.shard_count:
+            return
+        total = sum(shard.available for shard in shards)
+        low_water = total // (len(shards) * settings.TICKET_SHARD_REBALANCE_RATIO)
+        if min(shard.available for shard in shards) > low_water:
+            return
+        for shard, available in zip(shards, _split(total, len(shards))):
+            shard.available = available
+        TicketShard.objects.bulk_update(shards, ['available'])
+
+
+# Soft-cancel a booking: mark it cancelled, refund its payment through the
+# provider, put the quantity back and hand it to the waitlist, all in one
+# transaction.
+def cancel_booking(booking):
+    # payments imports this module
+    from .payments import refund_payments
+
+    with transaction.atomic():
+        booking = Booking.objects.select_for_update().select_related('ticket').get(pk=booking.pk)
+        if booking.status == 'cancelled':
+            return booking
+
+        booking.status = 'cancelled'
+        booking.cancelled_at = timezone.now()
+        if booking.payment_status == 'paid':
+            booking.payment_status = 'refunded'
+        booking.save(update_fields=['status', 'cancelled_at', 'payment_status'])
+        refunded = list(Payment.objects.select_for_update().filter(booking=booking, status='successful'))
+        if refunded:
+            Payment.objects.filter(pk__in=[payment.pk for payment in refunded]).update(status='refunded')
+            for payment in refunded:
+                payment.status = 'refunded'
+            refund_payments(refunded)
+
+        release(booking.ticket, booking.quantity)
+        promote_waitlist(booking.ticket)
+        transaction.on_commit(lambda: revoke_ticket(booking.pk))
+    return booking
+
+
+# Fill freed inventory from the waitlist in FIFO order. Entries that do not
+# fit in what is left are skipped, so a large request never blocks smaller
+# ones behind it. Everything is written with one bulk insert per table.
+def promote_waitlist(ticket):
+    with transaction.atomic():
+        ticket = Ticket.objects.select_for_update().get(pk=ticket.pk)
+        remaining = ticket.remaining_quantity
+        if remaining <= 0:
+            return []
+
+        waiting = WaitlistEntry.objects.filter(ticket=ticket, status='waiting').order_by('created_at', 'id')
+        entries, dropped, passed_over = [], [], set()
+        while remaining > 0:
+            candidates, fits = [], remaining
+            for entry in waiting.exclude(pk__in=passed_over).iterator():
+                if entry.quantity <= fits:
+                    candidates.append(entry)
+                    fits -= entry.quantity
+                if fits == 0:
+                    break
+            if not candidates:
+                break
+
+            # The booking paths lock the user before the ticket, so waiting for
+            # a user's lock here could deadlock; someone busy booking right now
+            # is passed over and keeps their place for the next release
+            locked = set(
+                User.objects.select_for_update(skip_locked=True)
+                .filter(pk__in=[entry.user_id for entry in candidates])
+                .values_list('pk', flat=True)
+            )
+            # Someone who booked another tier of this event since joining can't
+            # hold a second booking; drop them from the list instead
+            already_booked = set(Booking.objects.filter(
+                event_id=ticket.event_id, status='active', user_id__in=locked,
+            ).values_list('user_id', flat=True))
+            for entry in candidates:
+                passed_over.add(entry.pk)
+                if entry.user_id not in locked:
+                    continue
+                if entry.user_id in already_booked:
+                    entry.status = 'cancelled'
+                    dropped.append(entry)
+                else:
+                    entries.append(entry)
+                    remaining -= entry.quantity
+
+        if dropped:
+            WaitlistEntry.objects.bulk_update(dropped, ['status'])
+        if not entries:
+            return []
+
+        bookings = Booking.objects.bulk_create([
+            Booking(
+                user_id=entry.user_id, ticket=ticket, event_id=ticket.event_id,
+                quantity=entry.quantity, payment_status='pending',
+            )
+            for entry in entries
+        ])
+        payments = Payment.objects.bulk_create([
+            Payment(
+                booking=booking,
+                amount=ticket.price * booking.quantity,
+                method=entry.method,
+                transaction_id=str(uuid.uuid4()),
+                status='pending',
+            )
+            for booking, entry in zip(bookings, entries)
+        ])
+
+        now = timezone.now()
+        for booking, entry in zip(bookings, entries):
+            entry.status = 'promoted'
+            entry.booking = booking
+            entry.promoted_at = now
+        WaitlistEntry.objects.bulk_update(entries, ['status', 'booking', 'promoted_at'])
+
+        reserve(ticket, sum(entry.quantity for entry in entries))
+    record_bookings('waitlist', bookings)
+    record_payments(payments)
+    return bookings
@@ -0,0 +1,300 @@
+# Minimal asyncio HTTP/1.1 client and load runner used by the benchmark
+# commands. Standard library only, so it runs anywhere the project does.
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+
+class HttpResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class HttpClient:
+    def __init__(self, base_url, timeout=30.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        return await asyncio.wait_for(self._request(method, path, headers or {}, body), self.timeout)
+
+    async def _request(self, method, path, headers, body):
+        for attempt in range(2):
+            if self.writer is None:
+                await self._connect()
+            try:
+                return await self._send(method, path, headers, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server closed a kept-alive connection: reconnect once
+                await self.close()
+                if attempt:
+                    raise
+
+    async def _send(self, method, path, headers, body):
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        if body:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        if not status_line.strip():
+            raise ConnectionError("empty response")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        set_cookies = []
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                set_cookies.append(value)
+            response_headers[name] = value
+        response_headers['set-cookie'] = set_cookies
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b"\r\n")
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            response_body = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            response_body = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            response_body = await self.reader.read()
+            await self.close()
+
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return HttpResponse(status, response_headers, response_body)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': errors / (len(latencies) + errors) if latencies or errors else 0.0,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+# Hammer `paths` (round-robin) with `concurrency` keep-alive clients for `duration` seconds
+async def run_constant_load(base_url, paths, concurrency, duration, headers=None):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(offset):
+        nonlocal errors
+        client = HttpClient(base_url)
+        i = offset
+        try:
+            while time.perf_counter() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.request('GET', path, headers)
+                except (OSError, asyncio.TimeoutError, ValueError):
+                    errors += 1
+                    await client.close()
+                    continue
+                if response.status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+# -------------------- USER JOURNEYS --------------------
+
+# A browser-like client: keeps cookies between requests and sends the CSRF
+# token Django expects on form posts
+class Session:
+    def __init__(self, base_url, timeout=30.0):
+        self.client = HttpClient(base_url, timeout)
+        self.cookies = {}
+
+    async def close(self):
+        await self.client.close()
+
+    async def request(self, method, path, data=None):
+        headers = {}
+        body = b''
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in self.cookies.items())
+        if data is not None:
+            body = urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            if 'csrftoken' in self.cookies:
+                headers['X-CSRFToken'] = self.cookies['csrftoken']
+        response = await self.client.request(method, path, headers, body)
+        for cookie in response.headers['set-cookie']:
+            name, _, value = cookie.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value.strip()
+        return response
+
+    async def get(self, path):
+        return await self.request('GET', path)
+
+    async def post(self, path, data):
+        return await self.request('POST', path, data)
+
+
+class JourneyError(Exception):
+    pass
+
+
+# Latencies and failures per journey step
+class StepStats:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.journeys = 0
+        self.failed_journeys = 0
+        self.failures = Counter()
+
+    # Time one request; `expect` is the set of acceptable status codes and
+    # `check(response)` can return an error message for anything else wrong
+    async def timed(self, name, call, expect=(200,), check=None):
+        self.latencies.setdefault(name, [])
+        self.errors.setdefault(name, 0)
+        started = time.perf_counter()
+        try:
+            response = await call
+        except (OSError, asyncio.TimeoutError, ValueError) as exc:
+            self.errors[name] += 1
+            raise JourneyError(f"{name}: {exc!r}") from exc
+        if response.status not in expect:
+            self.errors[name] += 1
+            raise JourneyError(f"{name}: HTTP {response.status}")
+        problem = check(response) if check else None
+        if problem:
+            self.errors[name] += 1
+            raise JourneyError(f"{name}: {problem}")
+        self.latencies[name].append(time.perf_counter() - started)
+        return response
+
+    def report(self, elapsed):
+        steps = {name: summarize(self.latencies[name], self.errors[name], elapsed) for name in self.latencies}
+        return {
+            'journeys': self.journeys,
+            'failed_journeys': self.failed_journeys,
+            'journeys_per_second': self.journeys / elapsed if elapsed else 0.0,
+            'steps': steps,
+            'top_failures': self.failures.most_common(5),
+        }
+
+
+# Run `users` virtual users for `duration` seconds. Each user gets its own
+# Session; `setup(session, n)` runs once (e.g. to log in) and
+# `journey(session, stats, n)` is repeated until time is up.
+async def run_journeys(base_url, journey, users, duration, setup=None, think_time=0.0):
+    stats = StepStats()
+    sessions = [Session(base_url) for _ in range(users)]
+    if setup is not None:
+        await asyncio.gather(*(setup(session, n) for n, session in enumerate(sessions)))
+
+    deadline = time.perf_counter() + duration
+
+    async def user(n, session):
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    await journey(session, stats, n)
+                    stats.journeys += 1
+                except JourneyError as exc:
+                    stats.failed_journeys += 1
+                    stats.failures[str(exc)] += 1
+                    await session.client.close()
+                if think_time:
+                    await asyncio.sleep(think_time)
+        finally:
+            await session.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(n, session) for n, session in enumerate(sessions)))
+    return stats.report(time.perf_counter() - started)
+
+
+# -------------------- LOCAL SERVERS --------------------
+
+SERVER_COMMANDS = {
+    'wsgi': ['gunicorn', 'event_platform.wsgi:application'],
+    'asgi': ['gunicorn', 'event_platform.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def wait_for_port(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_server(mode, port, workers=2, env=None):
+    command = [sys.executable, '-m'] + SERVER_COMMANDS[mode] + [
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+    ]
+    process = subprocess.Popen(command, env=env)
+    if not wait_for_port('127.0.0.1', port):
+        process.terminate()
+        raise RuntimeError(f"{mode} server did not start on port {port}")
+    return process
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events.archive import archive_ended_bookings, archivable_bookings
+
+
+class Command(BaseCommand):
+    help = "Move bookings and payments of events that ended more than --days ago into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE, help="Bookings moved per transaction.")
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches (for off-peak windows).")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many bookings would move.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"{archivable_bookings(options['days']).count()} booking(s) would be archived.")
+            return
+        archived = archive_ended_bookings(options['days'], options['batch_size'], options['max_batches'])
+        self.stdout.write(f"Archived {archived} booking(s).")
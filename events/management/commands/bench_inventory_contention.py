@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from events.inventory import InsufficientInventory, enable_sharding, reserve
+from events.models import Booking, Event, Ticket, User
+
+
+class Command(BaseCommand):
+    help = "Compare single-row and sharded ticket counter throughput as concurrency rises."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,2,4,8,16,32', help="Comma-separated thread counts.")
+        parser.add_argument('--duration', type=float, default=3.0, help="Seconds per run.")
+        parser.add_argument('--shards', type=int, default=8)
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stderr.write("SQLite serializes all writers; run this against PostgreSQL for meaningful numbers.")
+
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        organizer = User.objects.create(username=f"bench-{uuid.uuid4().hex[:8]}", user_type='organizer')
+        event = Event.objects.create(
+            organizer=organizer, title="Inventory contention benchmark", description="",
+            start_time=timezone.now() + timedelta(days=1), end_time=timezone.now() + timedelta(days=2),
+        )
+
+        results = []
+        try:
+            for mode in ('single', 'sharded'):
+                for concurrency in levels:
+                    ticket = Ticket.objects.create(event=event, name=f"{mode}-{concurrency}", price=1, quantity=10 ** 9)
+                    if mode == 'sharded':
+                        enable_sharding(ticket, options['shards'])
+                    result = self.run_level(ticket.pk, organizer, concurrency, options['duration'])
+                    result.update(mode=mode, concurrency=concurrency)
+                    results.append(result)
+                    self.stdout.write(
+                        f"{mode:>8}  c={concurrency:<4} {result['ops_per_sec']:>10.1f} bookings/s"
+                        f"  errors={result['errors']}"
+                    )
+        finally:
+            event.delete()
+            organizer.delete()
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'vendor': connection.vendor, 'results': results}, f, indent=2)
+
+    def run_level(self, ticket_id, user, concurrency, duration):
+        barrier = threading.Barrier(concurrency + 1)
+        counts = [0] * concurrency
+        errors = [0] * concurrency
+        deadline = []
+
+        def worker(slot):
+            # Each thread gets its own DB connection from Django
+            ticket = Ticket.objects.get(pk=ticket_id)
+            barrier.wait()
+            try:
+                while time.perf_counter() < deadline[0]:
+                    try:
+                        # Like book_event_view: the counter locks are held
+                        # until the booking row is in and the transaction commits
+                        with transaction.atomic():
+                            reserve(ticket, 1)
+                            # Cancelled so one user can book the event over and
+                            # over; the insert costs the same
+                            Booking.objects.create(
+                                user=user, ticket=ticket, event_id=ticket.event_id, quantity=1, status='cancelled',
+                            )
+                        counts[slot] += 1
+                    except (DatabaseError, InsufficientInventory):
+                        errors[slot] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        deadline.append(time.perf_counter() + duration)
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'ops': sum(counts),
+            'errors': sum(errors),
+            'seconds': round(elapsed, 3),
+            'ops_per_sec': sum(counts) / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,72 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from events.loadtest import percentile
+from events.ratelimit import RateLimiter, TokenBucket, check_rate
+
+
+class Command(BaseCommand):
+    help = "Measure the per-request cost of the token-bucket rate limiter against the configured cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument('--identities', type=int, default=100, help="Distinct users/IPs to spread calls over.")
+        parser.add_argument('--cache', default=None, help="Cache alias (defaults to RATE_LIMIT_CACHE_ALIAS).")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        limiter = RateLimiter(options['cache'])
+        # Generous bucket so every call takes the full refill-and-spend path
+        bucket = TokenBucket('bench', rate=10 ** 9, per=1)
+        identities = [f"ip:10.0.{n // 256}.{n % 256}" for n in range(options['identities'])]
+
+        bucket_timings = self.time_calls(
+            options['iterations'], lambda i: bucket.consume(limiter, identities[i % len(identities)])
+        )
+
+        # Whole check as the views run it: identity lookup, settings, bucket
+        factory = RequestFactory()
+        requests = [factory.post('/', REMOTE_ADDR=identity[3:]) for identity in identities]
+        for request in requests:
+            request.user = None
+        check_timings = self.time_calls(
+            options['iterations'], lambda i: check_rate(requests[i % len(requests)], 'booking')
+        )
+
+        backend = 'redis-lua' if limiter._script is not None else f"{type(limiter.cache).__name__} + lock"
+        results = {
+            'backend': backend,
+            'iterations': options['iterations'],
+            'consume': self.summarize(bucket_timings),
+            'check_rate': self.summarize(check_timings),
+        }
+        for name in ('consume', 'check_rate'):
+            stats = results[name]
+            self.stdout.write(
+                f"{name:<10} [{backend}] mean={stats['mean_us']:.1f}us p50={stats['p50_us']:.1f}us "
+                f"p99={stats['p99_us']:.1f}us"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    @staticmethod
+    def time_calls(iterations, call):
+        timings = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            call(i)
+            timings.append(time.perf_counter() - started)
+        return sorted(timings)
+
+    @staticmethod
+    def summarize(timings):
+        return {
+            'mean_us': sum(timings) / len(timings) * 1e6,
+            'p50_us': percentile(timings, 50) * 1e6,
+            'p99_us': percentile(timings, 99) * 1e6,
+        }
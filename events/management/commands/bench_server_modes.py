@@ -0,0 +1,50 @@
+import asyncio
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from events.loadtest import run_constant_load, start_server, stop_server
+
+DEFAULT_PATHS = '/api/events/events,/api/api/events/,/api/api/tickets/'
+
+
+class Command(BaseCommand):
+    help = "Compare requests/sec and tail latency of the catalog endpoints under sync WSGI and async ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paths', default=DEFAULT_PATHS, help="Comma-separated paths to request.")
+        parser.add_argument('--concurrency', default='1,10,50', help="Comma-separated client counts.")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per run.")
+        parser.add_argument('--workers', type=int, default=2, help="Server worker processes.")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--modes', default='wsgi,asgi')
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        paths = options['paths'].split(',')
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        base_url = f"http://127.0.0.1:{options['port']}"
+        results = []
+
+        for mode in options['modes'].split(','):
+            env = dict(os.environ, ASYNC_CATALOG_VIEWS='1' if mode == 'asgi' else '0')
+            server = start_server(mode, options['port'], options['workers'], env)
+            try:
+                # Warm up caches, connections and imports
+                asyncio.run(run_constant_load(base_url, paths, 2, 1.0))
+                for concurrency in levels:
+                    stats = asyncio.run(run_constant_load(base_url, paths, concurrency, options['duration']))
+                    stats.update(mode=mode, concurrency=concurrency)
+                    results.append(stats)
+                    self.stdout.write(
+                        f"{mode}  c={concurrency:<4} {stats['rps']:>8.1f} req/s  "
+                        f"p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms  "
+                        f"errors={stats['errors']}"
+                    )
+            finally:
+                stop_server(server)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'paths': paths, 'workers': options['workers'], 'results': results}, f, indent=2)
@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.models import Booking
+from events.ticket_tokens import InvalidTicket, is_revoked, sign_ticket, verify_ticket
+
+
+class Command(BaseCommand):
+    help = "Measure signed ticket verifications per second (signature alone, and signature + revocation lookup)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=10000, help="Distinct tokens to cycle through.")
+        parser.add_argument('--duration', type=float, default=3.0, help="Seconds per measurement.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        # Unsaved bookings are enough to sign: no database rows are needed
+        tokens = [
+            sign_ticket(Booking(pk=n, event_id=n % 50 + 1, quantity=n % 4 + 1))
+            for n in range(1, options['tokens'] + 1)
+        ]
+        forged = tokens[0][:-2] + ('AA' if not tokens[0].endswith('AA') else 'BB')
+
+        results = {
+            'tokens': len(tokens),
+            'token_length': len(tokens[0]),
+            'verify_per_sec': self.measure(tokens, options['duration'], verify_ticket),
+            'verify_and_revocation_per_sec': self.measure(
+                tokens, options['duration'], lambda token: is_revoked(verify_ticket(token).booking_id)
+            ),
+        }
+        for name in ('verify_per_sec', 'verify_and_revocation_per_sec'):
+            self.stdout.write(f"{name:<32} {results[name]:>12,.0f}")
+        self.stdout.write(f"token length: {results['token_length']} chars (sample {tokens[0]}, forged rejected: "
+                          f"{self.rejects(forged)})")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    @staticmethod
+    def measure(tokens, duration, call):
+        count = 0
+        started = time.perf_counter()
+        deadline = started + duration
+        while time.perf_counter() < deadline:
+            # One pass over the tokens between clock checks
+            for token in tokens:
+                call(token)
+            count += len(tokens)
+        return count / (time.perf_counter() - started)
+
+    @staticmethod
+    def rejects(token):
+        try:
+            verify_ticket(token)
+        except InvalidTicket:
+            return True
+        return False
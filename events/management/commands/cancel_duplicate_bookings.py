@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from events.inventory import cancel_booking
+from events.models import Booking
+
+
+# Run before migration 0019 when it reports users holding several active
+# bookings for one event. The earliest booking of each pair is kept; the
+# others are cancelled through cancel_booking, which refunds paid ones through
+# their provider and frees the seats. Every cancelled booking is listed so the
+# customers can be told.
+class Command(BaseCommand):
+    help = "Cancel all but the earliest active booking of users who booked an event more than once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the bookings without cancelling them.")
+
+    def handle(self, *args, **options):
+        duplicates = (
+            Booking.objects.filter(status='active', order_ref__isnull=True)
+            .values('user_id', 'event_id')
+            .annotate(total=Count('id'))
+            .filter(total__gt=1)
+            .order_by('user_id', 'event_id')
+        )
+        cancelled = 0
+        for row in duplicates.iterator():
+            extra = (
+                Booking.objects.filter(
+                    user_id=row['user_id'], event_id=row['event_id'], status='active', order_ref__isnull=True,
+                )
+                .select_related('user', 'event')
+                .order_by('booked_at', 'id')[1:]
+            )
+            for booking in extra:
+                if not options['dry_run']:
+                    cancel_booking(booking)
+                cancelled += 1
+                self.stdout.write(
+                    f"{'Would cancel' if options['dry_run'] else 'Cancelled'} booking {booking.pk} of "
+                    f"{booking.user.username} <{booking.user.email}> for event {booking.event_id} "
+                    f"({booking.event.title}), payment {booking.payment_status}."
+                )
+        self.stdout.write(f"{cancelled} duplicate booking(s) {'found' if options['dry_run'] else 'cancelled'}.")
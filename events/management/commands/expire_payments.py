@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.payments import expire_pending_payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Fail payments pending longer than PAYMENT_STUCK_AFTER_MINUTES and waitlist bookings left "
+        "unpaid past WAITLIST_PAYMENT_WINDOW_MINUTES, releasing their seats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Payments expired per pass.")
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping for newly expired payments.")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds to sleep when nothing is left.")
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_pending_payments(batch_size=options['batch_size'])
+            if expired:
+                self.stdout.write(f"Expired {len(expired)} payment(s).")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
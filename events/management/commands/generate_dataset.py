@@ -0,0 +1,218 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from events.models import Booking, Category, Event, Payment, Ticket, User, Venue
+
+TIERS = [
+    # (type, name, price range, capacity range)
+    ('regular', 'Regular', (500, 3000), (100, 2000)),
+    ('vip', 'VIP', (3000, 15000), (20, 300)),
+    ('student', 'Student', (200, 1000), (50, 500)),
+]
+CATEGORY_NAMES = [
+    'Music', 'Tech', 'Sports', 'Comedy', 'Theatre', 'Food & Drink', 'Business', 'Art',
+    'Film', 'Health', 'Fashion', 'Gaming', 'Education', 'Charity', 'Travel', 'Family',
+]
+METHODS = ['mpesa', 'stripe', 'paypal']
+
+
+class Command(BaseCommand):
+    help = "Bulk-insert a synthetic dataset (users, venues, events, ticket tiers, bookings, payments) for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organizers', type=int, default=500)
+        parser.add_argument('--attendees', type=int, default=50000)
+        parser.add_argument('--venues', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=100000)
+        parser.add_argument('--bookings', type=int, default=2000000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='ds', help="Username prefix, so several datasets can coexist.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        if User.objects.filter(username__startswith=f"{self.prefix}-").exists():
+            raise CommandError(f"A dataset with prefix '{self.prefix}' already exists; pick another --prefix.")
+
+        started = time.perf_counter()
+        # Hashing is slow on purpose; every generated user shares one hash
+        self.password = make_password('benchmark')
+
+        organizer_ids = self.create_users('organizer', options['organizers'])
+        attendee_ids = self.create_users('attendee', options['attendees'])
+        category_ids = self.create_categories()
+        venue_ids = self.create_venues(options['venues'])
+        event_times = self.create_events(options['events'], organizer_ids, category_ids, venue_ids)
+        tickets_by_event, tickets = self.create_tickets(event_times)
+        booked = self.create_bookings(options['bookings'], attendee_ids, tickets_by_event, tickets)
+        self.update_sold_quantities(tickets)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Dataset '{self.prefix}' ready: {len(event_times)} events, {len(tickets)} tickets, "
+            f"{booked} bookings in {time.perf_counter() - started:.0f}s."
+        ))
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def insert(self, model, objects):
+        with transaction.atomic():
+            return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    # -------------------- ROWS --------------------
+
+    def create_users(self, user_type, count):
+        ids = []
+        for start in range(0, count, self.batch_size):
+            users = self.insert(User, [
+                User(
+                    username=f"{self.prefix}-{user_type}-{n}",
+                    email=f"{self.prefix}-{user_type}-{n}@example.com",
+                    password=self.password,
+                    user_type=user_type,
+                )
+                for n in range(start, min(start + self.batch_size, count))
+            ])
+            ids.extend(user.pk for user in users)
+        self.log(f"{count} {user_type}s")
+        return ids
+
+    def create_categories(self):
+        existing = dict(Category.objects.filter(name__in=CATEGORY_NAMES).values_list('name', 'pk'))
+        missing = [Category(name=name) for name in CATEGORY_NAMES if name not in existing]
+        created = self.insert(Category, missing)
+        return list(existing.values()) + [category.pk for category in created]
+
+    def create_venues(self, count):
+        venues = self.insert(Venue, [Venue(name=f"{self.prefix} Venue {n}") for n in range(count)])
+        self.log(f"{count} venues")
+        return [venue.pk for venue in venues]
+
+    # Returns {event_id: start_time}; events spread over the past and next year
+    def create_events(self, count, organizer_ids, category_ids, venue_ids):
+        now = timezone.now()
+        event_times = {}
+        for start in range(0, count, self.batch_size):
+            batch = []
+            for n in range(start, min(start + self.batch_size, count)):
+                start_time = now + timedelta(minutes=self.rng.randint(-365 * 24 * 60, 365 * 24 * 60))
+                batch.append(Event(
+                    organizer_id=self.rng.choice(organizer_ids),
+                    title=f"{self.rng.choice(CATEGORY_NAMES)} Event {n}",
+                    description=f"Synthetic event {n} for benchmarking.",
+                    category_id=self.rng.choice(category_ids),
+                    venue_id=self.rng.choice(venue_ids),
+                    start_time=start_time,
+                    end_time=start_time + timedelta(hours=self.rng.randint(2, 8)),
+                ))
+            for event in self.insert(Event, batch):
+                event_times[event.pk] = event.start_time
+            self.log(f"{len(event_times)}/{count} events")
+        return event_times
+
+    # Every event gets the regular tier, most get VIP and/or student tiers too
+    def create_tickets(self, event_times):
+        tickets_by_event = {}
+        tickets = []
+        batch = []
+
+        def flush():
+            for ticket in self.insert(Ticket, batch):
+                tickets_by_event.setdefault(ticket.event_id, []).append(len(tickets))
+                tickets.append(ticket)
+            batch.clear()
+
+        for event_id in event_times:
+            for index, (ticket_type, name, prices, capacities) in enumerate(TIERS):
+                if index and self.rng.random() < 0.4:
+                    continue
+                batch.append(Ticket(
+                    event_id=event_id,
+                    name=name,
+                    type=ticket_type,
+                    price=Decimal(self.rng.randrange(*prices, 50)),
+                    quantity=self.rng.randint(*capacities),
+                ))
+                if len(batch) >= self.batch_size:
+                    flush()
+        flush()
+        self.log(f"{len(tickets)} tickets")
+        return tickets_by_event, tickets
+
+    # Each attendee books distinct events, so the one-active-booking-per-event
+    # constraint always holds; tier capacity is tracked on the Ticket objects
+    def create_bookings(self, count, attendee_ids, tickets_by_event, tickets):
+        event_ids = list(tickets_by_event)
+        per_user, extra = divmod(count, len(attendee_ids))
+        for ticket in tickets:
+            ticket.sold_quantity = 0
+
+        pending = []
+        booked = 0
+        for position, user_id in enumerate(attendee_ids):
+            wanted = min(per_user + (1 if position < extra else 0), len(event_ids))
+            for event_id in self.rng.sample(event_ids, wanted):
+                ticket = tickets[self.rng.choice(tickets_by_event[event_id])]
+                quantity = self.rng.choice((1, 1, 1, 2, 2, 3, 4))
+                roll = self.rng.random()
+                if roll < 0.03:
+                    status, payment_status, payment = 'cancelled', 'refunded', 'refunded'
+                elif roll < 0.05:
+                    status, payment_status, payment = 'active', 'pending', 'pending'
+                else:
+                    status, payment_status, payment = 'active', 'paid', 'successful'
+                if status == 'active':
+                    if ticket.sold_quantity + quantity > ticket.quantity:
+                        continue
+                    ticket.sold_quantity += quantity
+                pending.append((Booking(
+                    user_id=user_id,
+                    ticket_id=ticket.pk,
+                    event_id=event_id,
+                    quantity=quantity,
+                    status=status,
+                    payment_status=payment_status,
+                    cancelled_at=timezone.now() if status == 'cancelled' else None,
+                ), ticket.price * quantity, payment))
+                if len(pending) >= self.batch_size:
+                    booked += self.flush_bookings(pending)
+            if position % 1000 == 999:
+                self.log(f"{booked}/{count} bookings")
+        booked += self.flush_bookings(pending)
+        self.log(f"{booked} bookings")
+        return booked
+
+    def flush_bookings(self, pending):
+        if not pending:
+            return 0
+        with transaction.atomic():
+            bookings = Booking.objects.bulk_create([booking for booking, _, _ in pending], batch_size=self.batch_size)
+            Payment.objects.bulk_create([
+                Payment(
+                    booking_id=booking.pk,
+                    amount=amount,
+                    method=self.rng.choice(METHODS),
+                    transaction_id=uuid.uuid4().hex,
+                    status=status,
+                )
+                for booking, (_, amount, status) in zip(bookings, pending)
+            ], batch_size=self.batch_size)
+        count = len(pending)
+        pending.clear()
+        return count
+
+    def update_sold_quantities(self, tickets):
+        for start in range(0, len(tickets), self.batch_size):
+            with transaction.atomic():
+                Ticket.objects.bulk_update(tickets[start:start + self.batch_size], ['sold_quantity'], batch_size=1000)
+        self.log("ticket counters updated")
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import random
+import re
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from django.utils import timezone
+
+from events.inventory import cancel_booking
+from events.loadtest import JourneyError, run_journeys, start_server, stop_server
+from events.models import Booking, Ticket, User
+
+PASSWORD = 'loadtest'
+IDEMPOTENCY_KEY = re.compile(rb'name="idempotency_key" value="([0-9a-f]+)"')
+TICKET_TYPE = re.compile(rb'name="ticket_type" value="(\d+)"')
+RECEIPT = re.compile(r'/receipt/(\d+)/')
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the booking funnel (list -> detail -> book -> receipt) against a locally started "
+        "gunicorn/uvicorn server and report latency percentiles, throughput and errors per step."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default='10,50', help="Comma-separated virtual user counts, one run each.")
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds per run.")
+        parser.add_argument('--think-time', type=float, default=0.0, help="Pause between a user's journeys.")
+        parser.add_argument('--modes', default='wsgi', help="Comma-separated server modes (wsgi, asgi).")
+        parser.add_argument('--workers', type=int, default=2, help="Server worker processes.")
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--url', help="Test an already running server instead of starting one.")
+        parser.add_argument('--events', type=int, default=200, help="Upcoming events the journeys pick from.")
+        parser.add_argument('--keep-bookings', action='store_true',
+                            help="Don't cancel each booking at the end of its journey.")
+        parser.add_argument('--keep-rate-limits', action='store_true',
+                            help="Leave rate limiting on in the started server.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['users'].split(',')]
+        self.event_ids = list(
+            Ticket.objects.filter(
+                event__start_time__gt=timezone.now(),
+                event__deleted_at__isnull=True,
+                sold_quantity__lt=F('quantity'),
+            ).order_by('event_id').values_list('event_id', flat=True).distinct()[:options['events']]
+        )
+        if not self.event_ids:
+            raise CommandError("No upcoming events with tickets left; run `python manage.py generate_dataset` first.")
+        self.cancel = not options['keep_bookings']
+        users = self.prepare_users(max(levels))
+        run_started = timezone.now()
+
+        results = []
+        modes = ['external'] if options['url'] else options['modes'].split(',')
+        try:
+            for mode in modes:
+                server = None
+                base_url = options['url'] or f"http://127.0.0.1:{options['port']}"
+                if not options['url']:
+                    env = dict(os.environ, ASYNC_CATALOG_VIEWS='1' if mode == 'asgi' else '0')
+                    if not options['keep_rate_limits']:
+                        # Every virtual user comes from 127.0.0.1 and would share one bucket
+                        env['RATE_LIMIT_ENABLED'] = '0'
+                    server = start_server(mode, options['port'], options['workers'], env)
+                try:
+                    for count in levels:
+                        stats = asyncio.run(run_journeys(
+                            base_url, self.journey, count, options['duration'],
+                            setup=lambda session, n: self.login(session, users[n]),
+                            think_time=options['think_time'],
+                        ))
+                        stats.update(mode=mode, users=count)
+                        results.append(stats)
+                        self.report(stats)
+                finally:
+                    if server is not None:
+                        stop_server(server)
+        finally:
+            self.cleanup_bookings(users, run_started)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'duration': options['duration'], 'workers': options['workers'], 'results': results},
+                          f, indent=2)
+
+    # Attendee accounts named loadtest-<n>, created on first use and reused after
+    def prepare_users(self, count):
+        existing = set(User.objects.filter(username__startswith='loadtest-').values_list('username', flat=True))
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f"loadtest-{n}", email=f"loadtest-{n}@example.com", password=password, user_type='attendee')
+            for n in range(count) if f"loadtest-{n}" not in existing
+        ])
+        User.objects.filter(username__startswith='loadtest-').update(password=password)
+        return [f"loadtest-{n}" for n in range(count)]
+
+    # -------------------- JOURNEY --------------------
+
+    async def login(self, session, username):
+        # The form page sets the csrftoken cookie the POST needs
+        await session.get('/api/login/')
+        response = await session.post('/api/login/', {'username': username, 'password': PASSWORD})
+        if response.status != 302:
+            raise CommandError(f"Could not log in as {username} (HTTP {response.status}).")
+
+    async def journey(self, session, stats, n):
+        rng = random.Random()
+        event_id = rng.choice(self.event_ids)
+
+        await stats.timed('list', session.get(f'/api/events/events?page={rng.randint(1, 5)}'))
+        await stats.timed('detail', session.get(f'/api/events/{event_id}/'))
+        form = await stats.timed('book_form', session.get(f'/api/events/{event_id}/book/'))
+
+        key = IDEMPOTENCY_KEY.search(form.body)
+        ticket = TICKET_TYPE.search(form.body)
+        if not key or not ticket:
+            raise JourneyError("book_form: no bookable ticket on the page")
+        response = await stats.timed('book', session.post(f'/api/events/{event_id}/book/', {
+            'ticket_type': ticket.group(1).decode(),
+            'quantity': 1,
+            'method': 'mpesa',
+            'idempotency_key': key.group(1).decode(),
+        }), expect=(302,), check=self.check_booked)
+        receipt = RECEIPT.search(response.headers['location'])
+
+        await stats.timed('receipt', session.get(f'/api/receipt/{receipt.group(1)}/'))
+        if self.cancel:
+            # Frees the seat and the user's one active booking for this event
+            await stats.timed('cancel', session.post(f'/api/bookings/{receipt.group(1)}/cancel/', {}), expect=(302,))
+
+    # A booking redirects to its receipt; anything else (back to the form or the
+    # event page) means it was refused: sold out, already booked...
+    @staticmethod
+    def check_booked(response):
+        location = response.headers.get('location', '')
+        if not RECEIPT.search(location):
+            return f"redirected to {location}"
+
+    # -------------------- OUTPUT --------------------
+
+    def report(self, stats):
+        self.stdout.write(
+            f"{stats['mode']}  users={stats['users']:<4} {stats['journeys_per_second']:.1f} journeys/s  "
+            f"completed={stats['journeys']} failed={stats['failed_journeys']}"
+        )
+        for name, step in stats['steps'].items():
+            self.stdout.write(
+                f"  {name:<10} {step['rps']:>8.1f} req/s  p50={step['p50_ms']:.1f}ms "
+                f"p95={step['p95_ms']:.1f}ms p99={step['p99_ms']:.1f}ms  errors={step['errors']} "
+                f"({step['error_rate']:.1%})"
+            )
+        for message, count in stats['top_failures']:
+            self.stdout.write(f"  {count}x {message}")
+
+    # Put back whatever inventory the runs still hold and drop their bookings
+    def cleanup_bookings(self, users, since):
+        created = Booking.objects.filter(user__username__in=users, booked_at__gte=since)
+        for booking in created.filter(status='active'):
+            cancel_booking(booking)
+        created.delete()
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.images import process_pending_images
+
+
+class Command(BaseCommand):
+    help = "Generate image variants for staged event uploads and push them to storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new uploads.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to sleep when the queue is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_images(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} image(s).")
+            if not options['loop']:
+                break
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,105 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a web worker does before it can answer its first request
+STARTUP_SCRIPT = """
+import django
+django.setup()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Start Django the way a web worker does in a fresh interpreter and report import time per module, "
+        "slowest first. Fails when the total goes over --budget-ms."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help="Modules to list.")
+        parser.add_argument('--runs', type=int, default=3,
+                            help="Fresh interpreters to start; the median run is reported.")
+        parser.add_argument('--packages', action='store_true',
+                            help="Group by top-level package instead of listing modules.")
+        parser.add_argument('--budget-ms', type=float, help="Exit with an error if startup imports take longer.")
+        parser.add_argument('--json', dest='json_path', help="Also write the full results to this file.")
+
+    def handle(self, *args, **options):
+        runs = sorted((self.run_once() for _ in range(max(1, options['runs']))), key=lambda run: run[0])
+        # Median run: the first start after a change also pays for disk reads and .pyc writes
+        total_ms, wall_ms, modules = runs[len(runs) // 2]
+
+        if options['packages']:
+            rows = self.by_package(modules)
+            self.stdout.write(f"{'self ms':>9}  {'modules':>7}  package")
+            for row in rows[:options['limit']]:
+                self.stdout.write(f"{row['self_ms']:9.1f}  {row['modules']:7}  {row['package']}")
+        else:
+            rows = sorted(modules, key=lambda module: -module['self_ms'])
+            self.stdout.write(f"{'self ms':>9}  {'cumul ms':>9}  module")
+            for row in rows[:options['limit']]:
+                self.stdout.write(f"{row['self_ms']:9.1f}  {row['cumulative_ms']:9.1f}  {row['module']}")
+        self.stdout.write(
+            f"\n{len(modules)} modules imported in {total_ms:.0f}ms (process wall time {wall_ms:.0f}ms)"
+        )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'total_ms': total_ms, 'wall_ms': wall_ms, 'modules': modules}, f, indent=2)
+
+        if options['budget_ms'] is not None and total_ms > options['budget_ms']:
+            raise CommandError(f"Startup imports took {total_ms:.0f}ms, over the {options['budget_ms']:.0f}ms budget.")
+
+    def run_once(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'event_platform.settings'))
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if result.returncode:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+        modules = self.parse(result.stderr)
+        # Top-level entries are the imports the script made itself; their
+        # cumulative times add up to the whole import phase
+        total_ms = sum(module['cumulative_ms'] for module in modules if module['depth'] == 0)
+        return total_ms, wall_ms, modules
+
+    # Lines look like "import time:       523 |     107817 |       reportlab.graphics.renderPDF"
+    # (microseconds; indentation gives the nesting)
+    @staticmethod
+    def parse(stderr):
+        modules = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules.append({
+                'module': name.strip(),
+                'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+                'self_ms': int(self_us) / 1000,
+                'cumulative_ms': int(cumulative_us) / 1000,
+            })
+        return modules
+
+    @staticmethod
+    def by_package(modules):
+        packages = {}
+        for module in modules:
+            package = packages.setdefault(module['module'].split('.')[0], {'self_ms': 0.0, 'modules': 0})
+            package['self_ms'] += module['self_ms']
+            package['modules'] += 1
+        return sorted(
+            ({'package': name, **totals} for name, totals in packages.items()),
+            key=lambda row: -row['self_ms'],
+        )
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.purge import purge_deleted_events
+
+
+class Command(BaseCommand):
+    help = "Remove the bookings, payments, tickets and receipt files of deleted events in small chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows deleted per transaction.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for newly deleted events.")
+        parser.add_argument('--interval', type=float, default=30.0, help="Seconds to sleep when nothing is left.")
+
+    def handle(self, *args, **options):
+        while True:
+            purged = purge_deleted_events(batch_size=options['batch_size'], limit=1)
+            for event, counts in purged:
+                summary = ', '.join(f"{count} {name}" for name, count in counts.items())
+                self.stdout.write(f"Purged event {event.pk} ({event.title}): {summary}.")
+            if purged:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
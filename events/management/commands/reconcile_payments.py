@@ -0,0 +1,82 @@
+import csv
+import sys
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from events.reconciliation import Reconciler
+
+
+class Command(BaseCommand):
+    help = (
+        "Match a provider settlement report (CSV) against recorded payments: fix payment and booking "
+        "statuses that disagree, settle pending payments the report confirms, and list discrepancies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('settlement', help="Settlement CSV, or - for standard input.")
+        parser.add_argument('--report', help="Write every discrepancy to this CSV file.")
+        parser.add_argument('--batch-size', type=int, default=settings.RECONCILE_BATCH_SIZE,
+                            help="Settlement lines matched per query.")
+        parser.add_argument('--id-column', default='transaction_id')
+        parser.add_argument('--status-column', default='status')
+        parser.add_argument('--amount-column', default='amount', help="Compared when the file has it.")
+        parser.add_argument('--since', type=self.parse_date,
+                            help="Start of the period the report covers (YYYY-MM-DD); with --until, "
+                                 "settled payments of the period missing from the report are listed.")
+        parser.add_argument('--until', type=self.parse_date, help="End of the period (exclusive).")
+        parser.add_argument('--stuck-after', type=int, default=settings.PAYMENT_STUCK_AFTER_MINUTES,
+                            help="Minutes after which an unsettled pending payment counts as stuck.")
+        parser.add_argument('--fail-stuck', action='store_true',
+                            help="Mark stuck payments failed, cancelling their bookings.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report; change nothing.")
+
+    @staticmethod
+    def parse_date(value):
+        try:
+            return timezone.make_aware(datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time.min))
+        except ValueError:
+            raise CommandError(f"Invalid date {value!r}; use YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        report = open(options['report'], 'w', newline='') if options['report'] else None
+        settlement = (
+            sys.stdin if options['settlement'] == '-'
+            else open(options['settlement'], newline='', encoding='utf-8-sig')
+        )
+        reconciler = Reconciler(
+            report=report,
+            batch_size=options['batch_size'],
+            apply=not options['dry_run'],
+            id_column=options['id_column'],
+            status_column=options['status_column'],
+            amount_column=options['amount_column'],
+        )
+        try:
+            rows = csv.DictReader(settlement)
+            if options['id_column'] not in (rows.fieldnames or []) or options['status_column'] not in rows.fieldnames:
+                raise CommandError(
+                    f"The settlement file needs {options['id_column']!r} and {options['status_column']!r} columns."
+                )
+            reconciler.match_file(rows)
+            reconciler.find_unsettled(
+                since=options['since'],
+                until=options['until'],
+                stuck_before=timezone.now() - timedelta(minutes=options['stuck_after']),
+                fail_stuck=options['fail_stuck'],
+            )
+        finally:
+            reconciler.close()
+            if settlement is not sys.stdin:
+                settlement.close()
+            if report:
+                report.close()
+
+        counts = reconciler.counts
+        self.stdout.write(f"{counts['lines']} settlement line(s), {counts['matched']} matched.")
+        for kind in sorted(kind for kind in counts if kind not in ('lines', 'matched')):
+            self.stdout.write(f"  {kind}: {counts[kind]}")
+        if options['dry_run']:
+            self.stdout.write("Dry run: nothing was changed.")
@@ -0,0 +1,172 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from events.authentication import get_or_rotate_token
+from events.inventory import cancel_booking
+from events.loadtest import percentile
+from events.models import Booking, Event, Payment, Ticket, User
+from events.querystats import capture_queries
+
+
+class Command(BaseCommand):
+    help = "Time the main pages and API endpoints in-process and write the results as JSON for comparison between commits."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', help="Comma-separated benchmark names to run.")
+        parser.add_argument('--skip', default='', help="Comma-separated benchmark names to leave out.")
+        parser.add_argument('--output', help="JSON file to write (default benchmarks/<timestamp>-<commit>.json).")
+        parser.add_argument('--compare', help="Earlier results file to print deltas against.")
+
+    def handle(self, *args, **options):
+        attendee = User.objects.filter(user_type='attendee', bookings__isnull=False).first()
+        organizer = User.objects.filter(user_type='organizer', events__isnull=False).first()
+        if attendee is None or organizer is None:
+            raise CommandError("No data to benchmark; run `python manage.py generate_dataset` first.")
+
+        benchmarks = self.benchmarks(attendee, organizer)
+        only = set(options['only'].split(',')) if options['only'] else set(benchmarks)
+        skip = set(filter(None, options['skip'].split(',')))
+
+        results = {}
+        run_started = timezone.now()
+        # The limiter would turn repeated bookings into 429s
+        with override_settings(RATE_LIMIT_ENABLED=False, QUERY_BUDGET_STRICT=False):
+            for name, (client, request) in benchmarks.items():
+                if name not in only or name in skip:
+                    continue
+                results[name] = self.run(client, request, options['iterations'], options['warmup'])
+                stats = results[name]
+                self.stdout.write(
+                    f"{name:<24} mean={stats['mean_ms']:8.1f}ms p50={stats['p50_ms']:8.1f}ms "
+                    f"p95={stats['p95_ms']:8.1f}ms queries={stats['queries']:<5} status={stats['status']}"
+                )
+        self.cleanup_bookings(attendee, run_started)
+
+        report = {'meta': self.metadata(), 'results': results}
+        output = options['output'] or os.path.join(
+            'benchmarks', f"{timezone.now():%Y%m%d-%H%M%S}-{report['meta']['commit'][:8]}.json"
+        )
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results written to {output}")
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    # name -> (client, callable(client, iteration) -> response)
+    def benchmarks(self, attendee, organizer):
+        anonymous = Client()
+        browser = Client()
+        browser.force_login(attendee)
+        dashboard = Client()
+        dashboard.force_login(organizer)
+        api = Client(HTTP_AUTHORIZATION=f"Token {get_or_rotate_token(attendee).key}")
+
+        event = Event.objects.filter(tickets__isnull=False).order_by('-start_time').first()
+        upcoming = list(
+            Ticket.objects.filter(event__start_time__gt=timezone.now(), sold_quantity__lt=1000)
+            .exclude(event__bookings__user=attendee)
+            .order_by('id')
+            .values_list('event_id', 'id')[:500]
+        )
+        bookable = list(dict(upcoming).items())
+
+        def book(client, n):
+            event_id, ticket_id = bookable[n % len(bookable)]
+            return client.post(f'/api/events/{event_id}/book/', {
+                'ticket_type': ticket_id, 'quantity': 1, 'method': 'mpesa',
+                'idempotency_key': uuid.uuid4().hex,
+            })
+
+        return {
+            'event_list': (anonymous, lambda c, n: c.get('/api/events/events', {'page': n % 50 + 1})),
+            'event_list_search': (anonymous, lambda c, n: c.get('/api/events/events', {'q': 'Music'})),
+            'event_detail': (anonymous, lambda c, n: c.get(f'/api/events/{event.pk}/')),
+            'book_event_form': (browser, lambda c, n: c.get(f'/api/events/{event.pk}/book/')),
+            'book_event_submit': (browser, book),
+            'profile': (browser, lambda c, n: c.get('/api/profile/')),
+            'organizer_dashboard': (dashboard, lambda c, n: c.get('/api/organizer/dashboard/')),
+            'api_events': (anonymous, lambda c, n: c.get('/api/api/events/')),
+            'api_event_detail': (anonymous, lambda c, n: c.get(f'/api/api/events/{event.pk}/')),
+            'api_tickets': (anonymous, lambda c, n: c.get('/api/api/tickets/')),
+            'api_bookings': (api, lambda c, n: c.get('/api/api/bookings/')),
+            'api_profile': (api, lambda c, n: c.get('/api/api/profile/')),
+        }
+
+    def run(self, client, request, iterations, warmup):
+        for n in range(warmup):
+            request(client, n)
+        timings, queries, statuses = [], [], set()
+        for n in range(warmup, warmup + iterations):
+            with capture_queries() as stats:
+                started = time.perf_counter()
+                response = request(client, n)
+                timings.append(time.perf_counter() - started)
+            queries.append(stats.count)
+            statuses.add(response.status_code)
+        timings.sort()
+        return {
+            'iterations': iterations,
+            'mean_ms': statistics.mean(timings) * 1000,
+            'p50_ms': percentile(timings, 50) * 1000,
+            'p95_ms': percentile(timings, 95) * 1000,
+            'max_ms': timings[-1] * 1000,
+            'queries': max(queries),
+            'status': ','.join(str(status) for status in sorted(statuses)),
+        }
+
+    # Remove the bookings made by book_event_submit and put their inventory back
+    def cleanup_bookings(self, attendee, since):
+        created = Booking.objects.filter(user=attendee, booked_at__gte=since)
+        for booking in created.filter(status='active'):
+            cancel_booking(booking)
+        created.delete()
+
+    def metadata(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = 'unknown'
+        return {
+            'commit': commit,
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'events': Event.objects.count(),
+                'tickets': Ticket.objects.count(),
+                'bookings': Booking.objects.count(),
+                'payments': Payment.objects.count(),
+            },
+        }
+
+    def compare(self, path, results):
+        with open(path) as f:
+            previous = json.load(f)
+        self.stdout.write(f"\nCompared with {path} ({previous['meta']['commit'][:8]}):")
+        for name, stats in results.items():
+            before = previous['results'].get(name)
+            if not before:
+                continue
+            change = (stats['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+            self.stdout.write(
+                f"{name:<24} p50 {before['p50_ms']:8.1f} -> {stats['p50_ms']:8.1f}ms ({change:+.0f}%)  "
+                f"queries {before['queries']} -> {stats['queries']}"
+            )
@@ -0,0 +1,135 @@
+# Prometheus metrics, served at /metrics. Under gunicorn every worker writes
+# its samples to files in PROMETHEUS_MULTIPROC_DIR (set up by gunicorn.conf.py)
+# and a scrape merges them, so whichever worker answers reports the whole
+# server. Without that directory (runserver, management commands) the
+# metrics live in the process's default registry.
+import hmac
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', "Time spent handling a request, by view.", ['view', 'method'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter('http_requests', "Requests handled, by view and status code.", ['view', 'method', 'status'])
+DB_TIME = Histogram(
+    'db_query_duration_seconds', "Database time per request, by view.", ['view'],
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+DB_QUERIES = Counter('db_queries', "Database queries run, by view.", ['view'])
+CACHE_REQUESTS = Counter('cache_requests', "Cache lookups, by cache and hit/miss.", ['cache', 'result'])
+BOOKINGS = Counter('bookings_created', "Bookings created, by where they came from.", ['source'])
+PAYMENTS = Counter('payments', "Payments created or settled, by method and resulting status.", ['method', 'status'])
+RECEIPT_TIME = Histogram(
+    'receipt_generation_seconds', "Time to draw and store a PDF receipt.", ['kind'],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def record_bookings(source, bookings):
+    BOOKINGS.labels(source).inc(len(bookings))
+
+
+def record_payments(payments):
+    for payment in payments:
+        PAYMENTS.labels(payment.method, payment.status).inc()
+
+
+# Works in both handler modes, so async views under ASGI aren't pushed onto
+# a thread just to be timed
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started)
+
+    @staticmethod
+    def record(request, response, elapsed):
+        # The route, not the path, so ids don't explode the label set
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        REQUEST_LATENCY.labels(view, request.method).observe(elapsed)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        # Filled in by QueryStatsMiddleware further down the stack
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None:
+            DB_TIME.labels(view).observe(stats.db_time)
+            DB_QUERIES.labels(view).inc(stats.count)
+        return response
+
+
+# Backlogs of the background jobs, read from the database at most once per
+# METRICS_QUEUE_DEPTH_TTL whatever the scrape rate. Only cheap indexed
+# counts: the archive backlog would scan the bookings table.
+class QueueCollector:
+    cache_key = 'metrics:queue-depths'
+
+    def depths(self):
+        from .models import Event, WaitlistEntry
+
+        cache = caches[settings.METRICS_CACHE_ALIAS]
+        depths = cache.get(self.cache_key)
+        if depths is None:
+            depths = {
+                'event_images': Event.objects.filter(image_status__in=['pending', 'processing']).count(),
+                'event_purge': Event.all_objects.filter(deleted_at__isnull=False).count(),
+                'waitlist': WaitlistEntry.objects.filter(status='waiting').count(),
+            }
+            cache.set(self.cache_key, depths, timeout=settings.METRICS_QUEUE_DEPTH_TTL)
+        return depths
+
+    def collect(self):
+        depth = GaugeMetricFamily('background_queue_depth', "Work waiting for a background job.", labels=['queue'])
+        for queue, count in self.depths().items():
+            depth.add_metric([queue], count)
+        yield depth
+
+
+def render_metrics():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    queues = CollectorRegistry()
+    queues.register(QueueCollector())
+    return generate_latest(registry) + generate_latest(queues)
+
+
+# Closed unless METRICS_TOKEN is set and sent as a bearer token; staff can
+# also look from a logged-in browser
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+    if not scraper and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
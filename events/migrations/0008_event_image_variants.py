@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_alter_ticket_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='image_card_url',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='image_staged_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='image_status',
+            field=models.CharField(choices=[('none', 'No image'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='image_thumbnail_url',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='image_url',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+    ]
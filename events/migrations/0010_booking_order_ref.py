@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0009_booking_cancellation_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='order_ref',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Max, Min, OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+# Copy ticket.event_id onto bookings one id range at a time, each range in its
+# own short transaction, so a large table is never locked for the whole backfill
+def backfill_booking_event(apps, schema_editor):
+    Booking = apps.get_model('events', 'Booking')
+    Ticket = apps.get_model('events', 'Ticket')
+    bounds = Booking.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return
+    event_of_ticket = Subquery(Ticket.objects.filter(pk=OuterRef('ticket_id')).values('event_id')[:1])
+    for start in range(bounds['low'], bounds['high'] + 1, BATCH_SIZE):
+        with transaction.atomic():
+            Booking.objects.filter(
+                id__gte=start, id__lt=start + BATCH_SIZE, event__isnull=True
+            ).update(event_id=event_of_ticket)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('events', '0012_ticket_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='event',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='events.event'),
+        ),
+        migrations.RunPython(backfill_booking_event, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0013_booking_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckIn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('scanned_at', models.DateTimeField()),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('device', models.CharField(blank=True, max_length=64)),
+                ('source', models.CharField(choices=[('online', 'Online'), ('offline', 'Offline sync')], default='online', max_length=10)),
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='check_in', to='events.booking')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='check_ins', to='events.event')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'scanned_at'], name='events_chec_event_i_416552_idx')],
+            },
+        ),
+    ]
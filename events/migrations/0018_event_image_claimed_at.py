@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0017_request_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='image_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+REPORT_LIMIT = 50
+
+
+# Bookings written by code that predates 0013 while it was being deployed
+def backfill_remaining_booking_events(apps, schema_editor):
+    Booking = apps.get_model('events', 'Booking')
+    Ticket = apps.get_model('events', 'Ticket')
+    Booking.objects.filter(event__isnull=True).update(
+        event_id=Subquery(Ticket.objects.filter(pk=OuterRef('ticket_id')).values('event_id')[:1])
+    )
+
+
+# Users who booked an event more than once before the rule was enforced would
+# break the constraint. Cancelling their extra bookings means refunds and
+# telling customers, so it is not done here: the migration stops and lists the
+# pairs, and `python manage.py cancel_duplicate_bookings` resolves them.
+def check_duplicate_bookings(apps, schema_editor):
+    Booking = apps.get_model('events', 'Booking')
+    duplicates = list(
+        Booking.objects.filter(status='active', order_ref__isnull=True)
+        .values('user_id', 'event_id')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .order_by('user_id', 'event_id')
+        .values_list('user_id', 'event_id', 'total')
+    )
+    if not duplicates:
+        return
+    lines = [
+        f"  user {user_id}, event {event_id}: {total} active bookings"
+        for user_id, event_id, total in duplicates[:REPORT_LIMIT]
+    ]
+    if len(duplicates) > REPORT_LIMIT:
+        lines.append(f"  ... and {len(duplicates) - REPORT_LIMIT} more")
+    raise RuntimeError(
+        f"{len(duplicates)} user/event pair(s) hold more than one active booking:\n" + "\n".join(lines) +
+        "\nResolve them with `python manage.py cancel_duplicate_bookings` and run migrate again."
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0018_event_image_claimed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_remaining_booking_events, migrations.RunPython.noop),
+        migrations.RunPython(check_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='events.event'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('order_ref__isnull', True), ('status', 'active')), fields=('user', 'event'), name='unique_active_booking_per_event'),
+        ),
+    ]
@@ -34,6 +34,12 @@ class Category(models.Model):
         return self.name
 
 
+# Event manager: soft-deleted events are hidden everywhere except all_objects
+class EventManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 # Event model
 class Event(models.Model):
     organizer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='events')
@@ -45,7 +51,41 @@ class Event(models.Model):
     end_time = models.DateTimeField()
     image = CloudinaryField('image', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set when an organizer deletes the event; rows are purged in the background
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = EventManager()
+    all_objects = models.Manager()
+
+    # Image ingestion pipeline (see events/images.py)
+    IMAGE_STATUS_CHOICES = [
+        ('none', 'No image'),
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default='none', db_index=True)
+    # Name of the staged upload in the image storage
+    image_staged_path = models.CharField(max_length=255, blank=True)
+    image_claimed_at = models.DateTimeField(null=True, blank=True)
+    image_url = models.CharField(max_length=500, blank=True)
+    image_card_url = models.CharField(max_length=500, blank=True)
+    image_thumbnail_url = models.CharField(max_length=500, blank=True)
+
+    @property
+    def original_image_url(self):
+        if self.image_url:
+            return self.image_url
+        return self.image.url if self.image else ''
 
+    @property
+    def card_image_url(self):
+        return self.image_card_url or self.original_image_url
+
+    @property
+    def thumbnail_image_url(self):
+        return self.image_thumbnail_url or self.card_image_url
     
     def get_status(self):
         now = timezone.now()
@@ -73,28 +113,98 @@ class Ticket(models.Model):
     type = models.CharField(max_length=20, choices=TICKET_TYPES, default='regular') 
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField()
+    # Quantity held by active bookings; only changed through events/inventory.py
+    sold_quantity = models.PositiveIntegerField(default=0)
+    # 0 = single-row counter; N > 0 = availability is spread across N TicketShard rows
+    shard_count = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(default=timezone.now)
 
 
+    @property
+    def is_sharded(self):
+        return self.shard_count > 0
+
     @property
     def remaining_quantity(self):
-        booked = self.booking_set.aggregate(total=models.Sum('quantity'))['total'] or 0
-        return self.quantity - booked
+        # Set by inventory.with_availability() to avoid a query per ticket
+        annotated = self.__dict__.get('available_quantity')
+        if annotated is not None:
+            return annotated
+        if self.is_sharded:
+            return self.shards.aggregate(total=models.Sum('available'))['total'] or 0
+        return self.quantity - self.sold_quantity
+
+    @property
+    def tickets_sold(self):
+        if self.is_sharded:
+            return self.quantity - self.remaining_quantity
+        return self.sold_quantity
     def __str__(self):
         return f"{self.name} ({self.get_type_display()})"
    
+# Ticket shard model (hot tiers): each row holds part of the remaining quantity
+class TicketShard(models.Model):
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    available = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ticket', 'index'], name='unique_ticket_shard_index'),
+        ]
+
+    def __str__(self):
+        return f"{self.ticket} shard {self.index} ({self.available})"
+
+
 # Booking model
 class Booking(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE)
+    # Copy of ticket.event so per-event lookups skip the join; set in save()
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='bookings')
     quantity = models.PositiveIntegerField()
     booked_at = models.DateTimeField(auto_now_add=True)
     payment_status = models.CharField(max_length=20, choices=[
         ('pending', 'Pending'),
         ('paid', 'Paid'),
-        ('failed', 'Failed')
+        ('failed', 'Failed'),
+        ('refunded', 'Refunded')
     ], default='pending')
+    status = models.CharField(max_length=20, choices=[
+        ('active', 'Active'),
+        ('cancelled', 'Cancelled')
+    ], default='active')
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+    # Shared by all bookings written by one cart checkout
+    order_ref = models.UUIDField(null=True, blank=True, db_index=True)
     receipt_file = models.FileField(upload_to='receipts/', null=True, blank=True) 
+
+    class Meta:
+        constraints = [
+            # One active booking per user per event. A cart checkout's rows
+            # (order_ref set) may cover several tiers of the same event, so
+            # they are exempt here and the rule is checked in code for every
+            # path (inventory.ensure_not_booked)
+            models.UniqueConstraint(
+                fields=['user', 'event'],
+                condition=models.Q(status='active', order_ref__isnull=True),
+                name='unique_active_booking_per_event',
+            ),
+        ]
+
+    is_archived = False
+
+    @property
+    def is_active(self):
+        return self.status == 'active'
+
+    def save(self, *args, **kwargs):
+        # bulk_create skips this, so callers using it set event themselves
+        if self.ticket_id and (self.event_id is None or Booking.ticket.is_cached(self)):
+            self.event_id = self.ticket.event_id
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username} - {self.ticket.event.title}"
     
@@ -108,7 +218,8 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, choices=[
         ('successful', 'Successful'),
         ('failed', 'Failed'),
-        ('pending', 'Pending')
+        ('pending', 'Pending'),
+        ('refunded', 'Refunded')
     ], default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -116,3 +227,145 @@ class Payment(models.Model):
         return f"{self.transaction_id} - {self.status}"
 
 
+# Waitlist model
+class WaitlistEntry(models.Model):
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('promoted', 'Promoted'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='waitlist')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    quantity = models.PositiveIntegerField(default=1)
+    method = models.CharField(max_length=50, default='mpesa')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
+    booking = models.OneToOneField(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entry')
+    created_at = models.DateTimeField(auto_now_add=True)
+    promoted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ticket', 'status', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ticket', 'user'],
+                condition=models.Q(status='waiting'),
+                name='unique_waiting_entry_per_ticket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} waiting for {self.ticket} ({self.quantity})"
+
+
+
+
+# Idempotency key model
+# One row per (user, scope, key). status_code is NULL while the first request
+# is still running; afterwards the stored response is replayed to retries.
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+
+
+# Check-in model
+# Written by events/checkin.py; one row per admitted booking, and the
+# unique booking is what stops a ticket being admitted twice
+class CheckIn(models.Model):
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='check_in')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='check_ins')
+    quantity = models.PositiveIntegerField()
+    scanned_at = models.DateTimeField()
+    recorded_at = models.DateTimeField(auto_now_add=True)
+    device = models.CharField(max_length=64, blank=True)
+    source = models.CharField(max_length=10, choices=[
+        ('online', 'Online'),
+        ('offline', 'Offline sync')
+    ], default='online')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event', 'scanned_at']),
+        ]
+
+    def __str__(self):
+        return f"Booking #{self.booking_id} checked in at {self.scanned_at}"
+
+
+# Archive models
+# Bookings and payments of events that ended more than ARCHIVE_AFTER_DAYS ago
+# are moved here by events/archive.py, keeping their original ids, so the hot
+# Booking/Payment tables only hold live and recent events.
+class ArchivedBooking(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='archived_bookings')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='archived_bookings')
+    quantity = models.PositiveIntegerField()
+    booked_at = models.DateTimeField()
+    payment_status = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+    order_ref = models.UUIDField(null=True, blank=True, db_index=True)
+    receipt_file = models.FileField(upload_to='receipts/', null=True, blank=True)
+    checked_in_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    @property
+    def is_active(self):
+        return self.status == 'active'
+
+    def __str__(self):
+        return f"{self.user.username} - {self.event.title} (archived)"
+
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    booking = models.OneToOneField(ArchivedBooking, on_delete=models.CASCADE, related_name='payment')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    method = models.CharField(max_length=50)
+    transaction_id = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.transaction_id} - {self.status} (archived)"
+
+
+# Request profile model
+# One staff-requested profiled request (events/profiling.py): cProfile stats
+# plus the SQL it ran, with EXPLAIN output for the slow statements.
+class RequestProfile(models.Model):
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='request_profiles')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    db_ms = models.FloatField()
+    stats = models.TextField()
+    queries = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f}ms)"
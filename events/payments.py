@@ -0,0 +1,226 @@
+# Payment gateways. Checkout writes bookings as `pending` with a pending
+# Payment and, once that transaction commits, asks the method's provider to
+# start a charge; the provider answers straight away and reports the outcome
+# later through its webhook (/api/api/payments/webhook/<provider>/), so no
+# worker waits on it. apply_payment_result() moves a pending payment to
+# successful (booking paid, receipt generated) or failed (booking cancelled,
+# seats released). Notifications for a payment that already left `pending`
+# change nothing, so providers can retry and replay them freely; the one
+# exception is a success for a charge we had given up on, which is refunded.
+# Reconciliation corrects settled payments through the same settle_payment(),
+# and expire_pending_payments() fails charges whose outcome never arrived.
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .inventory import cancel_booking
+from .metrics import record_payments
+from .models import Booking, Payment
+from .utils import generate_order_receipt_pdf, generate_receipt_pdf
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidWebhook(Exception):
+    pass
+
+
+# Each provider starts charges without blocking on the result and turns its
+# webhook requests into (transaction_id, succeeded) pairs
+class PaymentProvider:
+    def __init__(self, name):
+        self.name = name
+
+    def start_charge(self, payment):
+        raise NotImplementedError
+
+    def refund(self, payment):
+        raise NotImplementedError
+
+    def parse_webhook(self, body, headers):
+        raise NotImplementedError
+
+
+def sign_payload(body):
+    secret = settings.PAYMENT_WEBHOOK_SECRET or settings.SECRET_KEY
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+# Local stand-in for a real gateway: every charge is settled
+# PAYMENT_SIMULATOR_DELAY seconds later by a signed notification that goes
+# through the same parsing and handling as a webhook request
+class SimulatedGateway(PaymentProvider):
+    signature_header = 'X-Simulator-Signature'
+
+    def start_charge(self, payment):
+        succeeded = random.random() >= settings.PAYMENT_SIMULATOR_FAILURE_RATE
+        timer = threading.Timer(settings.PAYMENT_SIMULATOR_DELAY, self.notify, args=(payment.transaction_id, succeeded))
+        timer.daemon = True
+        timer.start()
+
+    def refund(self, payment):
+        logger.info("Simulated refund of %s (KES %s)", payment.transaction_id, payment.amount)
+
+    def notify(self, reference, succeeded):
+        body = json.dumps({'transaction_id': reference, 'status': 'succeeded' if succeeded else 'failed'}).encode()
+        try:
+            handle_webhook(self.name, body, {self.signature_header: sign_payload(body)})
+        except Exception:
+            logger.exception("Simulated notification for %s failed", reference)
+        finally:
+            close_old_connections()
+
+    def parse_webhook(self, body, headers):
+        if not hmac.compare_digest(headers.get(self.signature_header, ''), sign_payload(body)):
+            raise InvalidWebhook("Bad signature.")
+        try:
+            data = json.loads(body)
+            return [(str(data['transaction_id']), data['status'] == 'succeeded')]
+        except (ValueError, KeyError, TypeError):
+            raise InvalidWebhook("Malformed notification.")
+
+
+@lru_cache(maxsize=None)
+def get_provider(name):
+    return import_string(settings.PAYMENT_PROVIDERS[name])(name)
+
+
+def provider_for(method):
+    return get_provider(settings.PAYMENT_METHOD_PROVIDERS.get(method, settings.PAYMENT_DEFAULT_PROVIDER))
+
+
+# Start charging `payments` once the current transaction commits (right away
+# outside one). A charge that can't be started stays pending; the user can
+# retry it from their profile.
+def start_payments(payments):
+    def start():
+        for payment in payments:
+            try:
+                provider_for(payment.method).start_charge(payment)
+            except Exception:
+                logger.exception("Could not start payment %s", payment.transaction_id)
+    transaction.on_commit(start)
+
+
+# Give back the money taken for `payments` once the current transaction
+# commits. A refund the provider refuses is logged; reconciliation reports
+# the payment until the provider's settlement shows it refunded.
+def refund_payments(payments):
+    def refund():
+        for payment in payments:
+            try:
+                provider_for(payment.method).refund(payment)
+            except Exception:
+                logger.exception("Could not refund payment %s", payment.transaction_id)
+    transaction.on_commit(refund)
+
+
+def handle_webhook(provider_name, body, headers):
+    results = get_provider(provider_name).parse_webhook(body, headers)
+    return [apply_payment_result(reference, succeeded) for reference, succeeded in results]
+
+
+def apply_payment_result(reference, succeeded):
+    return settle_payment(reference, 'successful' if succeeded else 'failed', only_pending=True)
+
+
+# Move a payment to `status` ('successful', 'failed' or 'refunded') with
+# everything that goes with it: a paid booking gets its receipt, a failed
+# or refunded one is cancelled and its seats released, and money taken for a
+# booking that was cancelled meanwhile is refunded. Webhooks only settle
+# pending payments (only_pending); reconciliation also corrects settled ones.
+def settle_payment(reference, status, only_pending=False):
+    found = Payment.objects.select_related('booking').filter(transaction_id=reference).first()
+    if found is None:
+        logger.warning("Payment notification for unknown transaction %s", reference)
+        return None
+    order_ref = found.booking.order_ref
+
+    with transaction.atomic():
+        # Booking rows first, like cancel_booking. Locking the whole order makes
+        # its notifications take turns, so exactly one sees the order complete.
+        bookings = Booking.objects.select_for_update().select_related('ticket')
+        if order_ref:
+            locked = list(bookings.filter(order_ref=order_ref).order_by('pk'))
+            booking = next(booking for booking in locked if booking.pk == found.booking_id)
+        else:
+            booking = bookings.get(pk=found.booking_id)
+        payment = Payment.objects.select_for_update().get(pk=found.pk)
+        # A charge expired by the sweeper may still succeed; it is then refunded
+        late_success = payment.status == 'failed' and status == 'successful'
+        if payment.status == status or (only_pending and payment.status != 'pending' and not late_success):
+            return payment
+
+        if status == 'successful' and booking.status == 'cancelled':
+            # Cancelled while the charge was in flight: give the money back
+            payment.status = 'refunded'
+            booking.payment_status = 'refunded'
+            refund_payments([payment])
+        elif status == 'successful':
+            payment.status = 'successful'
+            booking.payment_status = 'paid'
+            if not order_ref and not booking.receipt_file:
+                transaction.on_commit(lambda: generate_receipt_pdf(booking, payment))
+        else:
+            payment.status = status
+            booking.payment_status = status
+        payment.save(update_fields=['status'])
+        booking.save(update_fields=['payment_status'])
+        if status != 'successful' and booking.status == 'active':
+            cancel_booking(booking)
+
+        if order_ref and not Booking.objects.filter(order_ref=order_ref, status='active', payment_status='pending').exists():
+            transaction.on_commit(lambda: issue_order_receipt(order_ref))
+    record_payments([payment])
+    return payment
+
+
+# Run periodically (python manage.py expire_payments --loop) so no booking
+# holds seats on a charge whose outcome never arrives, e.g. a notification
+# lost with a restarted worker. Charges pending longer than
+# PAYMENT_STUCK_AFTER_MINUTES are failed; waitlist bookings are charged only
+# once their owner pays, so they get WAITLIST_PAYMENT_WINDOW_MINUTES from
+# promotion instead, after which the seats go to the next people waiting.
+# Failing goes through apply_payment_result, which cancels the booking and
+# releases its seats.
+def expire_pending_payments(batch_size=500, now=None):
+    now = now or timezone.now()
+    stuck = Q(
+        booking__waitlist_entry__isnull=True,
+        created_at__lt=now - timedelta(minutes=settings.PAYMENT_STUCK_AFTER_MINUTES),
+    )
+    unpaid = Q(booking__waitlist_entry__promoted_at__lt=now - timedelta(minutes=settings.WAITLIST_PAYMENT_WINDOW_MINUTES))
+    references = list(
+        Payment.objects.filter(stuck | unpaid, status='pending')
+        .order_by('created_at')
+        .values_list('transaction_id', flat=True)[:batch_size]
+    )
+    for reference in references:
+        apply_payment_result(reference, False)
+    return references
+
+
+# One combined receipt shared by the paid bookings of an order
+def issue_order_receipt(order_ref):
+    bookings = list(
+        Booking.objects.filter(order_ref=order_ref, payment_status='paid')
+        .select_related('user', 'ticket__event', 'payment')
+        .order_by('pk')
+    )
+    if not bookings:
+        return
+    receipt_name = generate_order_receipt_pdf(
+        order_ref, bookings[0].user, bookings, [booking.payment for booking in bookings],
+    )
+    Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).update(receipt_file=receipt_name)
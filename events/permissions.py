@@ -3,4 +3,14 @@ from rest_framework.permissions import BasePermission
 
 class IsOrganizer(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.user_type == 'organizer'
\ No newline at end of file
+        return request.user.is_authenticated and request.user.user_type == 'organizer'
+
+# Scanners at the venue door: site staff, or the organizer of the event
+# being scanned
+class IsDoorStaff(BasePermission):
+    def has_permission(self, request, view):
+        user = request.user
+        return user.is_authenticated and (user.is_staff or user.user_type == 'organizer')
+
+    def has_object_permission(self, request, view, event):
+        return request.user.is_staff or event.organizer_id == request.user.pk
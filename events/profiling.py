@@ -0,0 +1,140 @@
+# On-demand profiling of a single request. A staff user adds ?_profile=1 (or
+# an X-Profile header) and that request runs under cProfile with every SQL
+# statement timed; statements slower than PROFILE_EXPLAIN_THRESHOLD_MS are
+# EXPLAINed afterwards. The result is saved as a RequestProfile, viewable in
+# the admin. Requests without the switch only pay for two dict lookups.
+import cProfile
+import io
+import pstats
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection
+
+from .models import RequestProfile
+from .querystats import observe_queries
+
+
+class SQLRecorder:
+    def __init__(self):
+        self.queries = []
+
+    # observe_queries hook
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': None if many else params,
+                'ms': (time.perf_counter() - started) * 1000,
+            })
+
+
+def explain(sql, params):
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}", params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+# Only reads are re-run under EXPLAIN, and only when they were slow
+def explain_slow_queries(queries, threshold_ms):
+    for query in queries:
+        if query['ms'] < threshold_ms or not query['sql'].lstrip().upper().startswith('SELECT'):
+            continue
+        try:
+            query['explain'] = explain(query['sql'], query['params'])
+        except Exception as exc:
+            query['explain'] = f"EXPLAIN failed: {exc}"
+    for query in queries:
+        query['params'] = [str(param) for param in query['params'] or ()]
+    return queries
+
+
+def format_stats(profiler, lines):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(lines)
+    return output.getvalue()
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def requested(request):
+        return settings.PROFILING_ENABLED and (
+            settings.PROFILE_QUERY_PARAM in request.GET or settings.PROFILE_HEADER in request.headers
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.requested(request) and request.user.is_staff:
+            return self.profile(request, request.user)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.requested(request):
+            user = await request.auser()
+            if user.is_staff:
+                return await self.aprofile(request, user)
+        return await self.get_response(request)
+
+    # `user` is the staff member who asked: DRF views replace request.user
+    # with whoever their own authentication finds (anonymous, for a session
+    # on a token-only API)
+    def profile(self, request, user):
+        recorder = SQLRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with observe_queries(recorder, using=DEFAULT_DB_ALIAS):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+        return self.save(request, user, response, recorder, profiler, duration_ms)
+
+    # Under ASGI the profile also samples whatever else the event loop ran
+    # while this request was waiting
+    async def aprofile(self, request, user):
+        recorder = SQLRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with observe_queries(recorder, using=DEFAULT_DB_ALIAS):
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+        # EXPLAIN and the RequestProfile insert are database work
+        return await sync_to_async(self.save)(request, user, response, recorder, profiler, duration_ms)
+
+    def save(self, request, user, response, recorder, profiler, duration_ms):
+        queries = explain_slow_queries(recorder.queries, settings.PROFILE_EXPLAIN_THRESHOLD_MS)
+        match = request.resolver_match
+        profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            view_name=match.view_name if match else '',
+            status_code=response.status_code,
+            duration_ms=duration_ms,
+            query_count=len(queries),
+            db_ms=sum(query['ms'] for query in queries),
+            stats=format_stats(profiler, settings.PROFILE_STATS_LINES),
+            queries=queries,
+        )
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
@@ -0,0 +1,152 @@
+# Pub/sub fan-out for live ticket availability.
+# A channel holds only its latest message (availability is a snapshot, so
+# intermediate values can be dropped). Subscribers wait for a version newer
+# than the one they last saw, which means one publish reaches every viewer
+# in the process without any of them querying the database.
+import asyncio
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LocalBroker:
+    # Publishes reach other processes
+    shared = False
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._latest = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload, version=None):
+        with self._condition:
+            current = self._latest.get(channel, (0, None))[0]
+            version = version if version is not None else max(time.time_ns(), current + 1)
+            if version <= current:
+                return current
+            self._latest[channel] = (version, payload)
+            self._condition.notify_all()
+        return version
+
+    def latest(self, channel):
+        return self._latest.get(channel)
+
+    def subscribe(self, channel):
+        with self._lock:
+            self._subscribers[channel] = self._subscribers.get(channel, 0) + 1
+
+    def unsubscribe(self, channel):
+        with self._lock:
+            count = self._subscribers.get(channel, 0) - 1
+            if count > 0:
+                self._subscribers[channel] = count
+            else:
+                self._subscribers.pop(channel, None)
+
+    # The `channels` someone is viewing, so publishers can skip the rest
+    def subscribed(self, channels):
+        return {channel for channel in channels if channel in self._subscribers}
+
+    # Wait for the channel to move past `version`: a cheap in-memory check per tick
+    async def await_change(self, channel, version, timeout, tick=0.25):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            latest = self._latest.get(channel)
+            if latest and latest[0] > version:
+                return latest
+            await asyncio.sleep(tick)
+        return None
+
+
+# Multi-worker stand-in: publishes also go to the shared cache, and one poller
+# thread per process copies newer versions of the channels it has viewers for
+# into the local broker. Cost is one cache read per channel per interval per
+# process, regardless of how many viewers are connected. The poller also keeps
+# a marker per viewed channel alive in the cache, so publishers in any process
+# can tell whether a channel has viewers anywhere.
+class CacheBroker(LocalBroker):
+    shared = True
+
+    def __init__(self, alias=None, interval=None):
+        super().__init__()
+        self.cache = caches[alias or settings.PUBSUB_CACHE_ALIAS]
+        self.interval = interval or settings.PUBSUB_POLL_INTERVAL
+        self._poller = None
+
+    @staticmethod
+    def _key(channel):
+        return f"pubsub:{channel}"
+
+    @staticmethod
+    def _subscribers_key(channel):
+        return f"pubsub-subscribers:{channel}"
+
+    def _mark_subscribed(self, channels):
+        self.cache.set_many(
+            {self._subscribers_key(channel): True for channel in channels},
+            timeout=settings.PUBSUB_SUBSCRIBER_TTL,
+        )
+
+    def publish(self, channel, payload, version=None):
+        version = super().publish(channel, payload, version)
+        self.cache.set(self._key(channel), (version, payload), timeout=settings.PUBSUB_MESSAGE_TTL)
+        return version
+
+    def latest(self, channel):
+        local = super().latest(channel)
+        shared = self.cache.get(self._key(channel))
+        if shared and (not local or shared[0] > local[0]):
+            super().publish(channel, shared[1], shared[0])
+            return shared
+        return local
+
+    # Writes the marker: call it from a thread, not the event loop
+    def subscribe(self, channel):
+        super().subscribe(channel)
+        self._mark_subscribed([channel])
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='pubsub-poller', daemon=True)
+                self._poller.start()
+
+    # Viewed here, or anywhere a marker is still alive. Unsubscribing leaves
+    # the marker to expire: other processes may still have viewers.
+    def subscribed(self, channels):
+        local = super().subscribed(channels)
+        rest = [channel for channel in channels if channel not in local]
+        found = self.cache.get_many([self._subscribers_key(channel) for channel in rest]) if rest else {}
+        return local | {channel for channel in rest if self._subscribers_key(channel) in found}
+
+    def _poll(self):
+        marked = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                channels = list(self._subscribers)
+            if not channels:
+                continue
+            if time.monotonic() - marked > settings.PUBSUB_SUBSCRIBER_TTL / 3:
+                self._mark_subscribed(channels)
+                marked = time.monotonic()
+            found = self.cache.get_many([self._key(channel) for channel in channels])
+            for channel in channels:
+                shared = found.get(self._key(channel))
+                if shared:
+                    LocalBroker.publish(self, channel, shared[1], shared[0])
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.PUBSUB_BROKER)()
+
+
+# Pages stream availability only under ASGI (an open stream holds a sync
+# worker for its whole life) and with a shared broker (a process-local one
+# misses other workers' bookings). Otherwise they poll /api/api/availability/.
+def live_availability_streams():
+    return settings.ASYNC_CATALOG_VIEWS and get_broker().shared
@@ -0,0 +1,99 @@
+# Deleting an event only stamps deleted_at; the rows and files behind it are
+# removed here, a bounded chunk per transaction, so neither the request nor
+# the purge job ever holds long locks or loads a whole event's history.
+import logging
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .fragments import bump_event
+from .models import ArchivedBooking, Booking, CheckIn, Event, Ticket, TicketShard, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+
+def soft_delete_event(event):
+    Event.objects.filter(pk=event.pk).update(deleted_at=timezone.now())
+    # update() sends no signals
+    transaction.on_commit(lambda: bump_event(event.pk, catalog=True))
+
+
+def _delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception:
+            logger.warning("Could not delete receipt %s", name, exc_info=True)
+
+
+def _order_receipt_name(order_ref):
+    return f"receipts/receipt_order_{order_ref}.pdf"
+
+
+# Delete up to batch_size bookings (hot or archived; their payments and
+# check-ins cascade within the chunk) and return how many went
+def _purge_booking_chunk(queryset, batch_size):
+    with transaction.atomic():
+        rows = list(queryset.order_by('pk').values_list('pk', 'receipt_file', 'order_ref')[:batch_size])
+        if not rows:
+            return 0
+        queryset.model.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+
+        files = [receipt for _, receipt, _ in rows if receipt]
+        # An order receipt goes once no booking of that order is left (orders can span events)
+        order_refs = {order_ref for _, _, order_ref in rows if order_ref}
+        if order_refs:
+            remaining = set(Booking.objects.filter(order_ref__in=order_refs).values_list('order_ref', flat=True))
+            remaining |= set(ArchivedBooking.objects.filter(order_ref__in=order_refs).values_list('order_ref', flat=True))
+            files += [_order_receipt_name(order_ref) for order_ref in order_refs - remaining]
+        # Files go only once the rows pointing at them are gone for good
+        transaction.on_commit(lambda: _delete_files(files))
+    return len(rows)
+
+
+def _purge_chunk(queryset, batch_size):
+    with transaction.atomic():
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if ids:
+            queryset.model.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def purge_event(event, batch_size=500):
+    counts = {'bookings': 0, 'archived_bookings': 0, 'waitlist': 0, 'check_ins': 0, 'shards': 0, 'tickets': 0}
+    for key, queryset in (
+        ('bookings', Booking.objects.filter(event=event)),
+        ('archived_bookings', ArchivedBooking.objects.filter(event=event)),
+    ):
+        while True:
+            purged = _purge_booking_chunk(queryset, batch_size)
+            if not purged:
+                break
+            counts[key] += purged
+
+    for key, queryset in (
+        ('waitlist', WaitlistEntry.objects.filter(ticket__event=event)),
+        ('check_ins', CheckIn.objects.filter(event=event)),
+        ('shards', TicketShard.objects.filter(ticket__event=event)),
+        ('tickets', Ticket.objects.filter(event=event)),
+    ):
+        while True:
+            purged = _purge_chunk(queryset, batch_size)
+            if not purged:
+                break
+            counts[key] += purged
+
+    # Nothing large is left to cascade, so the event row itself is cheap now
+    Event.all_objects.filter(pk=event.pk).delete()
+    return counts
+
+
+def purge_deleted_events(batch_size=500, limit=None):
+    events = Event.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+    purged = []
+    for event in events[:limit] if limit else events:
+        counts = purge_event(event, batch_size)
+        logger.info("Purged event %s: %s", event.pk, counts)
+        purged.append((event, counts))
+    return purged
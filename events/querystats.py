@@ -0,0 +1,186 @@
+# Per-request database instrumentation: query count, DB time and repeated SQL
+# (the usual N+1 signature), reported as a Server-Timing header and one
+# structured log line per request. Views can declare a budget with
+# @query_budget or in settings.QUERY_BUDGETS (by URL name); going over it logs
+# a warning, or raises when QUERY_BUDGET_STRICT is on (tests).
+import contextvars
+import functools
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+    # connection.execute_wrapper hook; runs around every query
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def db_ms(self):
+        return self.db_time * 1000
+
+    # Same SQL (with different parameters) run more than once in one request
+    def duplicates(self, limit=5):
+        return [(sql, count) for sql, count in self.statements.most_common(limit) if count > 1]
+
+    def as_dict(self):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.db_ms, 2),
+            'duplicate_queries': sum(count - 1 for count in self.statements.values() if count > 1),
+        }
+
+
+# Every connection carries one permanent execute wrapper that hands each
+# query to the observers active in the current context. Connections belong
+# to a thread, but a contextvar follows an async request into the threads
+# sync_to_async runs its queries on, which connection.execute_wrapper() can't.
+_observers = contextvars.ContextVar('query_observers', default=())
+
+
+def _run_observers(execute, sql, params, many, context):
+    alias = context['connection'].alias
+    for observer, aliases in _observers.get():
+        if aliases is None or alias in aliases:
+            execute = functools.partial(observer, execute)
+    return execute(sql, params, many, context)
+
+
+# Also run for every new connection (events/signals.py)
+def install_query_observer(connection):
+    if _run_observers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_run_observers)
+
+
+# Pass the queries run inside the block (on `using`, or every database) to
+# an execute_wrapper-style callable
+@contextmanager
+def observe_queries(observer, using=None):
+    aliases = None if using is None else {using}
+    for alias in aliases or connections:
+        install_query_observer(connections[alias])
+    token = _observers.set(_observers.get() + ((observer, aliases),))
+    try:
+        yield observer
+    finally:
+        _observers.reset(token)
+
+
+class capture_queries:
+    def __init__(self, using=None):
+        self.using = using
+        self.stats = QueryStats()
+
+    def __enter__(self):
+        self._observing = observe_queries(self.stats, self.using)
+        return self._observing.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._observing.__exit__(*exc_info)
+
+
+def query_budget(max_queries=None, max_db_ms=None):
+    def decorator(view):
+        view.query_budget = {'queries': max_queries, 'db_ms': max_db_ms}
+        return view
+    return decorator
+
+
+def budget_violations(stats, budget):
+    violations = []
+    if budget.get('queries') is not None and stats.count > budget['queries']:
+        violations.append(f"{stats.count} queries (budget {budget['queries']})")
+    if budget.get('db_ms') is not None and stats.db_ms > budget['db_ms']:
+        violations.append(f"{stats.db_ms:.1f}ms in the database (budget {budget['db_ms']}ms)")
+    return violations
+
+
+class QueryStatsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with capture_queries() as stats:
+            response = self.get_response(request)
+        return self.report(request, response, stats, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with capture_queries() as stats:
+            response = await self.get_response(request)
+        return self.report(request, response, stats, started)
+
+    def report(self, request, response, stats, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        request.query_stats = stats
+
+        if settings.QUERY_STATS_HEADER:
+            response['Server-Timing'] = (
+                f'db;dur={stats.db_ms:.1f};desc="{stats.count} queries", app;dur={total_ms:.1f}'
+            )
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        record = dict(
+            stats.as_dict(),
+            method=request.method,
+            path=request.path,
+            view=view_name,
+            status=response.status_code,
+            total_ms=round(total_ms, 2),
+        )
+        logger.info(json.dumps(record))
+
+        budget = self.get_budget(match)
+        violations = budget_violations(stats, budget) if budget else []
+        if violations:
+            message = f"Query budget exceeded for {view_name}: {'; '.join(violations)}"
+            for sql, count in stats.duplicates():
+                message += f"\n  {count}x {sql}"
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'query_stats': record})
+        return response
+
+    @staticmethod
+    def get_budget(match):
+        if match is None:
+            return None
+        configured = settings.QUERY_BUDGETS.get(match.url_name)
+        if configured is not None:
+            return configured
+        view = match.func
+        # @query_budget on a function view, or a query_budget attribute on a class-based view
+        view_class = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+        return getattr(view, 'query_budget', None) or getattr(view_class, 'query_budget', None)
@@ -0,0 +1,181 @@
+# Token-bucket rate limiting for the booking and auth endpoints.
+# Each (scope, user-or-IP) pair gets a bucket of `burst` tokens that refills at
+# `rate` tokens per `per` seconds; a request spends one token or is refused with
+# 429 and a Retry-After. Buckets live in the shared cache so every worker sees
+# the same counts. On Redis the read-refill-spend step is a single Lua script;
+# on other backends it runs under a process lock, which is exact for the
+# per-process caches (locmem) and close enough for memcached/db caches.
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.throttling import BaseThrottle
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ttl)
+return {allowed, tostring(tokens)}
+"""
+
+
+class TokenBucket:
+    def __init__(self, scope, rate, per, burst=None):
+        self.scope = scope
+        self.refill = rate / per
+        self.burst = burst or rate
+        # A bucket idle for this long is full again, so the key can expire
+        self.ttl = max(1, math.ceil(self.burst / self.refill))
+
+    def retry_after(self, tokens):
+        return max(0.0, (1 - tokens) / self.refill)
+
+    # Returns (allowed, seconds until the next token)
+    def consume(self, limiter, identity):
+        key = f"ratelimit:{self.scope}:{identity}"
+        allowed, tokens = limiter.spend(key, self)
+        return allowed, 0.0 if allowed else self.retry_after(tokens)
+
+
+class RateLimiter:
+    def __init__(self, alias=None):
+        self.cache = caches[alias or settings.RATE_LIMIT_CACHE_ALIAS]
+        self._lock = threading.Lock()
+        self._redis = self._redis_client()
+        self._script = self._redis.register_script(TOKEN_BUCKET_LUA) if self._redis else None
+
+    # Redis client behind Django's RedisCache or django-redis, if either is in use
+    def _redis_client(self):
+        try:
+            if hasattr(self.cache, 'client') and hasattr(self.cache.client, 'get_client'):
+                return self.cache.client.get_client(write=True)
+            if hasattr(self.cache, '_cache') and hasattr(self.cache._cache, 'get_client'):
+                return self.cache._cache.get_client(None, write=True)
+        except Exception:
+            return None
+        return None
+
+    def spend(self, key, bucket):
+        now = time.time()
+        if self._script is not None:
+            allowed, tokens = self._script(
+                keys=[self.cache.make_and_validate_key(key)],
+                args=[bucket.refill, bucket.burst, now, bucket.ttl],
+            )
+            return bool(allowed), float(tokens)
+
+        with self._lock:
+            tokens, ts = self.cache.get(key) or (bucket.burst, now)
+            tokens = min(bucket.burst, tokens + max(0.0, now - ts) * bucket.refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.cache.set(key, (tokens, now), timeout=bucket.ttl)
+        return allowed, tokens
+
+
+_limiter = None
+_buckets = {}
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
+
+
+def get_bucket(scope):
+    bucket = _buckets.get(scope)
+    if bucket is None:
+        bucket = _buckets[scope] = TokenBucket(scope, **settings.RATE_LIMITS[scope])
+    return bucket
+
+
+# Behind the platform router REMOTE_ADDR is the router, which would put every
+# anonymous client in one bucket. Each of the RATE_LIMIT_PROXY_HOPS proxies
+# appends the address it saw to X-Forwarded-For, so the client is that many
+# entries from the end; anything before it is client-supplied and spoofable.
+def client_ip(request):
+    hops = settings.RATE_LIMIT_PROXY_HOPS
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if hops and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',') if address.strip()]
+        if addresses:
+            return addresses[-min(hops, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+# Signed-in users are limited per account, everyone else per address
+def request_identity(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{client_ip(request)}"
+
+
+def check_rate(request, scope):
+    if not settings.RATE_LIMIT_ENABLED or request.method in SAFE_METHODS:
+        return True, 0.0
+    return get_bucket(scope).consume(get_limiter(), request_identity(request))
+
+
+# -------------------- DRF --------------------
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def get_scope(self, view):
+        return self.scope or getattr(view, 'rate_limit_scope', None)
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        if scope is None:
+            return True
+        allowed, self.retry_after = check_rate(request, scope)
+        return allowed
+
+    def wait(self):
+        return math.ceil(self.retry_after)
+
+
+class BookingRateThrottle(TokenBucketThrottle):
+    scope = 'booking'
+
+
+class AuthRateThrottle(TokenBucketThrottle):
+    scope = 'auth'
+
+
+# -------------------- HTML VIEWS --------------------
+
+def rate_limited(scope):
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            allowed, retry_after = check_rate(request, scope)
+            if not allowed:
+                response = HttpResponse("Too many requests. Please wait a moment and try again.", status=429)
+                response['Retry-After'] = str(math.ceil(retry_after))
+                return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,207 @@
+# Payment reconciliation against a provider's settlement report: a CSV with a
+# transaction id and status per line (and optionally the amount). The file is
+# streamed in batches of RECONCILE_BATCH_SIZE lines; each batch is matched
+# with one lookup on the unique transaction_id index. Disagreements go
+# through payments.settle_payment like a late webhook would, so receipts are
+# issued, failed or refunded bookings are cancelled and release their seats,
+# and money taken for a cancelled booking is refunded. The ids seen
+# are kept in a temporary on-disk SQLite table, which a second, keyset-ordered
+# pass over Payment uses to find payments the report doesn't mention. Memory
+# stays bounded by the batch size however long the file is.
+import csv
+import sqlite3
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedPayment, Payment
+from .payments import apply_payment_result, settle_payment
+
+# Provider wording -> Payment.status
+SETTLED_STATUSES = {
+    'successful': 'successful', 'succeeded': 'successful', 'success': 'successful',
+    'settled': 'successful', 'paid': 'successful', 'completed': 'successful',
+    'failed': 'failed', 'declined': 'failed', 'cancelled': 'failed', 'canceled': 'failed',
+    'refunded': 'refunded', 'reversed': 'refunded',
+    'pending': 'pending',
+}
+
+REPORT_FIELDS = [
+    'kind', 'transaction_id', 'booking_id', 'recorded_status', 'settled_status',
+    'recorded_amount', 'settled_amount', 'action',
+]
+
+
+# Transaction ids already read from the file. SQLite spills an unnamed
+# database to a temporary file once it outgrows its page cache.
+class SeenTransactions:
+    def __init__(self):
+        self.db = sqlite3.connect('')
+        self.db.execute("CREATE TABLE seen (transaction_id TEXT PRIMARY KEY)")
+
+    def contains(self, references):
+        found = set()
+        references = list(references)
+        for start in range(0, len(references), 500):
+            chunk = references[start:start + 500]
+            found.update(row[0] for row in self.db.execute(
+                f"SELECT transaction_id FROM seen WHERE transaction_id IN ({','.join('?' * len(chunk))})", chunk,
+            ))
+        return found
+
+    def add(self, references):
+        self.db.executemany("INSERT OR IGNORE INTO seen VALUES (?)", [(reference,) for reference in references])
+
+    def close(self):
+        self.db.close()
+
+
+class Reconciler:
+    def __init__(self, report=None, batch_size=None, apply=True, id_column='transaction_id',
+                 status_column='status', amount_column='amount'):
+        self.report_writer = csv.DictWriter(report, REPORT_FIELDS) if report is not None else None
+        if self.report_writer:
+            self.report_writer.writeheader()
+        self.batch_size = batch_size or settings.RECONCILE_BATCH_SIZE
+        self.apply = apply
+        self.columns = (id_column, status_column, amount_column)
+        self.counts = Counter()
+        self.seen = SeenTransactions()
+
+    def report(self, kind, reference, action='none', payment=None, settled_status='', settled_amount=None):
+        self.counts[kind] += 1
+        if self.report_writer:
+            self.report_writer.writerow({
+                'kind': kind,
+                'transaction_id': reference,
+                'booking_id': payment.booking_id if payment else '',
+                'recorded_status': payment.status if payment else '',
+                'settled_status': settled_status,
+                'recorded_amount': payment.amount if payment else '',
+                'settled_amount': '' if settled_amount is None else settled_amount,
+                'action': action,
+            })
+
+    # -------------------- SETTLEMENT FILE --------------------
+
+    def match_file(self, rows):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.match_batch(self.parse(batch))
+
+    # {transaction_id: (status, amount)} for the valid, first-seen lines of a batch
+    def parse(self, batch):
+        id_column, status_column, amount_column = self.columns
+        settled = {}
+        for row in batch:
+            self.counts['lines'] += 1
+            reference = (row.get(id_column) or '').strip()
+            raw_status = (row.get(status_column) or '').strip()
+            status = SETTLED_STATUSES.get(raw_status.lower())
+            try:
+                amount = Decimal(row[amount_column].strip()) if (row.get(amount_column) or '').strip() else None
+            except InvalidOperation:
+                status = None
+            if not reference or status is None:
+                self.report('invalid_line', reference, settled_status=raw_status)
+            elif reference in settled:
+                self.report('duplicate_line', reference, settled_status=raw_status)
+            else:
+                settled[reference] = (status, amount)
+
+        for reference in self.seen.contains(settled):
+            status, amount = settled.pop(reference)
+            self.report('duplicate_line', reference, settled_status=status, settled_amount=amount)
+        self.seen.add(settled)
+        return settled
+
+    def match_batch(self, settled):
+        payments = Payment.objects.in_bulk(list(settled), field_name='transaction_id')
+        changes = []
+        for reference, payment in payments.items():
+            status, amount = settled[reference]
+            if amount is not None and amount != payment.amount:
+                self.report('amount_mismatch', reference, payment=payment, settled_status=status, settled_amount=amount)
+            if status == payment.status:
+                self.counts['matched'] += 1
+            elif payment.status == 'pending' and status in ('successful', 'failed'):
+                # The webhook never arrived (or was lost); settle it the same way
+                changes.append(('late_settlement', payment, status, amount))
+            elif status == 'pending' or (payment.status == 'refunded' and status == 'successful'):
+                # Don't undo a settled payment or a refund the provider hasn't caught up with yet
+                self.report('status_mismatch', reference, payment=payment, settled_status=status, settled_amount=amount)
+            else:
+                changes.append(('status_mismatch', payment, status, amount))
+
+        # Few rows disagree, so each goes through settle_payment on its own:
+        # bookings of failed or refunded payments are cancelled and release
+        # their seats, and money taken for a cancelled booking is refunded
+        for kind, payment, status, amount in changes:
+            action = ('settled' if kind == 'late_settlement' else 'corrected') if self.apply else 'none'
+            self.report(kind, payment.transaction_id, action, payment=payment, settled_status=status, settled_amount=amount)
+            if self.apply:
+                settle_payment(payment.transaction_id, status, only_pending=kind == 'late_settlement')
+
+        unknown = [reference for reference in settled if reference not in payments]
+        if unknown:
+            self.match_archived({reference: settled[reference] for reference in unknown})
+
+    # Payments of archived bookings are only reported; the archive is not rewritten
+    def match_archived(self, settled):
+        archived = ArchivedPayment.objects.in_bulk(list(settled), field_name='transaction_id')
+        for reference, (status, amount) in settled.items():
+            payment = archived.get(reference)
+            if payment is None:
+                self.report('unknown_transaction', reference, settled_status=status, settled_amount=amount)
+            elif status != payment.status or (amount is not None and amount != payment.amount):
+                self.report('archived_mismatch', reference, payment=payment, settled_status=status, settled_amount=amount)
+            else:
+                self.counts['matched'] += 1
+
+    # -------------------- PAYMENTS NOT IN THE FILE --------------------
+
+    # Walks payments in transaction_id order, a batch at a time, looking for
+    # settled payments created in [since, until) that the report leaves out and
+    # for charges pending since before `stuck_before`. Waitlist bookings wait
+    # on their owner to pay, so they are reported but never failed.
+    def find_unsettled(self, since=None, until=None, stuck_before=None, fail_stuck=False):
+        stuck_before = stuck_before or timezone.now() - timedelta(minutes=settings.PAYMENT_STUCK_AFTER_MINUTES)
+        filters = Q(status='pending', created_at__lt=stuck_before)
+        if since or until:
+            window = Q(status__in=['successful', 'refunded'])
+            if since:
+                window &= Q(created_at__gte=since)
+            if until:
+                window &= Q(created_at__lt=until)
+            filters |= window
+
+        queryset = Payment.objects.filter(filters).select_related('booking__waitlist_entry').order_by('transaction_id')
+        last = None
+        while True:
+            page = queryset if last is None else queryset.filter(transaction_id__gt=last)
+            page = list(page[:self.batch_size])
+            if not page:
+                break
+            last = page[-1].transaction_id
+            settled = self.seen.contains(payment.transaction_id for payment in page)
+            for payment in page:
+                if payment.transaction_id in settled:
+                    continue
+                if payment.status != 'pending':
+                    self.report('missing_from_settlement', payment.transaction_id, payment=payment)
+                elif not fail_stuck or not self.apply or hasattr(payment.booking, 'waitlist_entry'):
+                    self.report('stuck_pending', payment.transaction_id, payment=payment)
+                else:
+                    self.report('stuck_pending', payment.transaction_id, 'failed', payment=payment)
+                    apply_payment_result(payment.transaction_id, False)
+
+    def close(self):
+        self.seen.close()
@@ -0,0 +1,221 @@
+# Read-replica routing. Requests to the catalog and dashboard views
+# (REPLICA_READ_VIEWS) read from a replica; everything else, every write and
+# any request from a client that wrote within the last REPLICA_PIN_SECONDS
+# (booking -> receipt, edit -> dashboard) stays on the primary. Browsers are
+# pinned by a cookie; API clients often drop cookies, so the writing user and
+# the credential they sent are also pinned in the cache. A replica
+# that fails its periodic check or lags more than REPLICA_MAX_LAG_SECONDS is
+# skipped until it recovers, falling back to the primary if none is left.
+import contextlib
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'primary_pin'
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+_health = {}
+_health_lock = threading.Lock()
+
+# Zero when the replica has replayed everything it received, so an idle
+# primary doesn't look like lag
+POSTGRES_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+"""
+
+
+def replica_lag(alias):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0] or 0)
+        cursor.execute("SELECT 1")
+        return 0.0
+
+
+def check_replica(alias):
+    try:
+        lag = replica_lag(alias)
+    except Exception:
+        logger.warning("Replica %s is unreachable; reading from the primary", alias, exc_info=True)
+        connections[alias].close()
+        return False
+    if lag > settings.REPLICA_MAX_LAG_SECONDS:
+        logger.warning("Replica %s is %.1fs behind; reading from the primary", alias, lag)
+        return False
+    return True
+
+
+# Checked at most once per REPLICA_CHECK_INTERVAL per process
+def healthy_replicas():
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.REPLICA_DATABASES:
+        with _health_lock:
+            checked_at, ok = _health.get(alias, (None, False))
+            stale = checked_at is None or now - checked_at > settings.REPLICA_CHECK_INTERVAL
+            if stale:
+                # Claim the check so concurrent threads keep using the old answer
+                _health[alias] = (now, ok)
+        if stale:
+            ok = check_replica(alias)
+            with _health_lock:
+                _health[alias] = (time.monotonic(), ok)
+        if ok:
+            healthy.append(alias)
+    return healthy
+
+
+def reading_from_replica():
+    return _use_replica.get()
+
+
+# Reads inside the block go to the primary, e.g. to fill a cache entry that
+# must not capture rows a lagging replica hasn't caught up on yet
+@contextlib.contextmanager
+def primary_reads():
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            replicas = healthy_replicas()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        # Later reads in this request must see the write
+        _use_replica.set(False)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def _pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS]
+
+
+# A token isn't resolved to its user until the view runs, so a read is matched
+# on the credential it carries as well as on the session user
+def pin_keys(request, user):
+    keys = []
+    if user is not None and user.is_authenticated:
+        keys.append(f"primary-pin:user:{user.pk}")
+    credentials = request.headers.get('Authorization')
+    if credentials:
+        keys.append(f"primary-pin:auth:{hashlib.sha256(credentials.encode()).hexdigest()}")
+    return keys
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # The async handler awaits process_view; a sync one would be
+            # run on a thread for every request
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            # WSGI threads are reused; don't let the flag outlive the request
+            _use_replica.set(False)
+        if self.is_write(request):
+            self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.set(False)
+        if self.is_write(request):
+            # Writes run in sync views anyway, and request.user may still be
+            # a lazy session lookup
+            await sync_to_async(self.pin)(request, response)
+        return response
+
+    @staticmethod
+    def is_write(request):
+        return settings.REPLICA_DATABASES and request.method not in ('GET', 'HEAD', 'OPTIONS')
+
+    # Keep this client's next reads on the primary until the replicas catch
+    # up. By now an API view has set request.user from the token.
+    @staticmethod
+    def pin(request, response):
+        response.set_cookie(
+            PIN_COOKIE, str(int(time.time()) + settings.REPLICA_PIN_SECONDS),
+            max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+        )
+        keys = pin_keys(request, getattr(request, 'user', None))
+        if keys:
+            _pin_cache().set_many(dict.fromkeys(keys, True), timeout=settings.REPLICA_PIN_SECONDS)
+
+    @staticmethod
+    def routable(request):
+        return (
+            settings.REPLICA_DATABASES and request.method in ('GET', 'HEAD')
+            and request.resolver_match.url_name in settings.REPLICA_READ_VIEWS
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.routable(request) and not self.pinned(request, request.user):
+            _use_replica.set(True)
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if self.routable(request) and not await self.apinned(request):
+            _use_replica.set(True)
+        return None
+
+    @staticmethod
+    def pinned_by_request(request):
+        try:
+            if int(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+                return True
+        except ValueError:
+            pass
+        # A per-process cache can't tell whether this client just wrote
+        # through another worker
+        return 'Authorization' in request.headers and not settings.REPLICA_PIN_SHARED
+
+    def pinned(self, request, user):
+        if self.pinned_by_request(request):
+            return True
+        keys = pin_keys(request, user)
+        return bool(keys) and bool(_pin_cache().get_many(keys))
+
+    async def apinned(self, request):
+        if self.pinned_by_request(request):
+            return True
+        keys = pin_keys(request, await request.auser())
+        return bool(keys) and bool(await _pin_cache().aget_many(keys))
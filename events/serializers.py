@@ -1,6 +1,14 @@
+import uuid
+
 from rest_framework import serializers
 from .models import  User, Category, Venue, Event, Ticket, Booking, Payment
+from .inventory import AlreadyBooked, InsufficientInventory, ensure_not_booked, reserve
+from .metrics import record_bookings, record_payments
+from .payments import start_payments
+from .ticket_tokens import sign_ticket
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
+from django.db import IntegrityError, transaction
 from django.db.models import Sum
 # User registration serializer
 class RegisterSerializer(serializers.ModelSerializer):
@@ -37,7 +45,7 @@ class CategorySerializer(serializers.ModelSerializer):
 class VenueSerializer(serializers.ModelSerializer):
     class Meta:
         model = Venue
-        fields = ['id', 'name', 'address', 'capacity']
+        fields = ['id', 'name']
 
 
 # Ticket serializer
@@ -57,9 +65,7 @@ class TicketSerializer(serializers.ModelSerializer):
         ]
 
     def get_available_quantity(self, ticket):
-        from .models import Booking  # Avoid circular imports
-        booked = Booking.objects.filter(ticket=ticket).aggregate(total=Sum('quantity'))['total'] or 0
-        return ticket.quantity - booked
+        return ticket.remaining_quantity
 
     def get_is_sold_out(self, ticket):
         return self.get_available_quantity(ticket) <= 0
@@ -70,12 +76,16 @@ class EventDetailSerializer(serializers.ModelSerializer):
     category = CategorySerializer()
     venue = VenueSerializer()
     tickets = TicketSerializer(many=True, read_only=True)
+    image = serializers.CharField(source='original_image_url', read_only=True)
+    image_card = serializers.CharField(source='card_image_url', read_only=True)
+    image_thumbnail = serializers.CharField(source='thumbnail_image_url', read_only=True)
 
     class Meta:
         model = Event
         fields = [
             'id', 'title', 'description', 'category', 'venue',
             'organizer', 'start_time', 'end_time', 'image',
+            'image_card', 'image_thumbnail', 'image_status',
             'created_at', 'tickets'
         ]
     def get_available_tickets(self, obj):
@@ -85,6 +95,9 @@ class EventDetailSerializer(serializers.ModelSerializer):
 
 # Event serializer (write)
 class EventCreateSerializer(serializers.ModelSerializer):
+    # Staged by the view and uploaded by the image worker
+    image = serializers.ImageField(write_only=True, required=False)
+
     class Meta:
         model = Event
         fields = [
@@ -105,22 +118,30 @@ class BookingSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     ticket = TicketSerializer(read_only=True)
     ticket_id = serializers.PrimaryKeyRelatedField(
-        queryset=Ticket.objects.all(), source='ticket', write_only=True
+        queryset=Ticket.objects.filter(event__deleted_at__isnull=True), source='ticket', write_only=True
+    )
+    ticket_token = serializers.SerializerMethodField()
+    method = serializers.ChoiceField(
+        choices=['mpesa', 'stripe', 'paypal', 'card'], default='mpesa', write_only=True
     )
 
     class Meta:
         model = Booking
         fields = [
             'id', 'user', 'ticket', 'ticket_id',
-            'quantity', 'booked_at', 'payment_status'
+            'quantity', 'booked_at', 'payment_status',
+            'status', 'cancelled_at', 'order_ref', 'ticket_token', 'method'
         ]
-        read_only_fields = ['booked_at', 'payment_status']
+        read_only_fields = ['booked_at', 'payment_status', 'status', 'cancelled_at', 'order_ref']
+
+    def get_ticket_token(self, booking):
+        # Only paid bookings get into the venue
+        return sign_ticket(booking) if booking.is_active and booking.payment_status == 'paid' else None
 
     def validate(self, attrs):
         ticket = attrs['ticket']
         requested_qty = attrs['quantity']
-        booked = Booking.objects.filter(ticket=ticket).aggregate(total=Sum('quantity'))['total'] or 0
-        available = ticket.quantity - booked
+        available = ticket.remaining_quantity
 
         if requested_qty > available:
             raise serializers.ValidationError(
@@ -131,7 +152,92 @@ class BookingSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Attach the currently authenticated user
         validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+        ticket = validated_data['ticket']
+        method = validated_data.pop('method')
+        with transaction.atomic():
+            try:
+                ensure_not_booked(validated_data['user'], [ticket.event_id])
+                reserve(ticket, validated_data['quantity'])
+            except AlreadyBooked:
+                raise serializers.ValidationError("You have already booked this event.")
+            except InsufficientInventory as exc:
+                raise serializers.ValidationError(
+                    f"Only {exc.remaining} ticket(s) available for '{ticket.name}'."
+                )
+            try:
+                booking = super().create(validated_data)
+            except IntegrityError:
+                # Leaving the atomic block rolls the reservation back too
+                raise serializers.ValidationError("You have already booked this event.")
+            payment = Payment.objects.create(
+                booking=booking,
+                amount=ticket.price * booking.quantity,
+                method=method,
+                transaction_id=str(uuid.uuid4()),
+            )
+            # Charged after commit; the receipt follows the provider's confirmation
+            start_payments([payment])
+        record_bookings('api', [booking])
+        record_payments([payment])
+        return booking
+
+
+# Door check-in serializers
+class CheckInSerializer(serializers.Serializer):
+    token = serializers.CharField(max_length=64)
+    event = serializers.IntegerField()
+    device = serializers.CharField(max_length=64, required=False, default='')
+
+
+class ScanSerializer(serializers.Serializer):
+    token = serializers.CharField(max_length=64)
+    scanned_at = serializers.DateTimeField(required=False)
+    device = serializers.CharField(max_length=64, required=False, default='')
+
+
+class CheckInSyncSerializer(serializers.Serializer):
+    event = serializers.IntegerField()
+    device = serializers.CharField(max_length=64, required=False, default='')
+    scans = serializers.ListField(child=ScanSerializer(), allow_empty=False)
+
+    def validate_scans(self, scans):
+        if len(scans) > settings.CHECKIN_SYNC_MAX_SCANS:
+            raise serializers.ValidationError(f"At most {settings.CHECKIN_SYNC_MAX_SCANS} scans per sync.")
+        return scans
+
+
+# Lightweight booking row for the profile history (no nested availability)
+class BookingHistorySerializer(serializers.ModelSerializer):
+    ticket = serializers.SerializerMethodField()
+    event = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Booking
+        fields = [
+            'id', 'ticket', 'event', 'quantity', 'booked_at',
+            'payment_status', 'status', 'cancelled_at', 'order_ref'
+        ]
+
+    def get_ticket(self, booking):
+        ticket = booking.ticket
+        return {'id': ticket.id, 'name': ticket.name, 'type': ticket.type, 'price': str(ticket.price)}
+
+    def get_event(self, booking):
+        event = booking.event
+        return {'id': event.id, 'title': event.title, 'start_time': event.start_time, 'end_time': event.end_time}
+
+
+# Cart checkout serializers
+class CartLineSerializer(serializers.Serializer):
+    ticket_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CartCheckoutSerializer(serializers.Serializer):
+    PAYMENT_METHOD_CHOICES = ['mpesa', 'stripe', 'paypal', 'card']
+
+    lines = CartLineSerializer(many=True, allow_empty=False)
+    method = serializers.ChoiceField(choices=PAYMENT_METHOD_CHOICES, default='mpesa')
 
 
 # Payment serializer
@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user_tokens, revoke_user_tokens
+from .fragments import bump_event, bump_events
+from .models import Category, Event, Ticket, User, Venue
+from .querystats import install_query_observer
+
+
+# The cached token lookup carries the whole User, so any change to what the
+# user may do has to drop it. Read from __dict__ so deferred fields aren't loaded.
+PERMISSION_FIELDS = ('is_active', 'is_staff', 'is_superuser', 'user_type')
+
+
+def permission_state(user):
+    return tuple(user.__dict__.get(field) for field in PERMISSION_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_permissions(sender, instance, **kwargs):
+    instance._permission_state = permission_state(instance)
+
+
+# set_password() leaves the raw password in _password until save(), which is
+# how we spot a password change without an extra query
+@receiver(pre_save, sender=User)
+def flag_auth_changes(sender, instance, **kwargs):
+    instance._password_changed = bool(instance.pk) and instance._password is not None
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_tokens(sender, instance, created, **kwargs):
+    permissions_changed = permission_state(instance) != instance._permission_state
+    instance._permission_state = permission_state(instance)
+    if created:
+        return
+    if getattr(instance, '_password_changed', False):
+        transaction.on_commit(lambda: revoke_user_tokens(instance))
+    elif permissions_changed or not instance.is_active:
+        transaction.on_commit(lambda: invalidate_user_tokens(instance))
+
+
+# Cached event pages (events/fragments.py). Bumped on commit, so a request
+# running meanwhile can't re-cache the old rows under the new version.
+@receiver([post_save, post_delete], sender=Event)
+def invalidate_event_fragments(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_event(instance.pk, catalog=True))
+
+
+@receiver([post_save, post_delete], sender=Ticket)
+def invalidate_parent_event_fragments(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_event(instance.event_id))
+
+
+# Venue and category names are rendered into the pages of every event using
+# them. Their events are looked up before a delete: by post_delete, SET_NULL
+# has already detached them.
+@receiver([post_save, pre_delete], sender=Venue)
+def invalidate_venue_event_fragments(sender, instance, created=False, **kwargs):
+    if not created:
+        event_ids = list(Event.objects.filter(venue=instance).values_list('pk', flat=True))
+        transaction.on_commit(lambda: bump_events(event_ids))
+
+
+@receiver([post_save, pre_delete], sender=Category)
+def invalidate_category_event_fragments(sender, instance, created=False, **kwargs):
+    if not created:
+        event_ids = list(Event.objects.filter(category=instance).values_list('pk', flat=True))
+        transaction.on_commit(lambda: bump_events(event_ids))
+
+
+# Query stats and request profiles observe queries through one wrapper per
+# connection (events/querystats.py)
+@receiver(connection_created)
+def observe_connection_queries(sender, connection, **kwargs):
+    install_query_observer(connection)
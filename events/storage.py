@@ -0,0 +1,106 @@
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+# Image storage backends
+# Each backend takes the raw bytes of an image (original or variant) and returns
+# a public URL. events/images.py only talks to this interface, so Cloudinary
+# can be swapped for local disk in dev and tests. Uploads wait for the worker
+# in a separate staging storage (a local or shared disk by default), so a
+# request never waits on the image host.
+class ImageStorage:
+    def save(self, name, content, content_type='image/jpeg'):
+        raise NotImplementedError
+
+    def read(self, name):
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+
+# Local filesystem stand-in (MEDIA_ROOT/event_images/...)
+class LocalImageStorage(ImageStorage):
+    def __init__(self, location=None, base_url=None):
+        self.location = location or os.path.join(settings.MEDIA_ROOT, 'event_images')
+        self.base_url = base_url or f"{settings.MEDIA_URL.rstrip('/')}/event_images/"
+
+    def path(self, name):
+        return os.path.join(self.location, name)
+
+    def save(self, name, content, content_type='image/jpeg'):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            if isinstance(content, bytes):
+                f.write(content)
+            else:
+                # An upload: copy it a chunk at a time instead of reading it whole
+                for chunk in content.chunks():
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+        return f"{self.base_url}{name}"
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+
+# Where uploads wait for the image worker (EVENT_IMAGE_STAGING_ROOT); never served
+class StagingStorage(LocalImageStorage):
+    def __init__(self):
+        super().__init__(location=settings.EVENT_IMAGE_STAGING_ROOT)
+
+
+# Cloudinary backend (production)
+class CloudinaryImageStorage(ImageStorage):
+    def __init__(self, folder='events'):
+        self.folder = folder
+
+    def _public_id(self, name):
+        return f"{self.folder}/{os.path.splitext(name)[0]}"
+
+    def save(self, name, content, content_type='image/jpeg'):
+        import cloudinary.uploader
+
+        result = cloudinary.uploader.upload(
+            content,
+            public_id=self._public_id(name),
+            overwrite=True,
+            resource_type='image',
+        )
+        return result['secure_url']
+
+    def read(self, name):
+        from urllib.request import urlopen
+
+        import cloudinary.utils
+
+        url, _ = cloudinary.utils.cloudinary_url(self._public_id(name), resource_type='image', secure=True)
+        with urlopen(url, timeout=30) as response:
+            return response.read()
+
+    def delete(self, name):
+        import cloudinary.uploader
+
+        cloudinary.uploader.destroy(self._public_id(name), resource_type='image')
+
+
+@lru_cache(maxsize=None)
+def get_image_storage():
+    return import_string(settings.EVENT_IMAGE_STORAGE)()
+
+
+@lru_cache(maxsize=None)
+def get_staging_storage():
+    return import_string(settings.EVENT_IMAGE_STAGING_STORAGE)()
@@ -0,0 +1,41 @@
+# Helpers for tests that guard against N+1 regressions.
+#
+#     class EventListTests(QueryBudgetMixin, TestCase):
+#         def test_list(self):
+#             with self.assertQueryBudget(max_queries=6):
+#                 self.client.get('/api/api/events/')
+#
+# QueryBudgetMixin also turns on QUERY_BUDGET_STRICT, so any view over its
+# @query_budget / QUERY_BUDGETS limit fails the request with QueryBudgetExceeded.
+from contextlib import contextmanager
+
+from django.test.utils import override_settings
+
+from .querystats import QueryBudgetExceeded, budget_violations, capture_queries
+
+
+@contextmanager
+def assert_query_budget(max_queries=None, max_db_ms=None, using=None):
+    with capture_queries(using) as stats:
+        yield stats
+    violations = budget_violations(stats, {'queries': max_queries, 'db_ms': max_db_ms})
+    if violations:
+        lines = [f"Query budget exceeded: {'; '.join(violations)}"]
+        lines += [f"  {count}x {sql}" for sql, count in stats.duplicates()]
+        raise QueryBudgetExceeded('\n'.join(lines))
+
+
+class QueryBudgetMixin:
+    @classmethod
+    def setUpClass(cls):
+        cls._strict_budgets = override_settings(QUERY_BUDGET_STRICT=True)
+        cls._strict_budgets.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._strict_budgets.disable()
+
+    def assertQueryBudget(self, max_queries=None, max_db_ms=None, using=None):
+        return assert_query_budget(max_queries, max_db_ms, using)
@@ -1,3 +1,1404 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q, Sum
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .archive import archive_ended_bookings
+from .authentication import token_cache_key
+from .checkout import CheckoutError, checkout_cart
+from .fragments import event_versions
+from .history import InvalidCursor, booking_page
+from .idempotency import claim_key, complete_key, renewing_lease
+from .images import process_pending_images, stage_event_image
+from .loadtest import Session, percentile, run_journeys, summarize
+from .inventory import (
+    availability_channel, availability_snapshot, cancel_booking, disable_sharding, enable_sharding,
+    rebalance_shards, release, reserve, InsufficientInventory,
+)
+from .models import (
+    ArchivedBooking, Booking, Category, CheckIn, Event, IdempotencyKey, Payment, RequestProfile, Ticket, TicketShard,
+    User, Venue, WaitlistEntry,
+)
+from .management.commands.profile_startup import STARTUP_SCRIPT
+from .profiling import ProfilingMiddleware
+from .payments import SimulatedGateway, apply_payment_result, expire_pending_payments, sign_payload
+from .pubsub import CacheBroker, LocalBroker
+from .purge import purge_deleted_events, soft_delete_event
+from . import async_views, ratelimit, replicas
+from .querystats import QueryStatsMiddleware
+from .reconciliation import Reconciler
+from .ratelimit import client_ip
+from .replicas import ReplicaRoutingMiddleware
+from .storage import get_image_storage, get_staging_storage
+from .testing import QueryBudgetMixin
+from .ticket_tokens import sign_ticket
+from .views import EventViewSet
+
+
+def make_event(organizer, title='Event', tickets=1, quantity=10, price=100, start_in=timedelta(days=7)):
+    start = timezone.now() + start_in
+    event = Event.objects.create(
+        organizer=organizer, title=title, description='Description',
+        start_time=start, end_time=start + timedelta(hours=3),
+    )
+    for n in range(tickets):
+        Ticket.objects.create(event=event, name=f"Tier {n}", price=price, quantity=quantity)
+    return event
+
+
+def make_booking(user, ticket, quantity=1, payment_status='pending', payment='pending'):
+    reserve(ticket, quantity)
+    booking = Booking.objects.create(user=user, ticket=ticket, quantity=quantity, payment_status=payment_status)
+    Payment.objects.create(
+        booking=booking, amount=ticket.price * quantity, method='mpesa',
+        transaction_id=str(uuid.uuid4()), status=payment,
+    )
+    return booking
+
+
+class EventsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create_user('organizer', password='pass', user_type='organizer')
+        cls.attendee = User.objects.create_user('attendee', password='pass')
+
+    def setUp(self):
+        # Rate limits, fragments and check-in hints all live in the cache
+        for cache in caches.all():
+            cache.clear()
+
+
+# -------------------- QUERY BUDGETS --------------------
+
+class CatalogQueryBudgetTests(QueryBudgetMixin, EventsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # More events than any budget, so a per-event query would show
+        cls.events = [make_event(cls.organizer, f"Event {n}", tickets=2) for n in range(10)]
+
+    def test_event_list(self):
+        with self.assertQueryBudget(max_queries=8):
+            response = self.client.get(reverse('event-list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_event_detail(self):
+        with self.assertQueryBudget(max_queries=8):
+            response = self.client.get(reverse('event-detail', args=[self.events[0].pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_event_api_list(self):
+        with self.assertQueryBudget(max_queries=8):
+            response = self.client.get('/api/api/events/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_ticket_api_list(self):
+        with self.assertQueryBudget(max_queries=6):
+            response = self.client.get('/api/api/tickets/')
+        self.assertEqual(response.status_code, 200)
+
+
+class BookingQueryBudgetTests(QueryBudgetMixin, EventsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.event = make_event(cls.organizer, tickets=3)
+        cls.ticket = cls.event.tickets.first()
+
+    def test_book_event_form(self):
+        self.client.force_login(self.attendee)
+        with self.assertQueryBudget(max_queries=16):
+            response = self.client.post(reverse('book-event', args=[self.event.pk]), {
+                'ticket_type': self.ticket.pk, 'quantity': 2, 'idempotency_key': uuid.uuid4().hex,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.filter(user=self.attendee).count(), 1)
+
+    def test_book_event_api(self):
+        client = APIClient()
+        client.force_authenticate(self.attendee)
+        with self.assertQueryBudget(max_queries=10):
+            response = client.post('/api/api/bookings/', {'ticket_id': self.ticket.pk, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_cart_checkout_api(self):
+        client = APIClient()
+        client.force_authenticate(self.attendee)
+        lines = [{'ticket_id': ticket.pk, 'quantity': 1} for ticket in self.event.tickets.all()]
+        with self.assertQueryBudget(max_queries=12):
+            response = client.post('/api/api/cart/checkout/', {'lines': lines}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['bookings']), 3)
+
+    def test_profile(self):
+        for n in range(5):
+            make_booking(self.attendee, make_event(self.organizer, f"Booked {n}").tickets.get())
+        self.client.force_login(self.attendee)
+        with self.assertQueryBudget(max_queries=10):
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+
+
+# -------------------- RATE LIMITS --------------------
+
+@override_settings(RATE_LIMITS={'booking': {'rate': 1, 'per': 60, 'burst': 1}, 'auth': {'rate': 1, 'per': 60, 'burst': 1}})
+class RateLimitTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        # Buckets are built once per scope; rebuild them with the limits above
+        ratelimit._buckets.clear()
+        self.addCleanup(ratelimit._buckets.clear)
+
+    def test_client_behind_router(self):
+        factory = RequestFactory()
+        request = factory.get('/', HTTP_X_FORWARDED_FOR='6.6.6.6, 10.0.0.7', REMOTE_ADDR='10.1.1.1')
+        self.assertEqual(client_ip(request), '10.0.0.7')
+        with override_settings(RATE_LIMIT_PROXY_HOPS=0):
+            self.assertEqual(client_ip(request), '10.1.1.1')
+
+    def test_anonymous_clients_get_their_own_buckets(self):
+        login = reverse('login')
+        self.client.post(login, {'username': 'x', 'password': 'y'}, HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(self.client.post(login, {'username': 'x', 'password': 'y'}, HTTP_X_FORWARDED_FOR='10.0.0.1').status_code, 429)
+        self.assertNotEqual(self.client.post(login, {'username': 'x', 'password': 'y'}, HTTP_X_FORWARDED_FOR='10.0.0.2').status_code, 429)
+
+    def test_replays_are_free(self):
+        ticket = make_event(self.organizer).tickets.get()
+        client = APIClient()
+        client.force_authenticate(self.attendee)
+        for _ in range(3):
+            response = client.post('/api/api/bookings/', {'ticket_id': ticket.pk, 'quantity': 1}, format='json',
+                                   HTTP_IDEMPOTENCY_KEY='same')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+        # The form has its own user: the API bookings above used up the attendee's token
+        form_user = User.objects.create_user('form-user')
+        self.client.force_login(form_user)
+        event = make_event(self.organizer, 'Form')
+        for _ in range(3):
+            response = self.client.post(reverse('book-event', args=[event.pk]), {
+                'ticket_type': event.tickets.get().pk, 'quantity': 1, 'idempotency_key': 'form',
+            })
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.filter(user=form_user).count(), 1)
+
+
+# -------------------- IDEMPOTENCY KEYS --------------------
+
+class IdempotencyKeyTests(EventsTestCase):
+    def claim(self):
+        return claim_key(self.attendee, 'booking', 'key', 'hash')
+
+    def expire(self, record):
+        IdempotencyKey.objects.filter(pk=record.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claim_held_until_lease_runs_out(self):
+        first, created = self.claim()
+        self.assertTrue(created)
+        self.assertEqual(self.claim(), (first, False))
+        self.expire(first)
+        retry, created = self.claim()
+        self.assertTrue(created)
+        self.assertNotEqual(retry.pk, first.pk)
+
+    def test_completed_key_kept_for_ttl(self):
+        record, _ = self.claim()
+        self.assertTrue(complete_key(record, 201, {'id': 1}))
+        record.refresh_from_db()
+        self.assertGreater(record.expires_at, timezone.now() + settings.IDEMPOTENCY_KEY_TTL - timedelta(minutes=1))
+
+    def test_request_that_lost_its_claim_gets_409(self):
+        @contextmanager
+        def retry_takes_over(record):
+            yield
+            self.expire(record)
+            claim_key(record.user, record.scope, record.key, record.request_hash)
+
+        client = APIClient()
+        client.force_authenticate(self.attendee)
+        ticket = make_event(self.organizer).tickets.get()
+        with mock.patch('events.idempotency.renewing_lease', retry_takes_over):
+            response = client.post('/api/api/bookings/', {'ticket_id': ticket.pk, 'quantity': 1}, format='json',
+                                   HTTP_IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, 409)
+        # The retry's claim is left alone
+        self.assertIsNone(IdempotencyKey.objects.get(key='key').status_code)
+
+
+# The renewal thread needs to see the committed claim
+class IdempotencyLeaseRenewalTests(TransactionTestCase):
+    @override_settings(IDEMPOTENCY_CLAIM_LEASE=timedelta(milliseconds=150))
+    def test_running_request_keeps_its_claim(self):
+        user = User.objects.create_user('renewing')
+        record, _ = claim_key(user, 'booking', 'key', 'hash')
+        with renewing_lease(record):
+            time.sleep(0.4)
+        self.assertEqual(claim_key(user, 'booking', 'key', 'hash'), (record, False))
+
+
+# -------------------- SHARDED INVENTORY --------------------
+
+class ShardedInventoryTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ticket = enable_sharding(make_event(self.organizer, quantity=40).tickets.get(), shard_count=4)
+
+    def shards(self):
+        return list(TicketShard.objects.filter(ticket=self.ticket).order_by('index').values_list('available', flat=True))
+
+    def test_enable_splits_remaining(self):
+        self.assertEqual(self.shards(), [10, 10, 10, 10])
+        self.assertEqual(self.ticket.remaining_quantity, 40)
+
+    def test_reserve_takes_from_one_shard(self):
+        reserve(self.ticket, 3)
+        self.assertEqual(sum(self.shards()), 37)
+        self.assertEqual(sorted(self.shards()), [7, 10, 10, 10])
+
+    def test_reserve_across_shards(self):
+        reserve(self.ticket, 25)
+        self.assertEqual(self.shards(), [4, 4, 4, 3])
+
+    def test_sold_out(self):
+        reserve(self.ticket, 40)
+        with self.assertRaises(InsufficientInventory):
+            reserve(self.ticket, 1)
+        self.assertEqual(self.shards(), [0, 0, 0, 0])
+
+    def test_low_shard_rebalances_after_commit(self):
+        TicketShard.objects.filter(ticket=self.ticket).exclude(index=3).update(available=0)
+        TicketShard.objects.filter(ticket=self.ticket, index=3).update(available=12)
+        with mock.patch('events.inventory.random.randrange', return_value=0):
+            with self.captureOnCommitCallbacks() as callbacks:
+                reserve(self.ticket, 1)
+            # Nothing is rebalanced inside the booking transaction
+            self.assertEqual(self.shards(), [0, 0, 0, 11])
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self.shards(), [3, 3, 3, 2])
+
+    def test_stale_unsharded_ticket_uses_shards(self):
+        stale = disable_sharding(self.ticket)
+        enable_sharding(self.ticket, shard_count=4)
+        reserve(stale, 3)
+        release(stale, 1)
+        self.assertEqual(sum(self.shards()), 38)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).sold_quantity, 0)
+
+    def test_stale_sharded_ticket_uses_ticket_row(self):
+        disable_sharding(self.ticket)
+        reserve(self.ticket, 3)
+        release(self.ticket, 1)
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertFalse(ticket.is_sharded)
+        self.assertEqual(ticket.sold_quantity, 2)
+
+    def test_rebalance_leaves_even_shards(self):
+        TicketShard.objects.filter(ticket=self.ticket, index=0).update(available=6)
+        rebalance_shards(self.ticket)
+        self.assertEqual(self.shards(), [6, 10, 10, 10])
+
+
+# -------------------- AVAILABILITY LOOKUP --------------------
+
+class AvailabilityLookupTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.organizer, tickets=2, quantity=10)
+        self.plain, sharded = self.event.tickets.order_by('pk')
+        self.sharded = enable_sharding(sharded, shard_count=2)
+        make_booking(self.attendee, self.plain, quantity=3)
+        reserve(self.sharded, 10)
+
+    def get(self, query):
+        return self.client.get(f"{reverse('api-availability')}?{query}")
+
+    def test_tickets_and_events_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.get(f"tickets={self.plain.pk},{self.sharded.pk},0&events={self.event.pk}")
+        self.assertEqual(response.json(), {
+            'tickets': {
+                '0': None,
+                str(self.plain.pk): {'event': self.event.pk, 'remaining': 7, 'sold_out': False},
+                str(self.sharded.pk): {'event': self.event.pk, 'remaining': 0, 'sold_out': True},
+            },
+            'events': {
+                str(self.event.pk): {
+                    'remaining': 7, 'sold_out': False,
+                    'tickets': {str(self.plain.pk): 7, str(self.sharded.pk): 0},
+                },
+            },
+        })
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_repeated_poll_served_from_cache(self):
+        self.get(f"events={self.event.pk}")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(f"events={self.event.pk}").status_code, 200)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get('').status_code, 400)
+        self.assertEqual(self.get('tickets=1,x').status_code, 400)
+        with override_settings(AVAILABILITY_MAX_IDS=2):
+            self.assertEqual(self.get('tickets=1,2&events=3').status_code, 400)
+
+
+# -------------------- LIVE AVAILABILITY --------------------
+
+class AvailabilityPublishTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ticket = make_event(self.organizer, quantity=10).tickets.get()
+        self.channel = availability_channel(self.ticket.event_id)
+        self.broker = LocalBroker()
+        patcher = mock.patch('events.inventory.get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unwatched_event_is_not_published(self):
+        with mock.patch('events.inventory.availability_snapshot') as snapshot:
+            with self.captureOnCommitCallbacks(execute=True):
+                reserve(self.ticket, 1)
+        snapshot.assert_not_called()
+        self.assertIsNone(self.broker.latest(self.channel))
+
+    def test_one_publish_per_event_per_transaction(self):
+        self.broker.subscribe(self.channel)
+        with mock.patch('events.inventory.availability_snapshot', wraps=availability_snapshot) as snapshot:
+            with self.captureOnCommitCallbacks(execute=True):
+                reserve(self.ticket, 1)
+                reserve(self.ticket, 2)
+                release(self.ticket, 1)
+        self.assertEqual(snapshot.call_count, 1)
+        self.assertEqual(self.broker.latest(self.channel)[1]['tickets'], {str(self.ticket.pk): 8})
+
+    def test_viewers_in_other_processes_count(self):
+        viewer, publisher = CacheBroker(), CacheBroker()
+        with mock.patch.object(CacheBroker, '_poll'):
+            viewer.subscribe(self.channel)
+        self.assertEqual(publisher.subscribed([self.channel, availability_channel(0)]), {self.channel})
+
+
+# -------------------- BOOKING HISTORY --------------------
+
+class BookingHistoryTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bookings = {}
+        for name, days in [('soon', 7), ('later', 14), ('recent', -30), ('tied', -30), ('old', -60)]:
+            ticket = make_event(self.organizer, name, start_in=timedelta(days=days)).tickets.get()
+            self.bookings[name] = make_booking(self.attendee, ticket, payment_status='paid', payment='successful').pk
+        tied = Event.objects.get(title='tied')
+        Event.objects.filter(title='recent').update(start_time=tied.start_time, end_time=tied.end_time)
+        archive_ended_bookings(days=40)
+
+    def walk(self, section):
+        seen, cursor = [], None
+        while True:
+            page, cursor = booking_page(self.attendee, section, cursor, size=1)
+            seen.extend(booking.pk for booking in page)
+            if cursor is None:
+                return seen
+
+    def test_upcoming_soonest_first(self):
+        self.assertEqual(self.walk('upcoming'), [self.bookings['soon'], self.bookings['later']])
+
+    def test_past_pages_cover_ties_and_archive(self):
+        self.assertTrue(ArchivedBooking.objects.filter(pk=self.bookings['old']).exists())
+        self.assertEqual(self.walk('past'), [self.bookings['tied'], self.bookings['recent'], self.bookings['old']])
+
+    def test_bad_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            booking_page(self.attendee, 'past', 'nope')
+        client = APIClient()
+        client.force_authenticate(self.attendee)
+        response = client.get(reverse('api-booking-history'), {'section': 'past', 'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(BOOKING_HISTORY_PAGE_SIZE=2)
+    def test_api_follows_next(self):
+        client = APIClient()
+        client.force_authenticate(self.attendee)
+        first = client.get(reverse('api-booking-history'), {'section': 'past'}).json()
+        second = client.get(first['next']).json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next'])
+
+
+# -------------------- CART CHECKOUT --------------------
+
+class CartCheckoutTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.regular, self.vip = make_event(self.organizer, tickets=2, quantity=3).tickets.order_by('pk')
+
+    def sold(self):
+        return list(Ticket.objects.order_by('pk').values_list('sold_quantity', flat=True))
+
+    def test_lines_booked_as_one_order(self):
+        order_ref, bookings = checkout_cart(self.attendee, [(self.regular.pk, 1), (self.vip.pk, 1), (self.regular.pk, 2)])
+        self.assertEqual({booking.ticket_id: booking.quantity for booking in bookings}, {self.regular.pk: 3, self.vip.pk: 1})
+        self.assertEqual(set(Booking.objects.values_list('order_ref', flat=True)), {order_ref})
+        self.assertEqual(Payment.objects.filter(booking__order_ref=order_ref, status='pending').count(), 2)
+        self.assertEqual(self.sold(), [3, 1])
+
+    def test_one_short_line_books_nothing(self):
+        with self.assertRaises(CheckoutError) as raised:
+            checkout_cart(self.attendee, [(self.regular.pk, 1), (self.vip.pk, 4), (0, 1)])
+        self.assertEqual(raised.exception.errors, ["Only 3 tickets remaining for Tier 1.", "Ticket 0 does not exist."])
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.sold(), [0, 0])
+
+    def test_empty_cart(self):
+        with self.assertRaises(CheckoutError):
+            checkout_cart(self.attendee, [(self.regular.pk, 0)])
+
+
+# -------------------- CANCELLATION --------------------
+
+class CancellationTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ticket = make_event(self.organizer, quantity=2).tickets.get()
+        self.booking = make_booking(self.attendee, self.ticket, quantity=2)
+        self.client.force_login(self.attendee)
+
+    def cancel(self):
+        return self.client.post(reverse('cancel-booking', args=[self.booking.pk]))
+
+    def test_cancel_keeps_booking_and_frees_seats(self):
+        self.assertRedirects(self.cancel(), reverse('profile'), fetch_redirect_response=False)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'cancelled')
+        self.assertIsNotNone(self.booking.cancelled_at)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.sold_quantity, 0)
+
+    def test_second_cancel_changes_nothing(self):
+        self.cancel()
+        self.cancel()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.sold_quantity, 0)
+
+    def test_freed_seats_go_to_waitlist_in_order(self):
+        too_many = WaitlistEntry.objects.create(ticket=self.ticket, user=User.objects.create_user('a'), quantity=3)
+        first = WaitlistEntry.objects.create(ticket=self.ticket, user=User.objects.create_user('b'))
+        second = WaitlistEntry.objects.create(ticket=self.ticket, user=User.objects.create_user('c'))
+        self.cancel()
+
+        statuses = dict(WaitlistEntry.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {too_many.pk: 'waiting', first.pk: 'promoted', second.pk: 'promoted'})
+        promoted = Booking.objects.filter(waitlist_entry__isnull=False)
+        self.assertEqual(sorted(promoted.values_list('payment_status', flat=True)), ['pending', 'pending'])
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.sold_quantity, 2)
+
+
+# -------------------- ONE BOOKING PER EVENT --------------------
+
+class DuplicateBookingTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.organizer, tickets=2)
+        self.regular, self.vip = self.event.tickets.order_by('pk')
+        self.api = APIClient()
+        self.api.force_authenticate(self.attendee)
+        self.client.force_login(self.attendee)
+
+    def book_form(self, ticket):
+        return self.client.post(reverse('book-event', args=[self.event.pk]), {'ticket_type': ticket.pk, 'quantity': 1})
+
+    def active_bookings(self):
+        return Booking.objects.filter(user=self.attendee, event=self.event, status='active')
+
+    def test_form_twice(self):
+        self.book_form(self.regular)
+        self.book_form(self.vip)
+        self.assertEqual(self.active_bookings().count(), 1)
+        self.vip.refresh_from_db()
+        self.assertEqual(self.vip.sold_quantity, 0)
+
+    def test_form_then_api(self):
+        self.book_form(self.regular)
+        response = self.api.post('/api/api/bookings/', {'ticket_id': self.vip.pk, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.active_bookings().count(), 1)
+
+    def test_cart_then_form_and_api(self):
+        order_ref, _ = checkout_cart(self.attendee, [(self.regular.pk, 1), (self.vip.pk, 1)])
+        self.book_form(self.regular)
+        response = self.api.post('/api/api/bookings/', {'ticket_id': self.vip.pk, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.active_bookings().count(), 2)
+        self.assertEqual(set(self.active_bookings().values_list('order_ref', flat=True)), {order_ref})
+
+    def test_form_then_cart(self):
+        self.book_form(self.regular)
+        with self.assertRaises(CheckoutError):
+            checkout_cart(self.attendee, [(self.vip.pk, 1)])
+        self.assertEqual(self.active_bookings().count(), 1)
+
+    def test_rebook_after_cancel(self):
+        self.book_form(self.regular)
+        self.client.post(reverse('cancel-booking', args=[self.active_bookings().get().pk]))
+        self.book_form(self.vip)
+        self.assertEqual(self.active_bookings().get().ticket_id, self.vip.pk)
+
+    def sold_out_with_waitlist(self):
+        Ticket.objects.filter(pk=self.regular.pk).update(quantity=1)
+        holder = make_booking(User.objects.create_user('holder'), self.regular)
+        next_user = User.objects.create_user('next')
+        WaitlistEntry.objects.create(ticket=self.regular, user=self.attendee)
+        WaitlistEntry.objects.create(ticket=self.regular, user=next_user)
+        return holder, next_user
+
+    def test_waitlist_skips_users_who_booked(self):
+        holder, next_user = self.sold_out_with_waitlist()
+        self.book_form(self.vip)
+        cancel_booking(holder)
+        self.assertEqual(self.active_bookings().get().ticket_id, self.vip.pk)
+        self.assertEqual(WaitlistEntry.objects.get(user=self.attendee).status, 'cancelled')
+        self.assertEqual(WaitlistEntry.objects.get(user=next_user).status, 'promoted')
+
+    def test_waitlist_passes_over_users_busy_booking(self):
+        holder, next_user = self.sold_out_with_waitlist()
+        # The attendee's row is locked by a booking in flight
+        unlocked = User.objects.exclude(pk=self.attendee.pk)
+        with mock.patch.object(User.objects, 'select_for_update', return_value=unlocked):
+            cancel_booking(holder)
+        self.assertEqual(WaitlistEntry.objects.get(user=self.attendee).status, 'waiting')
+        self.assertEqual(WaitlistEntry.objects.get(user=next_user).status, 'promoted')
+
+
+# -------------------- PAGE CACHING --------------------
+
+@override_settings(FRAGMENT_CACHE_ENABLED=True)
+class FragmentCacheTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.venue = Venue.objects.create(name='Old Hall')
+        self.event = make_event(self.organizer, 'Concert')
+        self.event.venue = self.venue
+        self.event.save()
+        self.other = make_event(self.organizer, 'Other')
+
+    def page(self, event):
+        return self.client.get(reverse('event-detail', args=[event.pk])).content.decode()
+
+    def test_served_from_cache_until_event_changes(self):
+        self.assertIn('Concert', self.page(self.event))
+        # No signal, so the cached fragment stays
+        Event.objects.filter(pk=self.event.pk).update(title='Renamed')
+        self.assertNotIn('Renamed', self.page(self.event))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.refresh_from_db()
+            self.event.save()
+        self.assertIn('Renamed', self.page(self.event))
+
+    def test_venue_change_reaches_its_events_and_the_sidebar(self):
+        self.assertIn('Old Hall', self.page(self.event))
+        self.assertIn('Old Hall', self.page(self.other))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.venue.name = 'New Hall'
+            self.venue.save()
+        self.assertIn('New Hall', self.page(self.event))
+        self.assertIn('New Hall', self.page(self.other))
+
+    def test_category_change_bumps_its_events(self):
+        category = Category.objects.create(name='Music')
+        Event.objects.filter(pk=self.event.pk).update(category=category)
+        before = event_versions([self.event.pk, self.other.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        after = event_versions([self.event.pk, self.other.pk])
+        self.assertNotEqual(after[self.event.pk], before[self.event.pk])
+        self.assertEqual(after[self.other.pk], before[self.other.pk])
+
+
+# -------------------- EVENT DELETION --------------------
+
+class EventDeletionTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.organizer, 'Doomed', quantity=20)
+        self.ticket = self.event.tickets.get()
+        for n in range(5):
+            booking = make_booking(User.objects.create_user(f"user{n}"), self.ticket)
+            Booking.objects.filter(pk=booking.pk).update(receipt_file=f"receipts/receipt_{n}.pdf")
+        WaitlistEntry.objects.create(ticket=self.ticket, user=self.attendee)
+        # An order that also covers another event keeps its receipt
+        self.other = make_event(self.organizer, 'Other').tickets.get()
+        self.order_ref, _ = checkout_cart(User.objects.create_user('buyer'), [(self.ticket.pk, 1), (self.other.pk, 1)])
+
+    def test_deleted_event_is_hidden_and_closed(self):
+        soft_delete_event(self.event)
+        self.assertFalse(Event.objects.filter(pk=self.event.pk).exists())
+        with self.assertRaises(CheckoutError):
+            checkout_cart(self.attendee, [(self.ticket.pk, 1)])
+        client = APIClient()
+        client.force_authenticate(self.attendee)
+        response = client.post('/api/api/bookings/', {'ticket_id': self.ticket.pk, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_purge_in_chunks(self):
+        soft_delete_event(self.event)
+        with mock.patch('events.purge.default_storage') as storage, CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                [(event, counts)] = purge_deleted_events(batch_size=2)
+
+        self.assertEqual(counts, {
+            'bookings': 6, 'archived_bookings': 0, 'waitlist': 1, 'check_ins': 0, 'shards': 0, 'tickets': 1,
+        })
+        booking_deletes = [q for q in queries if q['sql'].startswith('DELETE FROM "events_booking"')]
+        self.assertEqual(len(booking_deletes), 3)
+        self.assertEqual(
+            sorted(call.args[0] for call in storage.delete.call_args_list),
+            [f"receipts/receipt_{n}.pdf" for n in range(5)],
+        )
+        self.assertFalse(Event.all_objects.filter(pk=self.event.pk).exists())
+        self.assertEqual(Booking.objects.filter(order_ref=self.order_ref).count(), 1)
+
+
+# -------------------- BENCHMARKS --------------------
+
+class BenchmarkCommandTests(EventsTestCase):
+    def generate(self):
+        call_command(
+            'generate_dataset', organizers=2, attendees=6, venues=2, events=5, bookings=30, batch_size=4,
+            prefix='bench', stdout=io.StringIO(),
+        )
+
+    def test_dataset_counters_match_bookings(self):
+        self.generate()
+        self.assertEqual(Event.objects.filter(organizer__username__startswith='bench-').count(), 5)
+        tickets = Ticket.objects.filter(event__organizer__username__startswith='bench-').annotate(
+            booked=Sum('booking__quantity', filter=Q(booking__status='active')),
+        )
+        self.assertTrue(Booking.objects.filter(user__username__startswith='bench-').exists())
+        for ticket in tickets:
+            self.assertEqual(ticket.sold_quantity, ticket.booked or 0)
+        with self.assertRaises(CommandError):
+            self.generate()
+
+    def test_results_written_and_compared(self):
+        self.generate()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'run.json')
+            options = dict(iterations=2, warmup=0, only='event_list,api_events,profile', output=output)
+            call_command('run_benchmarks', stdout=io.StringIO(), **options)
+            with open(output) as f:
+                report = json.load(f)
+            stdout = io.StringIO()
+            call_command('run_benchmarks', compare=output, stdout=stdout, **options)
+
+        self.assertEqual(set(report['results']), {'event_list', 'api_events', 'profile'})
+        for stats in report['results'].values():
+            self.assertEqual(stats['status'], '200')
+            self.assertGreater(stats['queries'], 0)
+        self.assertEqual(report['meta']['dataset']['events'], Event.objects.count())
+        self.assertIn('Compared with', stdout.getvalue())
+
+
+# -------------------- LOAD TESTS --------------------
+
+class LoadTestHarnessTests(SimpleTestCase):
+    async def start_server(self):
+        self.connections = 0
+
+        # /login sets the CSRF cookie with a chunked body, /echo reports what
+        # it was sent, anything else fails
+        async def serve(reader, writer):
+            self.connections += 1
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                request_line, *lines = head.decode().strip().split("\r\n")
+                path = request_line.split()[1]
+                headers = dict(line.split(': ', 1) for line in lines)
+                body = await reader.readexactly(int(headers.get('Content-Length', 0)))
+                if path == '/login':
+                    writer.write(
+                        b"HTTP/1.1 200 OK\r\nSet-Cookie: csrftoken=abc; Path=/\r\n"
+                        b"Transfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n"
+                    )
+                elif path == '/echo':
+                    payload = json.dumps({
+                        'cookie': headers.get('Cookie'), 'csrf': headers.get('X-CSRFToken'), 'body': body.decode(),
+                    }).encode()
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(payload), payload))
+                else:
+                    writer.write(b"HTTP/1.1 500 Internal Server Error\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    def test_summary(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        summary = summarize([n / 1000 for n in range(100, 0, -1)], errors=5, elapsed=2)
+        self.assertEqual((summary['requests'], summary['errors'], summary['rps']), (100, 5, 50))
+        self.assertAlmostEqual(summary['error_rate'], 5 / 105)
+        self.assertAlmostEqual(summary['p50_ms'], 51)
+        self.assertAlmostEqual(summary['p95_ms'], 95)
+        self.assertAlmostEqual(summary['p99_ms'], 99)
+
+    async def test_session_keeps_cookies_and_connection(self):
+        server, url = await self.start_server()
+        async with server:
+            session = Session(url)
+            self.assertEqual((await session.get('/login')).body, b'hello')
+            echoed = json.loads((await session.post('/echo', {'quantity': 2})).body)
+            await session.close()
+        self.assertEqual(echoed, {'cookie': 'csrftoken=abc', 'csrf': 'abc', 'body': 'quantity=2'})
+        self.assertEqual(self.connections, 1)
+
+    async def test_failed_steps_reported(self):
+        async def journey(session, stats, n):
+            await stats.timed('echo', session.get('/echo'))
+            await stats.timed('broken', session.get('/broken'))
+
+        server, url = await self.start_server()
+        async with server:
+            report = await run_journeys(url, journey, users=2, duration=0.2)
+        self.assertEqual(report['journeys'], 0)
+        self.assertGreater(report['failed_journeys'], 0)
+        self.assertEqual(report['steps']['echo']['requests'], report['failed_journeys'])
+        self.assertEqual(report['steps']['broken']['errors'], report['failed_journeys'])
+        self.assertEqual(report['top_failures'], [('broken: HTTP 500', report['failed_journeys'])])
+
+
+# -------------------- ARCHIVING --------------------
+
+class ArchiveTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ticket = make_event(self.organizer, start_in=-timedelta(days=60), quantity=20).tickets.get()
+
+    def book(self, name, **kwargs):
+        return make_booking(User.objects.create_user(name), self.ticket, **kwargs)
+
+    def test_only_settled_bookings_are_archived(self):
+        paid = self.book('paid', payment_status='paid', payment='successful')
+        self.book('pending', payment_status='pending', payment='pending')
+        self.book('charging', payment_status='paid', payment='pending')
+        unrefunded = self.book('unrefunded', payment_status='paid', payment='successful')
+        Booking.objects.filter(pk=unrefunded.pk).update(status='cancelled')
+
+        self.assertEqual(archive_ended_bookings(), 1)
+        self.assertEqual(list(ArchivedBooking.objects.values_list('pk', flat=True)), [paid.pk])
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_archives_in_chunks(self):
+        for n in range(5):
+            self.book(f"user{n}", payment_status='paid', payment='successful')
+        self.assertEqual(archive_ended_bookings(batch_size=2, max_batches=2), 4)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(archive_ended_bookings(batch_size=2), 1)
+        self.assertEqual(ArchivedBooking.objects.count(), 5)
+
+
+# -------------------- CHECK-IN --------------------
+
+class CheckInTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.organizer)
+        self.ticket = self.event.tickets.get()
+        self.booking = make_booking(self.attendee, self.ticket, quantity=2, payment_status='paid', payment='successful')
+        self.token = sign_ticket(self.booking)
+        self.door = APIClient()
+        self.door.force_authenticate(self.organizer)
+
+    def scan(self, token=None, event=None, client=None):
+        return (client or self.door).post('/api/api/checkin/', {
+            'token': token or self.token, 'event': event or self.event.pk,
+        }, format='json')
+
+    def test_admits_once(self):
+        response = self.scan()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantity'], 2)
+        # The database, not the cache, turns the second scan away
+        caches['default'].clear()
+        response = self.scan()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'already_checked_in')
+        self.assertEqual(CheckIn.objects.filter(booking=self.booking).count(), 1)
+
+    def test_event_is_required(self):
+        response = self.door.post('/api/api/checkin/', {'token': self.token}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_the_events_organizer(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other', user_type='organizer'))
+        self.assertEqual(self.scan(client=other).status_code, 403)
+        attendee = APIClient()
+        attendee.force_authenticate(self.attendee)
+        self.assertEqual(self.scan(client=attendee).status_code, 403)
+        self.assertFalse(CheckIn.objects.exists())
+
+    def test_wrong_event(self):
+        other = make_event(self.organizer, 'Other')
+        response = self.scan(event=other.pk)
+        self.assertEqual(response.json()['status'], 'wrong_event')
+
+    def test_unpaid_and_cancelled(self):
+        self.booking.payment_status = 'pending'
+        self.booking.save(update_fields=['payment_status'])
+        self.assertEqual(self.scan().status_code, 410)
+        self.booking.payment_status = 'paid'
+        self.booking.status = 'cancelled'
+        self.booking.save(update_fields=['payment_status', 'status'])
+        self.assertEqual(self.scan().status_code, 410)
+        self.assertFalse(CheckIn.objects.exists())
+
+    def test_tampered_token(self):
+        self.assertEqual(self.scan(token=self.token[:-2] + 'AA').status_code, 400)
+
+    def test_token_only_for_paid_bookings(self):
+        client = APIClient()
+        client.force_authenticate(self.attendee)
+        self.assertTrue(client.get(f'/api/api/bookings/{self.booking.pk}/').json()['ticket_token'])
+        self.booking.payment_status = 'pending'
+        self.booking.save(update_fields=['payment_status'])
+        self.assertIsNone(client.get(f'/api/api/bookings/{self.booking.pk}/').json()['ticket_token'])
+
+    def test_sync(self):
+        self.scan()
+        second = make_booking(User.objects.create_user('second'), self.ticket, payment_status='paid', payment='successful')
+        response = self.door.post('/api/api/checkin/sync/', {'event': self.event.pk, 'scans': [
+            {'token': sign_ticket(second)},
+            {'token': sign_ticket(second)},
+            {'token': self.token},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['admitted'], 1)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['admitted', 'already_checked_in', 'already_checked_in'],
+        )
+        self.assertEqual(CheckIn.objects.count(), 2)
+
+
+# -------------------- PAYMENT WEBHOOK --------------------
+
+class PaymentWebhookTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ticket = make_event(self.organizer, quantity=5).tickets.get()
+        self.booking = make_booking(self.attendee, self.ticket, quantity=2)
+        self.payment = self.booking.payment
+
+    def notify(self, status, reference=None, signature=None, provider='simulated'):
+        body = json.dumps({'transaction_id': reference or self.payment.transaction_id, 'status': status}).encode()
+        return self.client.post(
+            f'/api/api/payments/webhook/{provider}/', body, content_type='application/json',
+            HTTP_X_SIMULATOR_SIGNATURE=signature or sign_payload(body),
+        )
+
+    def refresh(self):
+        self.payment.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.ticket.refresh_from_db()
+
+    def test_success(self):
+        response = self.notify('succeeded')
+        self.assertEqual(response.json(), {'processed': 1})
+        self.refresh()
+        self.assertEqual((self.payment.status, self.booking.status, self.booking.payment_status),
+                         ('successful', 'active', 'paid'))
+        self.assertEqual(self.ticket.sold_quantity, 2)
+
+    def test_failure_releases_seats(self):
+        self.notify('failed')
+        self.refresh()
+        self.assertEqual((self.payment.status, self.booking.status, self.booking.payment_status),
+                         ('failed', 'cancelled', 'failed'))
+        self.assertEqual(self.ticket.sold_quantity, 0)
+
+    def test_replays_change_nothing(self):
+        self.notify('succeeded')
+        self.notify('failed')
+        self.notify('succeeded')
+        self.refresh()
+        self.assertEqual((self.payment.status, self.booking.status), ('successful', 'active'))
+        self.assertEqual(self.ticket.sold_quantity, 2)
+
+    def test_success_after_cancellation_is_refunded(self):
+        self.client.force_login(self.attendee)
+        self.client.post(reverse('cancel-booking', args=[self.booking.pk]))
+        self.notify('succeeded')
+        self.refresh()
+        self.assertEqual((self.payment.status, self.booking.payment_status), ('refunded', 'refunded'))
+        self.assertEqual(self.ticket.sold_quantity, 0)
+
+    def test_cancelling_paid_booking_refunds_through_provider(self):
+        self.notify('succeeded')
+        self.client.force_login(self.attendee)
+        with mock.patch.object(SimulatedGateway, 'refund') as refund, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cancel-booking', args=[self.booking.pk]))
+        self.refresh()
+        self.assertEqual((self.payment.status, self.booking.payment_status), ('refunded', 'refunded'))
+        refund.assert_called_once()
+        self.assertEqual(refund.call_args.args[0].transaction_id, self.payment.transaction_id)
+
+    def test_api_booking_is_charged(self):
+        client = APIClient()
+        client.force_authenticate(self.organizer)
+        with mock.patch.object(SimulatedGateway, 'start_charge') as start_charge, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/api/bookings/', {'ticket_id': self.ticket.pk, 'quantity': 1, 'method': 'card'},
+                                   format='json')
+        self.assertEqual(response.status_code, 201)
+        payment = Payment.objects.get(booking_id=response.json()['id'])
+        self.assertEqual((payment.status, payment.method, payment.amount), ('pending', 'card', self.ticket.price))
+        start_charge.assert_called_once_with(payment)
+        # Left unconfirmed, the sweeper gives the seat back
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertIn(payment.transaction_id, expire_pending_payments())
+
+    def test_bad_signature(self):
+        self.assertEqual(self.notify('succeeded', signature='0' * 64).status_code, 400)
+        self.refresh()
+        self.assertEqual(self.payment.status, 'pending')
+
+    def test_unknown_provider(self):
+        self.assertEqual(self.notify('succeeded', provider='nope').status_code, 404)
+
+    def test_unknown_transaction(self):
+        self.assertEqual(self.notify('succeeded', reference='missing').json(), {'processed': 1})
+        self.refresh()
+        self.assertEqual(self.payment.status, 'pending')
+
+    def test_stuck_payment_expires(self):
+        Payment.objects.filter(pk=self.payment.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(expire_pending_payments(), [self.payment.transaction_id])
+        self.refresh()
+        self.assertEqual((self.payment.status, self.booking.status), ('failed', 'cancelled'))
+        self.assertEqual(self.ticket.sold_quantity, 0)
+        # The charge went through after all: the money goes back
+        apply_payment_result(self.payment.transaction_id, True)
+        self.refresh()
+        self.assertEqual((self.payment.status, self.booking.payment_status), ('refunded', 'refunded'))
+
+    def test_recent_payment_kept(self):
+        self.assertEqual(expire_pending_payments(), [])
+        self.refresh()
+        self.assertEqual(self.payment.status, 'pending')
+
+
+# -------------------- RECONCILIATION --------------------
+
+class ReconciliationTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ticket = make_event(self.organizer, quantity=20, price=100).tickets.get()
+        self.payments = {}
+        for name, payment_status, status in [
+            ('matched', 'paid', 'successful'), ('late', 'pending', 'pending'), ('declined', 'pending', 'pending'),
+            ('reversed', 'paid', 'successful'), ('lagging', 'refunded', 'refunded'),
+            ('wrong_amount', 'paid', 'successful'), ('missing', 'paid', 'successful'), ('stuck', 'pending', 'pending'),
+        ]:
+            booking = make_booking(User.objects.create_user(name), self.ticket, payment_status=payment_status, payment=status)
+            self.payments[name] = booking.payment
+        Payment.objects.filter(pk=self.payments['stuck'].pk).update(created_at=timezone.now() - timedelta(days=2))
+        self.rows = [
+            self.row('matched', 'Settled', '100.00'),
+            self.row('late', 'succeeded'),
+            self.row('declined', 'declined'),
+            {'transaction_id': '', 'status': 'paid'},
+            self.row('reversed', 'reversed'),
+            self.row('lagging', 'successful'),
+            self.row('wrong_amount', 'successful', '90.00'),
+            self.row('matched', 'settled'),
+            {'transaction_id': 'unknown', 'status': 'paid'},
+        ]
+
+    def row(self, name, status, amount=''):
+        return {'transaction_id': self.payments[name].transaction_id, 'status': status, 'amount': amount}
+
+    def reconcile(self, apply=True):
+        report = io.StringIO()
+        reconciler = Reconciler(report=report, batch_size=2, apply=apply)
+        try:
+            reconciler.match_file(self.rows)
+            reconciler.find_unsettled(
+                since=timezone.now() - timedelta(days=1), until=timezone.now() + timedelta(minutes=1), fail_stuck=True,
+            )
+        finally:
+            reconciler.close()
+        report.seek(0)
+        return reconciler.counts, {row['transaction_id']: row for row in csv.DictReader(report)}
+
+    def state(self, name):
+        payment = Payment.objects.select_related('booking').get(pk=self.payments[name].pk)
+        return payment.status, payment.booking.status
+
+    def test_report_and_corrections(self):
+        counts, rows = self.reconcile()
+        self.assertEqual(dict(counts), {
+            'lines': 9, 'matched': 2, 'invalid_line': 1, 'duplicate_line': 1, 'unknown_transaction': 1,
+            'late_settlement': 2, 'status_mismatch': 2, 'amount_mismatch': 1,
+            'missing_from_settlement': 1, 'stuck_pending': 1,
+        })
+        self.assertEqual(self.state('late'), ('successful', 'active'))
+        self.assertEqual(self.state('declined'), ('failed', 'cancelled'))
+        self.assertEqual(self.state('reversed'), ('refunded', 'cancelled'))
+        self.assertEqual(self.state('stuck'), ('failed', 'cancelled'))
+        # A refund the provider hasn't caught up with is only reported
+        self.assertEqual(self.state('lagging'), ('refunded', 'active'))
+        self.assertEqual(rows[self.payments['lagging'].transaction_id]['action'], 'none')
+        self.assertEqual(rows[self.payments['missing'].transaction_id]['kind'], 'missing_from_settlement')
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.sold_quantity, 5)
+
+    def test_dry_run_changes_nothing(self):
+        counts, rows = self.reconcile(apply=False)
+        self.assertEqual(counts['late_settlement'], 2)
+        self.assertEqual({row['action'] for row in rows.values()}, {'none'})
+        self.assertEqual(self.state('late'), ('pending', 'active'))
+        self.assertEqual(self.state('stuck'), ('pending', 'active'))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settlement = os.path.join(directory, 'settlement.csv')
+            with open(settlement, 'w', newline='') as f:
+                writer = csv.DictWriter(f, ['transaction_id', 'status', 'amount'])
+                writer.writeheader()
+                writer.writerows(self.rows)
+            stdout = io.StringIO()
+            call_command('reconcile_payments', settlement, '--dry-run', stdout=stdout)
+            self.assertIn('9 settlement line(s), 2 matched.', stdout.getvalue())
+
+            with open(settlement, 'w') as f:
+                f.write('reference,state\n')
+            with self.assertRaises(CommandError):
+                call_command('reconcile_payments', settlement, stdout=io.StringIO())
+
+
+# -------------------- TOKEN CACHE --------------------
+
+class TokenCacheTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.attendee)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get('/api/api/bookings/').status_code, 200)
+
+    def cached(self):
+        return caches[settings.AUTH_TOKEN_CACHE_ALIAS].get(token_cache_key(self.token.key)) is not None
+
+    def test_unrelated_change_keeps_cache(self):
+        user = User.objects.get(pk=self.attendee.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+        self.assertTrue(self.cached())
+
+    def test_role_change_drops_cache(self):
+        for field, value in (('user_type', 'organizer'), ('is_staff', True)):
+            self.assertEqual(self.client.get('/api/api/bookings/').status_code, 200)
+            self.assertTrue(self.cached())
+            user = User.objects.get(pk=self.attendee.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                setattr(user, field, value)
+                user.save()
+            self.assertFalse(self.cached())
+
+
+# -------------------- EVENT IMAGES --------------------
+
+class EventImageTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            EVENT_IMAGE_STORAGE='events.storage.LocalImageStorage',
+            EVENT_IMAGE_STAGING_ROOT=os.path.join(media_root, 'staging'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for cached in (get_image_storage, get_staging_storage):
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+        self.event = make_event(self.organizer)
+
+    def upload(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 900), 'teal').save(buffer, format='JPEG')
+        return SimpleUploadedFile('poster.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_request_only_stages(self):
+        with mock.patch('events.images.get_image_storage') as image_storage:
+            staged = stage_event_image(self.event, self.upload())
+        image_storage.assert_not_called()
+        self.assertTrue(os.path.exists(os.path.join(settings.EVENT_IMAGE_STAGING_ROOT, staged)))
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.image_status, self.event.image_staged_path), ('pending', staged))
+
+    def test_worker_publishes_variants(self):
+        staged = stage_event_image(self.event, self.upload())
+        self.assertEqual(process_pending_images(), 1)
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.image_status, self.event.image_staged_path), ('ready', ''))
+        self.assertTrue(self.event.image_card_url.startswith('/media/event_images/event_'))
+        self.assertFalse(os.path.exists(os.path.join(settings.EVENT_IMAGE_STAGING_ROOT, staged)))
+
+    def test_stalled_claim_is_taken_over(self):
+        stage_event_image(self.event, self.upload())
+        Event.objects.filter(pk=self.event.pk).update(
+            image_status='processing', image_claimed_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(process_pending_images(), 1)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.image_status, 'ready')
+
+
+# -------------------- REQUEST PROFILING --------------------
+
+class ProfilingTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        make_event(self.organizer)
+        self.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_staff_request_profiled(self):
+        self.client.force_login(self.staff)
+        with override_settings(PROFILE_EXPLAIN_THRESHOLD_MS=0):
+            response = self.client.get(reverse('event-list'), {'_profile': 1})
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.user, profile.view_name, profile.status_code), (self.staff, 'event-list', 200))
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertGreater(profile.query_count, 0)
+        self.assertIn('cumulative', profile.stats)
+        selects = [query for query in profile.queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects and all('explain' in query for query in selects))
+
+    def test_staff_session_on_token_api(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/api/events/', {'_profile': 1})
+        self.assertEqual(RequestProfile.objects.get(pk=response['X-Profile-Id']).user, self.staff)
+
+    def test_header_switch(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('event-list'), headers={'X-Profile': '1'})
+        self.assertIn('X-Profile-Id', response)
+
+    def test_others_not_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('event-list'), {'_profile': 1}))
+        self.client.force_login(self.attendee)
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('event-list'), {'_profile': 1}))
+        self.client.force_login(self.staff)
+        with override_settings(PROFILING_ENABLED=False):
+            self.assertNotIn('X-Profile-Id', self.client.get(reverse('event-list'), {'_profile': 1}))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    async def test_async_request_profiled(self):
+        request = AsyncRequestFactory().get('/api/api/events/', {'_profile': 1})
+        request.user = self.staff
+
+        async def auser():
+            return self.staff
+        request.auser = auser
+        response = await ProfilingMiddleware(async_views.event_list_api)(request)
+        profile = await RequestProfile.objects.aget(pk=response['X-Profile-Id'])
+        self.assertGreater(profile.query_count, 0)
+
+
+# -------------------- STARTUP TIME --------------------
+
+class StartupTests(SimpleTestCase):
+    def test_worker_startup_skips_heavy_imports(self):
+        check = STARTUP_SCRIPT + "\nimport sys\nprint(','.join(m for m in ('reportlab', 'PIL') if m in sys.modules))"
+        result = subprocess.run(
+            [sys.executable, '-c', check], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='event_platform.settings'), check=True,
+        )
+        self.assertEqual(result.stdout.strip(), '')
+
+    def test_profile_startup_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'startup.json')
+            with self.assertRaises(CommandError):
+                call_command('profile_startup', runs=1, budget_ms=0.001, json_path=path, stdout=io.StringIO())
+            with open(path) as f:
+                report = json.load(f)
+        self.assertIn('django', {module['module'] for module in report['modules']})
+        self.assertGreater(report['total_ms'], 0)
+
+
+# -------------------- METRICS --------------------
+
+class MetricsTests(EventsTestCase):
+    def scrape(self, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        return self.client.get('/metrics', **headers)
+
+    def test_closed_without_token(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape('anything').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_token(self):
+        self.assertEqual(self.scrape('wrong').status_code, 403)
+        response = self.scrape('scrape')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'background_queue_depth{queue="waitlist"}', response.content)
+
+    def test_staff(self):
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        self.assertEqual(self.scrape().status_code, 200)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_queue_depths_cached_between_scrapes(self):
+        self.scrape('scrape')
+        with self.assertNumQueries(0):
+            self.scrape('scrape')
+
+
+# -------------------- READ REPLICAS --------------------
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_PIN_SHARED=True)
+class ReplicaRoutingTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+        self.addCleanup(replicas._use_replica.set, False)
+
+    def request(self, method='get', path='/api/api/events/', user=None, **headers):
+        request = getattr(self.factory, method)(path, **headers)
+        request.user = user or AnonymousUser()
+        request.resolver_match = resolve(path)
+        return request
+
+    def routed_to_replica(self, request):
+        replicas._use_replica.set(False)
+        self.middleware.process_view(request, None, (), {})
+        return replicas.reading_from_replica()
+
+    def test_catalog_reads_use_replica(self):
+        self.assertTrue(self.routed_to_replica(self.request()))
+        self.assertFalse(self.routed_to_replica(self.request(path='/api/api/bookings/')))
+
+    def test_cookie_pin(self):
+        response = self.middleware(self.request('post', '/api/api/bookings/'))
+        request = self.request()
+        request.COOKIES[replicas.PIN_COOKIE] = response.cookies[replicas.PIN_COOKIE].value
+        self.assertFalse(self.routed_to_replica(request))
+
+    def test_token_client_pinned_without_cookie(self):
+        # The API view resolves the token to request.user before the response
+        self.middleware(self.request('post', '/api/api/bookings/', user=self.attendee, HTTP_AUTHORIZATION='Token abc'))
+        self.assertFalse(self.routed_to_replica(self.request(HTTP_AUTHORIZATION='Token abc')))
+        self.assertTrue(self.routed_to_replica(self.request(HTTP_AUTHORIZATION='Token other')))
+
+    def test_session_user_pinned_without_cookie(self):
+        self.middleware(self.request('post', '/api/api/bookings/', user=self.attendee))
+        self.assertFalse(self.routed_to_replica(self.request(user=self.attendee)))
+        self.assertTrue(self.routed_to_replica(self.request(user=self.organizer)))
+
+    def test_pin_expires(self):
+        self.middleware(self.request('post', '/api/api/bookings/', user=self.attendee))
+        caches['default'].clear()
+        self.assertTrue(self.routed_to_replica(self.request(user=self.attendee)))
+
+    @override_settings(REPLICA_PIN_SHARED=False)
+    def test_token_reads_stay_on_primary_without_shared_cache(self):
+        self.assertFalse(self.routed_to_replica(self.request(HTTP_AUTHORIZATION='Token abc')))
+
+    def test_router_falls_back_to_primary(self):
+        router = replicas.ReplicaRouter()
+        replicas._use_replica.set(True)
+        with mock.patch.object(replicas, 'healthy_replicas', return_value=[]):
+            self.assertEqual(router.db_for_read(Event), 'default')
+        with mock.patch.object(replicas, 'healthy_replicas', return_value=['replica1']):
+            self.assertEqual(router.db_for_read(Event), 'replica1')
+            with replicas.primary_reads():
+                self.assertEqual(router.db_for_read(Event), 'default')
+            # A write sends the rest of the request to the primary
+            router.db_for_write(Event)
+            self.assertEqual(router.db_for_read(Event), 'default')
+
+
+# -------------------- ASGI --------------------
+
+class AsyncApiTests(EventsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.organizer, tickets=2)
+        self.factory = AsyncRequestFactory()
+
+    async def test_matches_viewset(self):
+        response = await async_views.event_list_api(self.factory.get('/api/api/events/'))
+        self.assertEqual(response.status_code, 200)
+        expected = await sync_to_async(self.client.get)('/api/api/events/')
+        self.assertEqual(json.loads(response.content), expected.json())
+
+        response = await async_views.ticket_list_api(self.factory.get('/api/api/tickets/'))
+        self.assertEqual([ticket['event'] for ticket in json.loads(response.content)], [self.event.pk] * 2)
+
+    async def test_authentication_still_applies(self):
+        response = await async_views.event_list_api(
+            self.factory.get('/api/api/events/', headers={'Authorization': 'Token nope'})
+        )
+        self.assertEqual(response.status_code, 401)
+
+    async def test_writes_go_to_viewset(self):
+        response = await async_views.event_list_api(self.factory.post('/api/api/events/', {}))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_query_stats_see_async_queries(self):
+        # The ORM runs these on a sync_to_async thread with its own connection
+        request = self.factory.get('/api/api/events/')
+        await QueryStatsMiddleware(async_views.event_list_api)(request)
+        self.assertGreater(request.query_stats.count, 0)
+
+    def test_query_budget_found(self):
+        match = mock.Mock(url_name='event-list', func=async_views.event_list_api)
+        self.assertEqual(QueryStatsMiddleware.get_budget(match), EventViewSet.query_budget)
+
+    @override_settings(DEBUG=True)
+    def test_middleware_stack_runs_async(self):
+        # Under DEBUG, Django logs each middleware it has to adapt to the other mode
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            handler = ASGIHandler()
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
@@ -0,0 +1,69 @@
+# Compact HMAC-signed ticket tokens for the QR code on each receipt.
+# The token carries everything the door needs (booking, event, head count), so
+# a scanner can verify it with the signing key alone: no database read.
+# Layout: base64url(version | booking id | event id | quantity | mac[:12]).
+import base64
+import hashlib
+import hmac
+import struct
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+VERSION = 1
+PAYLOAD = struct.Struct('>BQIH')
+MAC_BYTES = 12
+
+TicketClaim = namedtuple('TicketClaim', ['booking_id', 'event_id', 'quantity'])
+
+
+class InvalidTicket(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def signing_key():
+    secret = settings.TICKET_SIGNING_KEY or settings.SECRET_KEY
+    return hashlib.sha256(b"events.ticket_tokens:" + secret.encode()).digest()
+
+
+def _mac(payload):
+    return hmac.new(signing_key(), payload, hashlib.sha256).digest()[:MAC_BYTES]
+
+
+def sign_ticket(booking):
+    payload = PAYLOAD.pack(VERSION, booking.pk, booking.event_id, booking.quantity)
+    return base64.urlsafe_b64encode(payload + _mac(payload)).decode().rstrip('=')
+
+
+def verify_ticket(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise InvalidTicket("Malformed ticket.")
+    if len(raw) != PAYLOAD.size + MAC_BYTES:
+        raise InvalidTicket("Malformed ticket.")
+
+    payload, mac = raw[:PAYLOAD.size], raw[PAYLOAD.size:]
+    if not hmac.compare_digest(mac, _mac(payload)):
+        raise InvalidTicket("Invalid signature.")
+    version, booking_id, event_id, quantity = PAYLOAD.unpack(payload)
+    if version != VERSION:
+        raise InvalidTicket("Unsupported ticket version.")
+    return TicketClaim(booking_id, event_id, quantity)
+
+
+# Cancelled bookings keep a valid signature, so the door also checks this
+# cache-held list (shared across workers when the cache is)
+def revocation_key(booking_id):
+    return f"ticket-revoked:{booking_id}"
+
+
+def revoke_ticket(booking_id):
+    caches[settings.CHECKIN_CACHE_ALIAS].set(revocation_key(booking_id), True, timeout=settings.TICKET_REVOCATION_TTL)
+
+
+def is_revoked(booking_id):
+    return bool(caches[settings.CHECKIN_CACHE_ALIAS].get(revocation_key(booking_id)))
@@ -1,10 +1,17 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    RegisterView, CustomAuthToken, UserProfileView,
-    EventViewSet, VenueViewSet, TicketViewSet, BookingViewSet
+    RegisterView, CustomAuthToken, RotateTokenView, LogoutAPIView, UserProfileView,
+    EventViewSet, VenueViewSet, TicketViewSet, BookingViewSet,
+    CartCheckoutView, AvailabilityView, BookingHistoryView,
+    CheckInView, CheckInSyncView
 )
 from . import views as template_views
+from . import async_views
+
+# Catalog pages are served by the async views under ASGI (ASYNC_CATALOG_VIEWS)
+catalog_views = async_views if settings.ASYNC_CATALOG_VIEWS else template_views
 
 # DRF router for API viewsets
 router = DefaultRouter()
@@ -17,16 +24,31 @@ router.register(r'bookings', BookingViewSet, basename='booking')
 api_urlpatterns = [
     path('register/', RegisterView.as_view(), name='api-register'),
     path('login/', CustomAuthToken.as_view(), name='api-login'),
+    path('logout/', LogoutAPIView.as_view(), name='api-logout'),
+    path('token/rotate/', RotateTokenView.as_view(), name='api-token-rotate'),
     path('profile/', UserProfileView.as_view(), name='api-profile'),
+    path('profile/bookings/', BookingHistoryView.as_view(), name='api-booking-history'),
+    path('cart/checkout/', CartCheckoutView.as_view(), name='api-cart-checkout'),
+    path('availability/', AvailabilityView.as_view(), name='api-availability'),
+    path('checkin/', CheckInView.as_view(), name='api-checkin'),
+    path('checkin/sync/', CheckInSyncView.as_view(), name='api-checkin-sync'),
+    path('payments/webhook/<str:provider>/', template_views.payment_webhook_view, name='api-payment-webhook'),
     path('', include(router.urls)),
 ]
 
+# GET on the event and ticket lists runs on the async ORM under ASGI
+if settings.ASYNC_CATALOG_VIEWS:
+    api_urlpatterns = [
+        path('events/', async_views.event_list_api, name='event-list'),
+        path('tickets/', async_views.ticket_list_api, name='ticket-list'),
+    ] + api_urlpatterns
+
 # Template-based (HTML) routes
 template_urlpatterns = [
     # Public
     path('',template_views.homepage_view, name='Home'), 
-    path('events/events', template_views.event_list_view, name='event-list'),
-    path('events/<int:pk>/', template_views.event_detail_view, name='event-detail'),
+    path('events/events', catalog_views.event_list_view, name='event-list'),
+    path('events/<int:pk>/', catalog_views.event_detail_view, name='event-detail'),
 
     # Auth
     path('login/', template_views.login_view, name='login'),
@@ -35,9 +57,15 @@ template_urlpatterns = [
     path('profile/', template_views.profile_view, name='profile'),
 
     # Booking
+    path('events/<int:event_id>/availability/stream/', catalog_views.event_availability_stream, name='event-availability-stream'),
     path('events/<int:event_id>/book/', template_views.book_event_view, name='book-event'),
+    path('events/<int:event_id>/cart/', template_views.cart_checkout_view, name='cart-checkout'),
+    path('orders/<uuid:order_ref>/', template_views.order_receipt_view, name='order-receipt'),
     path('bookings/<int:pk>/cancel/', template_views.cancel_booking_view, name='cancel-booking'),
-    path('events/<int:event_id>/', template_views.event_detail_view, name='event-detail'),
+    path('bookings/<int:pk>/pay/', template_views.pay_booking_view, name='pay-booking'),
+    path('tickets/<int:ticket_id>/waitlist/', template_views.join_waitlist_view, name='join-waitlist'),
+    path('waitlist/<int:pk>/leave/', template_views.leave_waitlist_view, name='leave-waitlist'),
+    path('events/<int:event_id>/', catalog_views.event_detail_view, name='event-detail'),
     path('receipt/<int:booking_id>/', template_views.receipt_view, name='receipt'),
     path('tickets/<int:pk>/', template_views.ticket_detail_view, name='ticket-detail'),
     path('receipt/<int:booking_id>/download/', template_views.download_receipt_view, name='download-receipt'),
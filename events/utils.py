@@ -1,26 +1,80 @@
-from reportlab.pdfgen import canvas
-import os
-from django.conf import settings
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .metrics import RECEIPT_TIME
+from .ticket_tokens import sign_ticket
+
+
+# ReportLab takes ~100ms to import and only receipts need it, so it is
+# imported on first use rather than when the views load
+
+# Signed ticket QR code, `size` points square, bottom-left corner at (x, y)
+def draw_ticket_qr(c, booking, x, y, size=150):
+    from reportlab.graphics import renderPDF
+    from reportlab.graphics.barcode.qr import QrCodeWidget
+    from reportlab.graphics.shapes import Drawing
+
+    widget = QrCodeWidget(sign_ticket(booking))
+    left, bottom, right, top = widget.getBounds()
+    drawing = Drawing(size, size, transform=[size / (right - left), 0, 0, size / (top - bottom), 0, 0])
+    drawing.add(widget)
+    renderPDF.draw(drawing, c, x, y)
+
+
+# Draw the PDF receipt in memory and attach it to booking.receipt_file
+@RECEIPT_TIME.labels('booking').time()
+def generate_receipt_pdf(booking, payment=None):
+    from reportlab.pdfgen import canvas
+
+    payment = payment or getattr(booking, 'payment', None)
+    ticket = booking.ticket
+    buffer = io.BytesIO()
+
+    c = canvas.Canvas(buffer)
+    c.drawString(100, 800, f"Receipt for Booking #{booking.id}")
+    c.drawString(100, 780, f"Event: {ticket.event.title}")
+    c.drawString(100, 760, f"User: {booking.user.username}")
+    c.drawString(100, 740, f"Ticket Type: {ticket.type}")
+    c.drawString(100, 720, f"Quantity: {booking.quantity}")
+    if payment:
+        c.drawString(100, 700, f"Total Paid: KES {payment.amount}")
+        c.drawString(100, 680, f"Transaction ID: {payment.transaction_id}")
+    draw_ticket_qr(c, booking, 100, 500)
+    c.drawString(100, 485, "Show this code at the entrance.")
+    c.showPage()
+    c.save()
 
-def generate_receipt_pdf(booking):
     filename = f"receipt_{booking.id}.pdf"
-    receipt_dir = os.path.join(settings.MEDIA_ROOT, 'receipts')
-    os.makedirs(receipt_dir, exist_ok=True)
-
-    receipt_path = os.path.join(receipt_dir, filename)
-
-    c = canvas.Canvas(receipt_path)
-    c.setFont("Helvetica", 14)
-    c.drawString(100, 800, "Event Booking Receipt")
-    c.setFont("Helvetica", 12)
-    c.drawString(100, 770, f"Booking ID: {booking.id}")
-    c.drawString(100, 750, f"User: {booking.user.username}")
-    c.drawString(100, 730, f"Event: {booking.ticket.event.title}")
-    c.drawString(100, 710, f"Venue: {booking.ticket.event.venue.name}")
-    c.drawString(100, 690, f"Date: {booking.ticket.event.date}")
-    c.drawString(100, 670, f"Quantity: {booking.quantity}")
-    c.drawString(100, 650, f"Payment Status: {booking.payment_status}")
+    booking.receipt_file.save(filename, ContentFile(buffer.getvalue()), save=True)
+    return booking.receipt_file.name
+
+
+# One PDF covering every booking of a cart order
+@RECEIPT_TIME.labels('order').time()
+def generate_order_receipt_pdf(order_ref, user, bookings, payments):
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    c.drawString(100, 800, f"Receipt for Order {order_ref}")
+    c.drawString(100, 780, f"User: {user.username}")
+
+    y = 750
+    total = 0
+    for booking, payment in zip(bookings, payments):
+        ticket = booking.ticket
+        if y < 180:
+            c.showPage()
+            y = 800
+        c.drawString(100, y, f"Booking #{booking.id} - {ticket.event.title}")
+        c.drawString(120, y - 15, f"{ticket.type} x {booking.quantity}: KES {payment.amount} ({payment.transaction_id})")
+        draw_ticket_qr(c, booking, 120, y - 125, size=100)
+        total += payment.amount
+        y -= 145
+    c.drawString(100, y, f"Total Paid: KES {total}")
     c.showPage()
     c.save()
 
-    return f"receipts/{filename}" 
+    return default_storage.save(f"receipts/receipt_order_{order_ref}.pdf", ContentFile(buffer.getvalue()))
@@ -1,22 +1,41 @@
 # views.py
 import os
+import json
 import uuid
-from django.core.files import File
 from django.conf import settings
-from reportlab.pdfgen import canvas
-from .utils import generate_receipt_pdf
-from django.http import FileResponse, Http404
+from .payments import InvalidWebhook, handle_webhook, start_payments
+from .images import stage_event_image
+from .inventory import (
+    AlreadyBooked, InsufficientInventory, ensure_not_booked, reserve, cancel_booking, with_availability,
+    availability_channel, availability_snapshot, availability_lookup,
+)
+from .pubsub import live_availability_streams
+from .checkout import CheckoutError, checkout_cart
+from .idempotency import IdempotentCreateMixin, completed, idempotent_form
+from .authentication import get_or_rotate_token, revoke_user_tokens, rotate_token, token_expires_at
+from .ratelimit import AuthRateThrottle, BookingRateThrottle, rate_limited
+from .history import SECTIONS, InvalidCursor, booking_page
+from . import checkin
+from .querystats import query_budget
+from .purge import soft_delete_event
+from .archive import find_order_bookings, find_user_booking
+from .metrics import record_bookings, record_cache, record_payments
+from .fragments import CATALOG, cached_fragment, event_cards, get_event, get_versions
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from django.db.models import Sum, F, Value as V
 from django.db.models.functions import Coalesce
 # Django & Core Imports
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.db import IntegrityError, transaction
 from django.db.models import Sum
 # Custom User
 from django.contrib.auth import get_user_model
@@ -26,11 +45,15 @@ User = get_user_model()
 from .forms import CustomUserCreationForm, RegistrationForm,EventForm, TicketForm
 
 # Models
-from .models import Category, Venue, Event, Ticket, Booking, Payment
+from .models import Category, Venue, Event, Ticket, Booking, Payment, WaitlistEntry
 
 # REST Framework
 from rest_framework import viewsets, generics, permissions
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+import hashlib
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
@@ -43,11 +66,13 @@ from .serializers import (
     RegisterSerializer, UserSerializer,
     CategorySerializer, VenueSerializer,
     EventCreateSerializer, EventDetailSerializer,
-    TicketSerializer, BookingSerializer, PaymentSerializer
+    TicketSerializer, BookingSerializer, PaymentSerializer,
+    CartCheckoutSerializer, BookingHistorySerializer,
+    CheckInSerializer, CheckInSyncSerializer
 )
 
 # Custom Permissions
-from .permissions import IsOrganizer
+from .permissions import IsOrganizer, IsDoorStaff
 from django.contrib.auth import logout
 
 # -------------------- API VIEWS --------------------
@@ -56,15 +81,34 @@ class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
 
 
 class CustomAuthToken(ObtainAuthToken):
+    throttle_classes = [AuthRateThrottle]
+
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        token, _ = Token.objects.get_or_create(user=user)
-        return Response({'token': token.key})
+        token = get_or_rotate_token(user)
+        return Response({'token': token.key, 'expires_at': token_expires_at(token)})
+
+
+class RotateTokenView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        token = rotate_token(request.user)
+        return Response({'token': token.key, 'expires_at': token_expires_at(token)})
+
+
+class LogoutAPIView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        revoke_user_tokens(request.user)
+        return Response(status=204)
 
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
@@ -78,9 +122,11 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         user = self.get_object()
         user_data = self.get_serializer(user).data
 
-        # Load user bookings with related ticket and event info
-        bookings = Booking.objects.filter(user=user).select_related('ticket__event')
-        booking_data = BookingSerializer(bookings, many=True).data
+        # First page of each history section; follow `next` for more
+        booking_data = {}
+        for section in SECTIONS:
+            bookings, next_cursor = booking_page(user, section)
+            booking_data[section] = history_payload(request, section, bookings, next_cursor)
 
         return Response({
             'user': user_data,
@@ -88,6 +134,29 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         })
 
 
+def history_payload(request, section, bookings, next_cursor):
+    next_url = None
+    if next_cursor:
+        next_url = request.build_absolute_uri(
+            reverse('api-booking-history') + f"?section={section}&cursor={next_cursor}"
+        )
+    return {'results': BookingHistorySerializer(bookings, many=True).data, 'next': next_url}
+
+
+class BookingHistoryView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        section = request.query_params.get('section', 'upcoming')
+        if section not in SECTIONS:
+            return Response({'detail': "section must be 'upcoming' or 'past'."}, status=400)
+        try:
+            bookings, next_cursor = booking_page(request.user, section, request.query_params.get('cursor'))
+        except InvalidCursor as exc:
+            return Response({'detail': str(exc)}, status=400)
+        return Response(history_payload(request, section, bookings, next_cursor))
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -103,6 +172,15 @@ class VenueViewSet(viewsets.ModelViewSet):
 class EventViewSet(viewsets.ModelViewSet):
     queryset = Event.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    query_budget = {'queries': 8}
+
+    def get_queryset(self):
+        if self.request.method not in SAFE_METHODS:
+            return self.queryset
+        # Everything EventDetailSerializer touches, in three queries
+        return self.queryset.select_related('organizer', 'category', 'venue').prefetch_related(
+            Prefetch('tickets', queryset=with_availability(Ticket.objects.all()))
+        )
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -110,7 +188,19 @@ class EventViewSet(viewsets.ModelViewSet):
         return EventDetailSerializer
 
     def perform_create(self, serializer):
-        serializer.save(organizer=self.request.user)
+        image = serializer.validated_data.pop('image', None)
+        event = serializer.save(organizer=self.request.user)
+        if image:
+            stage_event_image(event, image)
+
+    def perform_update(self, serializer):
+        image = serializer.validated_data.pop('image', None)
+        event = serializer.save()
+        if image:
+            stage_event_image(event, image)
+
+    def perform_destroy(self, instance):
+        soft_delete_event(instance)
 
 
 class EventCreateView(generics.CreateAPIView):
@@ -118,16 +208,107 @@ class EventCreateView(generics.CreateAPIView):
     serializer_class = EventCreateSerializer
     permission_classes = [IsAuthenticated, IsOrganizer]
 
+    def perform_create(self, serializer):
+        image = serializer.validated_data.pop('image', None)
+        event = serializer.save(organizer=self.request.user)
+        if image:
+            stage_event_image(event, image)
+
 
 class TicketViewSet(viewsets.ModelViewSet):
-    queryset = Ticket.objects.all()
+    queryset = Ticket.objects.filter(event__deleted_at__isnull=True)
     serializer_class = TicketSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    query_budget = {'queries': 6}
+
+    def get_queryset(self):
+        if self.request.method not in SAFE_METHODS:
+            return self.queryset
+        return with_availability(self.queryset.select_related('event'))
 
 
-class BookingViewSet(viewsets.ModelViewSet):
+class AvailabilityView(APIView):
+    # Public and anonymous so responses can be cached by browsers and CDNs
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    @staticmethod
+    def parse_ids(value):
+        if not value:
+            return []
+        return sorted({int(part) for part in value.split(',') if part.strip()})
+
+    def get(self, request, *args, **kwargs):
+        try:
+            ticket_ids = self.parse_ids(request.query_params.get('tickets'))
+            event_ids = self.parse_ids(request.query_params.get('events'))
+        except ValueError:
+            return Response({'detail': "tickets and events must be comma-separated ids."}, status=400)
+        if not ticket_ids and not event_ids:
+            return Response({'detail': "Pass ?tickets=1,2,3 and/or ?events=4,5."}, status=400)
+        if len(ticket_ids) + len(event_ids) > settings.AVAILABILITY_MAX_IDS:
+            return Response({'detail': f"At most {settings.AVAILABILITY_MAX_IDS} ids per request."}, status=400)
+
+        # Identical polls within the TTL share one DB query
+        digest = hashlib.sha1(f"{ticket_ids}|{event_ids}".encode()).hexdigest()
+        cache_key = f"availability:{digest}"
+        data = cache.get(cache_key)
+        record_cache('availability', data is not None)
+        if data is None:
+            data = availability_lookup(ticket_ids, event_ids)
+            cache.set(cache_key, data, timeout=settings.AVAILABILITY_CACHE_SECONDS)
+
+        response = Response(data)
+        patch_cache_control(response, public=True, max_age=settings.AVAILABILITY_CACHE_SECONDS)
+        return response
+
+
+# Door scanners: the event is required and must be one the scanner runs
+CHECKIN_STATUS_CODES = {
+    checkin.ADMITTED: 200,
+    checkin.ALREADY_CHECKED_IN: 409,
+    checkin.WRONG_EVENT: 409,
+    checkin.REVOKED: 410,
+    checkin.INVALID: 400,
+}
+
+
+class CheckInView(generics.GenericAPIView):
+    serializer_class = CheckInSerializer
+    permission_classes = [IsDoorStaff]
+
+    def scanned_event(self, event_id):
+        event = get_object_or_404(Event.objects.only('id', 'organizer_id'), pk=event_id)
+        self.check_object_permissions(self.request, event)
+        return event
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        event = self.scanned_event(data['event'])
+        result = checkin.check_in(data['token'], event_id=event.pk, device=data['device'])
+        return Response(result, status=CHECKIN_STATUS_CODES[result['status']])
+
+
+class CheckInSyncView(CheckInView):
+    serializer_class = CheckInSyncSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        event = self.scanned_event(data['event'])
+        results = checkin.sync_scans(data['scans'], event_id=event.pk, device=data['device'])
+        admitted = sum(1 for result in results if result['status'] == checkin.ADMITTED)
+        return Response({'admitted': admitted, 'results': results})
+
+
+class BookingViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [BookingRateThrottle]
+    idempotency_scope = 'api-bookings'
 
     def get_queryset(self):
         return Booking.objects.filter(user=self.request.user)
@@ -135,10 +316,41 @@ class BookingViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        # Bookings are soft-cancelled so history and payments are kept
+        cancel_booking(instance)
+
+
+class CartCheckoutView(IdempotentCreateMixin, generics.GenericAPIView):
+    serializer_class = CartCheckoutSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [BookingRateThrottle]
+    idempotency_scope = 'api-cart'
+
+    def post(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = [(line['ticket_id'], line['quantity']) for line in serializer.validated_data['lines']]
+
+        try:
+            order_ref, bookings = checkout_cart(request.user, lines, serializer.validated_data['method'])
+        except CheckoutError as exc:
+            return Response({'errors': exc.errors}, status=400)
+
+        return Response({
+            'order_ref': str(order_ref),
+            'total': sum(booking.ticket.price * booking.quantity for booking in bookings),
+            'bookings': BookingSerializer(bookings, many=True).data,
+        }, status=201)
+
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
+    idempotency_scope = 'api-payments'
 
     def get_queryset(self):
         return Payment.objects.filter(booking__user=self.request.user)
@@ -166,13 +378,14 @@ from django.db.models import Q, Sum
 from .models import Event, Ticket, Booking
 
 
+@query_budget(max_queries=8)
 def event_list_view(request):
     search = request.GET.get('q', '')
     filter_type = request.GET.get('status')  # No default to allow "All"
     now = timezone.now()
 
     # Base queryset
-    events = Event.objects.all()
+    events = Event.objects.select_related('venue')
 
     # 🔍 Filter by search query
     if search:
@@ -196,12 +409,16 @@ def event_list_view(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
-    # 🎟️ Add ticket/booking info per event
+    # 🎟️ Add ticket/booking info per event (first ticket of each, in one query)
+    first_tickets = {}
+    for ticket in with_availability(Ticket.objects.filter(event__in=page_obj.object_list)).order_by('event_id', 'id'):
+        first_tickets.setdefault(ticket.event_id, ticket)
+
     event_data = []
     for event in page_obj:
-        ticket = Ticket.objects.filter(event=event).first()
-        total_booked = Booking.objects.filter(ticket=ticket).aggregate(total=Sum('quantity'))['total'] or 0
-        remaining = (ticket.quantity - total_booked) if ticket else 0
+        ticket = first_tickets.get(event.id)
+        total_booked = ticket.tickets_sold if ticket else 0
+        remaining = ticket.remaining_quantity if ticket else 0
         event_data.append({
             'event': event,
             'status': event.get_status(),
@@ -209,6 +426,8 @@ def event_list_view(request):
             'total_booked': total_booked,
             'remaining': remaining
         })
+    # Cached card markup; the counters above stay live
+    event_cards(event_data)
 
     return render(request, 'events/event_list.html', {
         'search': search,
@@ -218,26 +437,18 @@ def event_list_view(request):
     })
 
 
+@query_budget(max_queries=8)
 def event_detail_view(request, pk):
-    event = get_object_or_404(Event, pk=pk)
     search = request.GET.get('search', '')
+    versions = get_versions([f"event:{pk}", CATALOG])
+    event = get_event(pk, versions[f"event:{pk}"])
 
-    ticket = Ticket.objects.filter(event=event).first()
+    # Availability is always read live
+    ticket = with_availability(Ticket.objects.filter(event_id=pk)).order_by('id').first()
     status = event.get_status()
     allow_purchase = status == "Not started"
 
-    if ticket:
-        total_booked = Booking.objects.filter(ticket=ticket).aggregate(total=Sum('quantity'))['total'] or 0
-        remaining = ticket.quantity - total_booked
-    else:
-        remaining = 0
-
-    # Related Events
-    other_events = Event.objects.exclude(pk=pk)
-    if search:
-        other_events = other_events.filter(
-            Q(title__icontains=search) | Q(description__icontains=search)
-        )
+    remaining = ticket.remaining_quantity if ticket else 0
 
     return render(request, 'events/event_detail.html', {
         'event': event,
@@ -245,10 +456,64 @@ def event_detail_view(request, pk):
         'ticket': ticket,
         'remaining': remaining,
         'allow_purchase': allow_purchase,
-        'other_events': other_events,
+        'event_info': event_info_fragment(event, status, versions[f"event:{pk}"]),
+        'sidebar': event_sidebar_fragment(pk, search, versions[CATALOG]),
         'search': search,
+        'availability_stream': live_availability_streams(),
     })
 
+
+def event_info_fragment(event, status, version):
+    return cached_fragment(
+        'event-info', version, [event.pk, status], 'events/_event_info.html',
+        lambda: {'event': event, 'status': status},
+    )
+
+
+# Related events for the detail page sidebar
+def event_sidebar_fragment(pk, search, catalog_version):
+    def context():
+        other_events = Event.objects.exclude(pk=pk).select_related('venue')
+        if search:
+            other_events = other_events.filter(
+                Q(title__icontains=search) | Q(description__icontains=search)
+            )
+        return {'other_events': other_events[:settings.EVENT_SIDEBAR_SIZE]}
+
+    return cached_fragment(
+        'event-sidebar', catalog_version, [pk, search], 'events/_event_sidebar.html', context,
+    )
+
+# -------------------- LIVE AVAILABILITY (SSE) --------------------
+
+def sse_message(version, payload):
+    return f"id: {version}\nevent: availability\ndata: {json.dumps(payload)}\n\n"
+
+
+def sse_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Where a new stream starts: the current shared version, with counts read
+# from the database like the page that opened it. A snapshot this process
+# happens to hold may be older than that page, so it is never replayed.
+def latest_availability(broker, event_id):
+    latest = broker.latest(availability_channel(event_id))
+    return (latest[0] if latest else 0), availability_snapshot(event_id)
+
+
+# Sync workers don't stream: one open tab would hold a worker for
+# SSE_MAX_STREAM_SECONDS. Pages poll instead (see live_availability_streams);
+# 204 tells a stale EventSource to stop reconnecting. The ASGI version in
+# async_views streams.
+def event_availability_stream(request, event_id):
+    return HttpResponse(status=204)
+
+
+@rate_limited('auth')
 def login_view(request):
     from django.contrib.auth.forms import AuthenticationForm
     form = AuthenticationForm(request, data=request.POST or None)
@@ -259,6 +524,7 @@ def login_view(request):
     return render(request, 'events/login.html', {'form': form})
 
 
+@rate_limited('auth')
 def register_view(request):
     if request.method == 'POST':
         form = RegistrationForm(request.POST)
@@ -274,13 +540,23 @@ def register_view(request):
 
 
 @login_required
+@query_budget(max_queries=10)
 def profile_view(request):
     user = request.user
-    bookings = Booking.objects.filter(user=request.user).select_related('ticket__event', 'user', 'payment')
+    history = {}
+    for section in SECTIONS:
+        try:
+            bookings, next_cursor = booking_page(user, section, request.GET.get(f'{section}_cursor'))
+        except InvalidCursor:
+            bookings, next_cursor = booking_page(user, section)
+        history[section] = {'bookings': bookings, 'next_cursor': next_cursor}
+    waitlist_entries = WaitlistEntry.objects.filter(user=request.user, status='waiting').select_related('ticket__event')
 
     return render(request, 'events/profile.html', {
         'user': user,
-        'bookings': bookings
+        'upcoming': history['upcoming'],
+        'past': history['past'],
+        'waitlist_entries': waitlist_entries,
     })
 
 
@@ -288,8 +564,81 @@ def profile_view(request):
 def cancel_booking_view(request, pk):
     booking = get_object_or_404(Booking, pk=pk, user=request.user)
     if request.method == 'POST':
-        booking.delete()
-        messages.success(request, "Booking canceled successfully.")
+        if booking.status == 'cancelled':
+            messages.info(request, "This booking is already canceled.")
+        else:
+            cancel_booking(booking)
+            messages.success(request, "Booking canceled successfully.")
+    return redirect('profile')
+
+
+@login_required
+@require_POST
+def pay_booking_view(request, pk):
+    # Completes a pending booking (e.g. one promoted from the waitlist)
+    booking = get_object_or_404(
+        Booking.objects.select_related('ticket__event'), pk=pk, user=request.user, status='active'
+    )
+    if booking.payment_status == 'paid':
+        return redirect('receipt', booking_id=booking.id)
+
+    payment, created = Payment.objects.get_or_create(
+        booking=booking,
+        defaults={
+            'amount': booking.ticket.price * booking.quantity,
+            'method': request.POST.get('method', 'mpesa'),
+            'transaction_id': str(uuid.uuid4()),
+        },
+    )
+    if payment.status == 'pending':
+        # Starting again is safe: the provider settles a transaction id once
+        start_payments([payment])
+    if created:
+        record_payments([payment])
+
+    messages.success(request, "Payment started. Your receipt will be ready once it's confirmed.")
+    return redirect('receipt', booking_id=booking.id)
+
+
+@login_required
+@require_POST
+def join_waitlist_view(request, ticket_id):
+    ticket = get_object_or_404(Ticket.objects.filter(event__deleted_at__isnull=True).select_related('event'), pk=ticket_id)
+    event = ticket.event
+
+    if timezone.now() >= event.start_time:
+        messages.error(request, "You cannot join the waitlist for events that have started or ended.")
+        return redirect('event-detail', pk=event.id)
+
+    try:
+        quantity = max(int(request.POST.get('quantity', 1)), 1)
+    except (TypeError, ValueError):
+        quantity = 1
+
+    if ticket.remaining_quantity >= quantity:
+        messages.info(request, "Tickets are available — you can book them right away.")
+        return redirect('book-event', event_id=event.id)
+
+    if Booking.objects.filter(user=request.user, event=event, status='active').exists():
+        messages.warning(request, "You have already booked this event.")
+        return redirect('event-detail', pk=event.id)
+
+    _, created = WaitlistEntry.objects.get_or_create(
+        ticket=ticket, user=request.user, status='waiting',
+        defaults={'quantity': quantity, 'method': request.POST.get('method', 'mpesa')},
+    )
+    if created:
+        messages.success(request, f"You're on the waitlist for {ticket.get_type_display()} tickets.")
+    else:
+        messages.info(request, "You're already on the waitlist for this ticket.")
+    return redirect('event-detail', pk=event.id)
+
+
+@login_required
+@require_POST
+def leave_waitlist_view(request, pk):
+    WaitlistEntry.objects.filter(pk=pk, user=request.user, status='waiting').update(status='cancelled')
+    messages.success(request, "You have left the waitlist.")
     return redirect('profile')
 
 def logout_view(request):
@@ -331,6 +680,8 @@ def create_event_view(request):
             event = form.save(commit=False)
             event.organizer = request.user
             event.save()
+            if form.cleaned_data.get('image'):
+                stage_event_image(event, form.cleaned_data['image'])
             messages.success(request, 'Event created successfully.')
             return redirect('create-ticket', event_id=event.id)
     else:
@@ -343,7 +694,9 @@ def edit_event_view(request, pk):
     event = get_object_or_404(Event, pk=pk, organizer=request.user)
     form = EventForm(request.POST or None, request.FILES or None, instance=event)
     if form.is_valid():
-        form.save()
+        event = form.save()
+        if form.cleaned_data.get('image'):
+            stage_event_image(event, form.cleaned_data['image'])
         messages.success(request, "Event updated.")
         return redirect('organizer-dashboard')
     return render(request, 'events/edit_event.html', {'form': form, 'event': event})
@@ -353,7 +706,8 @@ def edit_event_view(request, pk):
 def delete_event_view(request, pk):
     event = get_object_or_404(Event, pk=pk, organizer=request.user)
     if request.method == 'POST':
-        event.delete()
+        # Hidden right away; `purge_deleted_events` removes its rows and files in chunks
+        soft_delete_event(event)
         messages.success(request, "Event deleted.")
         return redirect('organizer-dashboard')
     return render(request, 'events/delete_event.html', {'event': event})
@@ -397,7 +751,7 @@ def create_ticket_view(request, event_id):
 @login_required
 def view_event_bookings(request, event_id):
     event = get_object_or_404(Event, id=event_id, organizer=request.user)
-    bookings = Booking.objects.filter(ticket__event=event).select_related('user', 'ticket')
+    bookings = Booking.objects.filter(event=event).select_related('user', 'ticket')
     return render(request, 'events/event_bookings.html', {'bookings': bookings, 'event': event})
 
 
@@ -406,9 +760,11 @@ def view_event_bookings(request, event_id):
 
 
 @login_required
+@idempotent_form('book-event')
+@rate_limited('booking')
 def book_event_view(request, event_id):
     event = get_object_or_404(Event, id=event_id)
-    tickets = Ticket.objects.filter(event=event)
+    tickets = Ticket.objects.filter(event=event, event__deleted_at__isnull=True)
 
     if timezone.now() >= event.start_time:
         messages.error(request, "You cannot book tickets for events that have started or ended.")
@@ -419,10 +775,6 @@ def book_event_view(request, event_id):
         return redirect('event-detail', pk=event.id)
 
     if request.method == 'POST':
-        if Booking.objects.filter(user=request.user, ticket__event=event).exists():
-            messages.warning(request, "You have already booked this event.")
-            return redirect('event-detail', pk=event.id)
-
         try:
                 selected_ticket_id = int(request.POST.get('ticket_type'))
         except (TypeError, ValueError):
@@ -432,62 +784,105 @@ def book_event_view(request, event_id):
         quantity = int(request.POST.get('quantity', 1))
         method = request.POST.get('method', 'mpesa')
 
-        ticket = get_object_or_404(Ticket, id=selected_ticket_id, event=event)
-
-        total_booked = Booking.objects.filter(ticket=ticket).aggregate(total=Sum('quantity'))['total'] or 0
-        remaining = ticket.quantity - total_booked
+        ticket = get_object_or_404(tickets, id=selected_ticket_id)
+        total_price = ticket.price * quantity
 
-        if quantity > remaining:
-            messages.error(request, f"Only {remaining} tickets remaining for {ticket.type}.")
+        try:
+            with transaction.atomic():
+                ensure_not_booked(request.user, [event.id])
+                # The counter update is the availability check
+                reserve(ticket, quantity)
+
+                # Create booking
+                booking = Booking.objects.create(
+                    user=request.user,
+                    ticket=ticket,
+                    event=event,
+                    quantity=quantity,
+                )
+
+                # Create payment
+                transaction_id = str(uuid.uuid4())
+                payment = Payment.objects.create(
+                    booking=booking,
+                    amount=total_price,
+                    method=method,
+                    transaction_id=transaction_id,
+                )
+                # Charged after commit; the receipt follows the provider's confirmation
+                start_payments([payment])
+        except InsufficientInventory as exc:
+            messages.error(request, f"Only {exc.remaining} tickets remaining for {ticket.type}.")
             return redirect('book-event', event_id=event.id)
+        except (AlreadyBooked, IntegrityError):
+            # The reservation, if any, was rolled back with the booking
+            messages.warning(request, "You have already booked this event.")
+            return redirect('event-detail', pk=event.id)
 
-        total_price = ticket.price * quantity
+        record_bookings('web', [booking])
+        record_payments([payment])
 
-        # Create booking
-        booking = Booking.objects.create(
-            user=request.user,
-            ticket=ticket,
-            quantity=quantity,
-            payment_status='paid'
-        )
+        messages.success(request, "Booking reserved. We'll confirm it as soon as your payment goes through.")
+        return completed(redirect('receipt', booking_id=booking.id))
 
-        # Create payment
-        transaction_id = str(uuid.uuid4())
-        Payment.objects.create(
-            booking=booking,
-            amount=total_price,
-            method=method,
-            transaction_id=transaction_id,
-            status='successful'
-        )
+    return render(request, 'events/book-event.html', {
+        'event': event,
+        'tickets': tickets,
+        'idempotency_key': uuid.uuid4().hex,
+        'availability_stream': live_availability_streams(),
+    })
 
-        # Generate PDF receipt
-        receipts_dir = os.path.join(settings.MEDIA_ROOT, 'receipts')
-        os.makedirs(receipts_dir, exist_ok=True)
-        receipt_filename = f"receipt_{booking.id}.pdf"
-        receipt_path = os.path.join(receipts_dir, receipt_filename)
-
-        c = canvas.Canvas(receipt_path)
-        c.drawString(100, 800, f"Receipt for Booking #{booking.id}")
-        c.drawString(100, 780, f"Event: {event.title}")
-        c.drawString(100, 760, f"User: {request.user.username}")
-        c.drawString(100, 740, f"Ticket Type: {ticket.type}")
-        c.drawString(100, 720, f"Quantity: {quantity}")
-        c.drawString(100, 700, f"Total Paid: KES {total_price}")
-        c.drawString(100, 680, f"Transaction ID: {transaction_id}")
-        c.save()
-
-        with open(receipt_path, 'rb') as f:
-            booking.receipt_file.save(receipt_filename, File(f), save=True)
-
-        messages.success(request, "Booking and payment successful.")
-        return redirect('receipt', booking_id=booking.id)
+@login_required
+@idempotent_form('cart-checkout')
+@rate_limited('booking')
+def cart_checkout_view(request, event_id):
+    event = get_object_or_404(Event, id=event_id)
+    tickets = Ticket.objects.filter(event=event, event__deleted_at__isnull=True)
 
-    return render(request, 'events/book-event.html', {
+    if timezone.now() >= event.start_time:
+        messages.error(request, "You cannot book tickets for events that have started or ended.")
+        return redirect('event-detail', pk=event.id)
+
+    if request.method == 'POST':
+        try:
+            lines = [
+                (ticket.id, int(request.POST.get(f'quantity_{ticket.id}') or 0))
+                for ticket in tickets
+            ]
+            order_ref, _ = checkout_cart(request.user, lines, request.POST.get('method', 'mpesa'))
+        except ValueError:
+            messages.error(request, "Invalid quantity.")
+        except CheckoutError as exc:
+            for error in exc.errors:
+                messages.error(request, error)
+        else:
+            messages.success(request, "Order reserved. We'll confirm it as soon as your payments go through.")
+            return completed(redirect('order-receipt', order_ref=order_ref))
+
+    return render(request, 'events/cart.html', {
         'event': event,
         'tickets': tickets,
+        'idempotency_key': uuid.uuid4().hex,
+    })
+
+
+@login_required
+def order_receipt_view(request, order_ref):
+    bookings = find_order_bookings(request.user, order_ref)
+    if not bookings:
+        raise Http404("Order not found")
+
+    payments = [booking.payment for booking in bookings if hasattr(booking, 'payment')]
+    return render(request, 'events/order-receipt.html', {
+        'order_ref': order_ref,
+        'bookings': bookings,
+        'total': sum(payment.amount for payment in payments if payment.status != 'failed'),
+        'pending': any(payment.status == 'pending' for payment in payments),
+        # Declined lines are cancelled and left out of the shared receipt
+        'receipt_booking': next((booking for booking in bookings if booking.receipt_file), None),
     })
 
+
 @login_required
 def ticket_detail_view(request, pk):
     ticket = get_object_or_404(Ticket, pk=pk)
@@ -510,7 +905,9 @@ def ticket_detail_view(request, pk):
     })
 @login_required
 def receipt_view(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = find_user_booking(request.user, booking_id)
+    if booking is None:
+        raise Http404("Booking not found")
     payment = getattr(booking, 'payment', None)  # OneToOneField, can be None
 
     return render(request, 'events/receipt.html', {
@@ -522,7 +919,9 @@ def receipt_view(request, booking_id):
 
 @login_required
 def download_receipt_view(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = find_user_booking(request.user, booking_id)
+    if booking is None:
+        raise Http404("Booking not found")
 
     if not booking.receipt_file:
         raise Http404("Receipt not found")
@@ -534,6 +933,20 @@ def download_receipt_view(request, booking_id):
     return FileResponse(open(receipt_path, 'rb'), as_attachment=True, filename=os.path.basename(receipt_path))
 
 
+# Payment provider callbacks. They are authenticated by the provider's
+# signature, not a session, hence no CSRF token; replays are harmless.
+@csrf_exempt
+@require_POST
+def payment_webhook_view(request, provider):
+    if provider not in settings.PAYMENT_PROVIDERS:
+        raise Http404("Unknown payment provider")
+    try:
+        payments = handle_webhook(provider, request.body, request.headers)
+    except InvalidWebhook as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'processed': len(payments)})
+
+
 
 
 
@@ -558,7 +971,7 @@ def organizer_dashboard_view(request):
         }
 
         for ticket in tickets:
-            total_sold = Booking.objects.filter(ticket=ticket).aggregate(total=Coalesce(Sum('quantity'), V(0)))['total']
+            total_sold = ticket.tickets_sold
             revenue = total_sold * ticket.price
             event_data['tickets_info'].append({
                 'type': ticket.type,
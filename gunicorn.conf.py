@@ -0,0 +1,20 @@
+# Read by gunicorn from the working directory. Workers record Prometheus
+# metrics into PROMETHEUS_MULTIPROC_DIR so /metrics can merge them
+# (events/metrics.py); it has to be set before the workers import Django.
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'event_platform_metrics'))
+
+
+def on_starting(server):
+    # Samples from a previous run would be merged into this one
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)